@@ -0,0 +1,15 @@
+-- Index for the H2H lookup in src/predictions/h2h_scoring_system.py
+-- (_H2H_SCORING_SQL): last N finished matches between two teams.
+--
+-- The query is split into two UNION ALL branches (A at home vs B, B at home
+-- vs A), each with its own ORDER BY date DESC LIMIT n, so both branches are
+-- range scans on this same index; no mirrored (away, home) index is needed.
+--
+-- prediction_outcomes(match_id, model) is already covered by its primary key,
+-- which is what the ON CONFLICT in evaluate() uses.
+--
+-- CONCURRENTLY cannot run inside a transaction block: run with plain psql.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_matches_h2h_played
+    ON matches (home_team_id, away_team_id, date DESC)
+    WHERE home_goals IS NOT NULL AND away_goals IS NOT NULL;
@@ -0,0 +1,18 @@
+-- Index for the per-season date-range checks in src/scripts/update_predictions.py
+-- (preflight / _Q_PREFLIGHT), src/scripts/run_update_automated.py
+-- (_Q_PENDING_MATCHES) and the src/predictions/betting_lines.py queries:
+--   WHERE season_id = :sid AND date BETWEEN :dfrom AND :dto
+--
+-- preflight() reads every match in the range (pending and finished) in one
+-- pass, which a partial index cannot serve, so this one is not partial.
+-- Finished-only reads can also use idx_matches_season_date_played
+-- (add_stat_profile_indexes.sql).
+--
+-- prediction_outcomes(match_id, model) is already covered by its primary key.
+--
+-- update_predictions warns at startup when this index is missing.
+--
+-- CONCURRENTLY cannot run inside a transaction block: run with plain psql.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_matches_season_date
+    ON matches (season_id, date);
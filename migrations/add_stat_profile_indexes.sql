@@ -0,0 +1,33 @@
+-- Indexes for the per-league team stat profiles:
+--   load_team_stat_profiles   (src/predictions/upcoming_core.py)
+--   _load_team_stat_profiles  (src/predictions/upcoming_weinston.py)
+--
+-- Both read finished matches of one league (season_id IN the league's
+-- seasons), most recent first, and join match_stats for the raw stats.
+--
+-- 1. Partial index on finished matches only: future fixtures are never read
+--    by these queries, so they are left out of the index.
+-- 2. Covering index on match_stats: the stat columns ride along in the
+--    index leaf (INCLUDE), so the join can be an index-only scan with no
+--    heap fetch per match.
+--
+-- The Weinston league stat means are computed in the same query
+-- (_Q_TEAM_STAT_PROFILES, league_means CTE) from the played rows.
+--
+-- League goal averages no longer scan matches at all: they come from
+-- league_running_stats (create_league_running_stats.sql).
+--
+-- CONCURRENTLY cannot run inside a transaction block: run with plain psql.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_matches_season_date_played
+    ON matches (season_id, date DESC)
+    WHERE home_goals IS NOT NULL AND away_goals IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_match_stats_profile
+    ON match_stats (match_id)
+    INCLUDE (home_shots, away_shots,
+             home_shots_on_target, away_shots_on_target,
+             home_fouls, away_fouls,
+             home_corners, away_corners,
+             home_yellow_cards, away_yellow_cards,
+             home_red_cards, away_red_cards);
@@ -0,0 +1,17 @@
+-- Indexes for the "last N matches per team" lookups in
+-- src/predictions/upcoming_core.py (_LIVE_STRENGTHS_SQL).
+--
+-- Each team's window is fetched with a LATERAL subquery
+-- (WHERE home_team_id = t.id ... ORDER BY date DESC LIMIT n), so every team
+-- is a short backward range scan instead of a ROW_NUMBER() sort over every
+-- finished match of the league. One index per side (home / away).
+--
+-- CONCURRENTLY cannot run inside a transaction block: run with plain psql.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_matches_home_recent
+    ON matches (home_team_id, date DESC)
+    WHERE home_goals IS NOT NULL AND away_goals IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_matches_away_recent
+    ON matches (away_team_id, date DESC)
+    WHERE home_goals IS NOT NULL AND away_goals IS NOT NULL;
@@ -0,0 +1,74 @@
+-- Incrementally maintained goal totals per league, read by
+-- LeagueContext._calculate_league_averages (src/predictions/league_context.py).
+--
+-- mv_league_avgs is only as fresh as its last refresh; this table is kept
+-- exact by a row trigger on matches: a match contributes to its league's
+-- totals while both goal columns are non-NULL, and the trigger moves the
+-- contribution on INSERT / UPDATE (result loaded, corrected, season moved)
+-- / DELETE. Reading the averages is then a single-row primary key lookup.
+--
+-- Unlike the old AVG query (and the lg_*_gf / sample_size columns of
+-- mv_league_avgs), there is intentionally no `m.date < CURRENT_DATE` filter:
+-- a row trigger cannot apply a predicate that changes with the clock. Goals
+-- are only loaded once a match is played, so the one difference is that a
+-- result loaded on the match day counts immediately instead of from the next
+-- day. No code reads those mv_league_avgs columns any more; get_active_leagues
+-- uses total_matches, which is unfiltered as well.
+
+CREATE TABLE IF NOT EXISTS league_running_stats (
+    league_id  INTEGER PRIMARY KEY,
+    sum_home   DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_away   DOUBLE PRECISION NOT NULL DEFAULT 0,
+    n          BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION league_running_stats_apply(
+    p_season_id INTEGER, p_home INTEGER, p_away INTEGER, p_sign INTEGER
+) RETURNS void AS $$
+BEGIN
+    IF p_home IS NULL OR p_away IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO league_running_stats AS lrs (league_id, sum_home, sum_away, n)
+    SELECT s.league_id, p_sign * p_home, p_sign * p_away, p_sign
+    FROM seasons s
+    WHERE s.id = p_season_id AND s.league_id IS NOT NULL
+    ON CONFLICT (league_id) DO UPDATE SET
+        sum_home = lrs.sum_home + EXCLUDED.sum_home,
+        sum_away = lrs.sum_away + EXCLUDED.sum_away,
+        n        = lrs.n + EXCLUDED.n;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION league_running_stats_trg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM league_running_stats_apply(OLD.season_id, OLD.home_goals, OLD.away_goals, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM league_running_stats_apply(NEW.season_id, NEW.home_goals, NEW.away_goals, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_league_running_stats ON matches;
+CREATE TRIGGER trg_league_running_stats
+    AFTER INSERT OR UPDATE OF season_id, home_goals, away_goals OR DELETE ON matches
+    FOR EACH ROW
+    EXECUTE FUNCTION league_running_stats_trg();
+
+-- Backfill (idempotent: recomputes from scratch)
+INSERT INTO league_running_stats (league_id, sum_home, sum_away, n)
+SELECT s.league_id, SUM(m.home_goals), SUM(m.away_goals), COUNT(*)
+FROM matches m
+JOIN seasons s ON s.id = m.season_id
+WHERE m.home_goals IS NOT NULL
+  AND m.away_goals IS NOT NULL
+  AND s.league_id IS NOT NULL
+GROUP BY s.league_id
+ON CONFLICT (league_id) DO UPDATE SET
+    sum_home = EXCLUDED.sum_home,
+    sum_away = EXCLUDED.sum_away,
+    n        = EXCLUDED.n;
@@ -0,0 +1,35 @@
+-- Per-model daily hit counts for metrics_by_model (src/predictions/metrics.py).
+--
+-- The dashboard asks for accuracy per model over a date range many times;
+-- aggregating prediction_outcomes x matches on every request is O(matches).
+-- This view keeps one row per (model, season, day) with counts and sums, so
+-- a request only adds up the days in range.
+--
+-- prediction_outcomes has two writers, and both refresh this view in a
+-- separate transaction once their own writes are committed (a failed refresh
+-- is logged, not raised):
+--   - evaluate() (src/predictions/evaluate.py)
+--   - POST /api/recalculate-outcomes (src/api.py)
+-- It can also be refreshed by hand with
+-- 'python -m src.predictions.cli refresh-views'. The unique index is what
+-- allows REFRESH MATERIALIZED VIEW CONCURRENTLY.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_model_daily_metrics AS
+SELECT
+    po.model,
+    m.season_id,
+    m.date::date AS d,
+    COUNT(*) FILTER (WHERE po.hit_1x2 IS NOT NULL)     AS decided_1x2,
+    COUNT(*) FILTER (WHERE po.hit_1x2 IS TRUE)         AS hits_1x2,
+    COUNT(*) FILTER (WHERE po.hit_over25 IS NOT NULL)  AS decided_over25,
+    COUNT(*) FILTER (WHERE po.hit_over25 IS TRUE)      AS hits_over25,
+    COUNT(*) FILTER (WHERE po.hit_btts IS NOT NULL)    AS decided_btts,
+    COUNT(*) FILTER (WHERE po.hit_btts IS TRUE)        AS hits_btts,
+    SUM(po.rmse_goals)                                 AS rmse_sum,
+    COUNT(po.rmse_goals)                               AS rmse_n
+FROM prediction_outcomes po
+JOIN matches m ON m.id = po.match_id
+GROUP BY po.model, m.season_id, m.date::date;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_model_daily_metrics
+    ON mv_model_daily_metrics (model, season_id, d);
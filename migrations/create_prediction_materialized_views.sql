@@ -0,0 +1,122 @@
+-- Materialized views for the aggregates that every prediction run recomputed
+-- from scratch over the whole matches table:
+--
+--   mv_league_avgs            -> get_active_leagues (src/predictions/league_context.py);
+--                                the per-league averages themselves are read from
+--                                league_running_stats (create_league_running_stats.sql)
+--   mv_team_recent_strengths  -> load_team_strengths (src/predictions/upcoming_core.py)
+--                                for the default window of the last 20 matches
+--
+-- Both views use CURRENT_DATE when they are refreshed, so they must be refreshed
+-- at least nightly and after loading results:
+--
+--   python -m src.predictions.cli refresh-views
+--
+-- In production this is done by .github/workflows/refresh-views.yml (nightly)
+-- and by src/scripts/update_predictions.py / run_update_automated.py, which
+-- refresh both views after a results load and before predicting.
+--
+-- The unique indexes are what allow REFRESH MATERIALIZED VIEW CONCURRENTLY
+-- (readers are not blocked while the refresh runs).
+--
+-- The trigger at the end only sends a NOTIFY on 'matches_changed'; the refresh
+-- itself is done by the listener (refresh-views --listen), never inside the
+-- INSERT/UPDATE transaction.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_league_avgs AS
+SELECT
+    s.league_id,
+    (AVG(m.home_goals) FILTER (WHERE m.date < CURRENT_DATE))::float AS lg_home_gf,
+    (AVG(m.away_goals) FILTER (WHERE m.date < CURRENT_DATE))::float AS lg_away_gf,
+    COUNT(*) FILTER (WHERE m.date < CURRENT_DATE) AS sample_size,
+    COUNT(*) AS total_matches,
+    MAX(s.year_start) AS latest_season
+FROM matches m
+JOIN seasons s ON s.id = m.season_id
+WHERE m.home_goals IS NOT NULL
+  AND m.away_goals IS NOT NULL
+GROUP BY s.league_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_league_avgs_league
+    ON mv_league_avgs (league_id);
+
+
+-- Last 20 home and last 20 away finished matches per (league, team).
+-- Home and away windows are aggregated separately so n_home / n_away are the
+-- real sample sizes.
+--
+-- `played` is read by both branches of `ranked`; AS MATERIALIZED makes
+-- Postgres (12+ inlines CTEs by default) filter matches once instead of
+-- once per branch. On an existing database the view has to be dropped and
+-- re-created for this to apply:
+--   DROP MATERIALIZED VIEW IF EXISTS mv_team_recent_strengths;
+--
+-- last_date is the team's latest match in the view. upcoming_core compares
+-- the league's MAX(last_date) with the latest finished match in `matches`
+-- and computes strengths live when the view is behind (not refreshed since
+-- results were loaded). Views created before last_date existed are dropped
+-- here so the CREATE below adds it.
+DO $$
+BEGIN
+    IF to_regclass('mv_team_recent_strengths') IS NOT NULL
+       AND NOT EXISTS (
+           SELECT 1 FROM pg_attribute
+           WHERE attrelid = to_regclass('mv_team_recent_strengths')
+             AND attname = 'last_date'
+       ) THEN
+        DROP MATERIALIZED VIEW mv_team_recent_strengths;
+    END IF;
+END $$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_team_recent_strengths AS
+WITH played AS MATERIALIZED (
+    SELECT s.league_id, m.date, m.home_team_id, m.away_team_id,
+           m.home_goals, m.away_goals
+    FROM matches m
+    JOIN seasons s ON s.id = m.season_id
+    WHERE m.home_goals IS NOT NULL
+      AND m.away_goals IS NOT NULL
+      AND m.date < CURRENT_DATE
+),
+ranked AS (
+    SELECT league_id, home_team_id AS team_id, TRUE AS is_home, date,
+           home_goals AS gf, away_goals AS ga,
+           ROW_NUMBER() OVER (PARTITION BY league_id, home_team_id ORDER BY date DESC) AS rn
+    FROM played
+    UNION ALL
+    SELECT league_id, away_team_id AS team_id, FALSE AS is_home, date,
+           away_goals AS gf, home_goals AS ga,
+           ROW_NUMBER() OVER (PARTITION BY league_id, away_team_id ORDER BY date DESC) AS rn
+    FROM played
+)
+SELECT
+    league_id,
+    team_id,
+    COUNT(*) FILTER (WHERE is_home)              AS n_home,
+    (AVG(gf) FILTER (WHERE is_home))::float      AS home_gf,
+    (AVG(ga) FILTER (WHERE is_home))::float      AS home_ga,
+    COUNT(*) FILTER (WHERE NOT is_home)          AS n_away,
+    (AVG(gf) FILTER (WHERE NOT is_home))::float  AS away_gf,
+    (AVG(ga) FILTER (WHERE NOT is_home))::float  AS away_ga,
+    MAX(date)                                    AS last_date
+FROM ranked
+WHERE rn <= 20
+GROUP BY league_id, team_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_team_recent_strengths
+    ON mv_team_recent_strengths (league_id, team_id);
+
+
+-- Refresh scheduling: one notification per statement that touches results.
+CREATE OR REPLACE FUNCTION notify_matches_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('matches_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_matches_changed ON matches;
+CREATE TRIGGER trg_matches_changed
+    AFTER INSERT OR UPDATE OF home_goals, away_goals ON matches
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_matches_changed();
@@ -8,6 +8,7 @@ from sqlalchemy import create_engine, text
 from src.config import settings
 from src.predictions.evaluate import evaluate
 from src.predictions.metrics import metrics_by_model
+from src.predictions.materialized_views import try_refresh_view
 from datetime import datetime, date
 import math
 import time
@@ -1729,11 +1730,16 @@ def recalculate_prediction_outcomes(season_id: int = Query(..., description="ID
         
         stats = conn.execute(stats_query, {"season_id": season_id}).mappings().all()
         
-        return {
+        result = {
             "success": True,
             "inserted_count": inserted_count,
             "statistics": [dict(row) for row in stats]
         }
+    
+    # metrics_by_model lee de esta vista; se refresca ya confirmado el recálculo
+    try_refresh_view(engine, "mv_model_daily_metrics")
+    
+    return result
 
 
 
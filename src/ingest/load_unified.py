@@ -15,16 +15,18 @@ CAMBIOS:
 
 Uso:
   python -m src.ingest.load_unified run data/raw/"E0 (61).csv" --league "Premier League" --div E0 --season-id 2024
+
+Desde Python (misma conexión/transacción del llamador):
+  load_csv(conn, path, league="Premier League", div="E0", season_id=2024)
 """
 from __future__ import annotations
+import io
 import pandas as pd
 import typer
-from datetime import datetime
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from src.db import SessionLocal
-from src.models import League, Team, Match, MatchStats
+from src.models import League, Team
 
 app = typer.Typer(help="Cargar un CSV unificado y poblar multiples tablas")
 
@@ -55,6 +57,92 @@ TOTALS_FORMULAS = {
     "total_cardsaway": ("AY", "AR"),
 }
 
+# Columnas de matches que vienen del CSV; (date, home_team_id, away_team_id)
+# identifica el partido
+MATCH_COLS = [
+    "season_id", "date", "home_team_id", "away_team_id",
+    "home_goals", "away_goals", "fulltime_result",
+    "halftime_homegoal", "halftime_awaygoal", "halftime_result", "referee",
+]
+_MATCH_KEY = ("date", "home_team_id", "away_team_id")
+STATS_COLS = [*STATS_MAP.values(), *TOTALS_FORMULAS, "total_cards"]
+
+_COL_SEP = ",\n        "
+
+# Las filas se cargan con COPY en una tabla temporal y desde ahí se aplican a
+# matches / match_stats con una sentencia por paso (en vez de SELECT + flush
+# por fila). rn = orden de la fila en el CSV
+_CREATE_STAGE = f"""
+    CREATE TEMP TABLE IF NOT EXISTS _stage_unified (
+        rn integer,
+        season_id integer,
+        date date,
+        home_team_id integer,
+        away_team_id integer,
+        home_goals integer,
+        away_goals integer,
+        fulltime_result varchar(100),
+        halftime_homegoal integer,
+        halftime_awaygoal integer,
+        halftime_result varchar(100),
+        referee varchar(100),
+        {_COL_SEP.join(f"{c} integer" for c in STATS_COLS)},
+        match_id integer
+    ) ON COMMIT DROP;
+    TRUNCATE _stage_unified
+"""
+
+_COPY_STAGE = f"""
+    COPY _stage_unified (rn, {", ".join(MATCH_COLS)}, {", ".join(STATS_COLS)})
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+_ON_KEY = " AND ".join(f"{{a}}.{c} = {{b}}.{c}" for c in _MATCH_KEY)
+
+# Partidos que ya existen (si hay duplicados en matches, el de menor id)
+_RESOLVE_MATCH_IDS = f"""
+    UPDATE _stage_unified st
+    SET match_id = m.id
+    FROM (
+        SELECT m.date, m.home_team_id, m.away_team_id, MIN(m.id) AS id
+        FROM matches m
+        JOIN _stage_unified s USING ({", ".join(_MATCH_KEY)})
+        GROUP BY m.date, m.home_team_id, m.away_team_id
+    ) m
+    WHERE {_ON_KEY.format(a="m", b="st")}
+"""
+
+# Existentes: solo se pisan los valores que vienen informados en el CSV
+_UPDATE_MATCHES = f"""
+    UPDATE matches m SET
+        {_COL_SEP.join(f"{c} = COALESCE(st.{c}, m.{c})" for c in MATCH_COLS if c not in _MATCH_KEY)}
+    FROM _stage_unified st
+    WHERE m.id = st.match_id
+"""
+
+_INSERT_MATCHES = f"""
+    WITH ins AS (
+        INSERT INTO matches ({", ".join(MATCH_COLS)})
+        SELECT {", ".join(MATCH_COLS)}
+        FROM _stage_unified
+        WHERE match_id IS NULL
+        ORDER BY rn
+        RETURNING id, {", ".join(_MATCH_KEY)}
+    )
+    UPDATE _stage_unified st
+    SET match_id = ins.id
+    FROM ins
+    WHERE {_ON_KEY.format(a="ins", b="st")}
+"""
+
+_UPSERT_MATCH_STATS = f"""
+    INSERT INTO match_stats (match_id, {", ".join(STATS_COLS)})
+    SELECT match_id, {", ".join(STATS_COLS)}
+    FROM _stage_unified
+    ON CONFLICT (match_id) DO UPDATE SET
+        {_COL_SEP.join(f"{c} = COALESCE(EXCLUDED.{c}, match_stats.{c})" for c in STATS_COLS)}
+"""
+
 
 def _get_or_create_league(s: Session, name: str) -> int:
     row = s.execute(select(League).where(League.name == name)).scalar_one_or_none()
@@ -86,131 +174,188 @@ def _to_int(x):
         return None
 
 
-def _upsert_match(s: Session, date: datetime, home_id: int, away_id: int, row: dict, season_id: int | None) -> int:
-    existing = (
-        s.execute(
-            select(Match).where(
-                Match.date == date.date(),
-                Match.home_team_id == home_id,
-                Match.away_team_id == away_id,
-            )
-        ).scalars().first()
-    )
+def _int_col(col: pd.Series) -> pd.Series:
+    # Entero nullable: COPY recibe "3" / vacío (NULL), nunca "3.0"
+    return pd.Series([_to_int(x) for x in col], index=col.index, dtype="Int64")
+
+
+def _str_col(col: pd.Series) -> pd.Series:
+    return col.map(lambda x: str(x).strip() if pd.notna(x) else None)
+
 
+def _referee_col(df: pd.DataFrame) -> pd.Series:
     # ═══════════════════════════════════════════════════════════════════
     # MANEJO DEL CAMPO REFEREE
     # ═══════════════════════════════════════════════════════════════════
     # Premier League: Tiene columna "Referee" con valores
     # La Liga y otras: NO tienen columna "Referee" → usar "Sin arbitro"
-    referee_value = "Sin arbitro"  # Valor por defecto
-    
-    if "Referee" in row and pd.notna(row.get("Referee")):
-        # Si la columna existe y tiene un valor
-        ref_str = str(row.get("Referee")).strip()
-        if ref_str and ref_str.lower() not in ['nan', 'none', '']:
-            referee_value = ref_str
-    
-    payload = {
-        "season_id": season_id,
-        "date": date.date(),
-        "home_team_id": home_id,
-        "away_team_id": away_id,
-        "home_goals": _to_int(row.get("FTHG")),
-        "away_goals": _to_int(row.get("FTAG")),
-        "fulltime_result": (str(row.get("FTR")).strip() if pd.notna(row.get("FTR")) else None),
-        "halftime_homegoal": _to_int(row.get("HTHG")),
-        "halftime_awaygoal": _to_int(row.get("HTAG")),
-        "halftime_result": (str(row.get("HTR")).strip() if pd.notna(row.get("HTR")) else None),
-        "referee": referee_value,  # Siempre tendrá un valor (real o "Sin arbitro")
-    }
-
-    if existing:
-        for k, v in payload.items():
-            if v is not None:
-                setattr(existing, k, v)
-        s.flush()
-        return existing.id
-    else:
-        mt = Match(**payload)
-        s.add(mt)
-        s.flush()
-        return mt.id
-
-
-def _upsert_match_stats(s: Session, match_id: int, row: dict):
-    ms = s.execute(select(MatchStats).where(MatchStats.match_id == match_id)).scalar_one_or_none()
-    payload: dict[str, int | None] = {"match_id": match_id}
+    if "Referee" not in df.columns:
+        return pd.Series("Sin arbitro", index=df.index)
+
+    def _ref(x):
+        if pd.notna(x):
+            ref_str = str(x).strip()
+            if ref_str and ref_str.lower() not in ['nan', 'none', '']:
+                return ref_str
+        return "Sin arbitro"
+
+    return df["Referee"].map(_ref)
+
+
+def _build_stage(df: pd.DataFrame, home_ids: list[int], away_ids: list[int], season_id: int | None) -> pd.DataFrame:
+    """Filas de _stage_unified (orden de columnas de _COPY_STAGE)."""
+    na = pd.Series(pd.NA, index=df.index, dtype="Int64")
+
+    def ints(col: str) -> pd.Series:
+        return _int_col(df[col]) if col in df.columns else na
+
+    def strs(col: str) -> pd.Series:
+        return _str_col(df[col]) if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+    stage = pd.DataFrame({
+        "rn": range(len(df)),
+        "season_id": pd.Series(season_id, index=df.index, dtype="Int64"),
+        "date": df["Date"].dt.date,
+        "home_team_id": home_ids,
+        "away_team_id": away_ids,
+        "home_goals": ints("FTHG"),
+        "away_goals": ints("FTAG"),
+        "fulltime_result": strs("FTR"),
+        "halftime_homegoal": ints("HTHG"),
+        "halftime_awaygoal": ints("HTAG"),
+        "halftime_result": strs("HTR"),
+        "referee": _referee_col(df),
+    }, index=df.index)
 
     for src, dst in STATS_MAP.items():
-        if src in row and pd.notna(row[src]):
-            payload[dst] = _to_int(row[src])
+        stage[dst] = ints(src)
 
+    # Un total solo se informa si viene alguno de sus dos sumandos
     for dst, (a, b) in TOTALS_FORMULAS.items():
-        va = _to_int(row.get(a)) if a in row and pd.notna(row.get(a)) else None
-        vb = _to_int(row.get(b)) if b in row and pd.notna(row.get(b)) else None
-        if va is not None or vb is not None:
-            payload[dst] = (va or 0) + (vb or 0)
+        va, vb = ints(a), ints(b)
+        stage[dst] = (va.fillna(0) + vb.fillna(0)).where(va.notna() | vb.notna())
 
-    if "total_cardshome" in payload or "total_cardsaway" in payload:
-        payload["total_cards"] = (payload.get("total_cardshome") or 0) + (payload.get("total_cardsaway") or 0)
+    home_cards, away_cards = stage["total_cardshome"], stage["total_cardsaway"]
+    stage["total_cards"] = (home_cards.fillna(0) + away_cards.fillna(0)).where(home_cards.notna() | away_cards.notna())
 
-    if ms:
-        for k, v in payload.items():
-            if k != "match_id" and v is not None:
-                setattr(ms, k, v)
-    else:
-        s.add(MatchStats(**payload))
+    return _merge_repeated(stage)
 
 
-@app.command()
-def run(
-    csv: str = typer.Argument(..., help="Ruta al CSV (E0 xx).csv"),
-    league: str = typer.Option("Premier League", help="Nombre de la liga"),
-    div: str = typer.Option("E0", help="Código de la columna Div (p.ej. E0)"),
-    season_id: int | None = typer.Option(None, help="season_id a asignar (opcional)"),
-    dayfirst: bool = typer.Option(True, help="Fechas dd/mm/yyyy"),
-):
+def _merge_repeated(stage: pd.DataFrame) -> pd.DataFrame:
     """
-    Carga un CSV unificado y puebla las tablas de la base de datos.
+    Un mismo partido repetido en el CSV queda en una sola fila: por columna
+    gana el último valor informado (como el upsert fila a fila, que solo
+    pisaba con valores no nulos). rn = posición de la primera aparición.
+    """
+    key = list(_MATCH_KEY)
+    if not stage.duplicated(key).any():
+        return stage
+    agg = {c: "last" for c in stage.columns if c not in key}
+    agg["rn"] = "first"
+    merged = stage.groupby(key, sort=False, as_index=False).agg(agg)
+    return merged[stage.columns].sort_values("rn", ignore_index=True)
+
+
+def load_csv(
+    conn,
+    path: str,
+    league: str = "Premier League",
+    div: str = "E0",
+    season_id: int | None = None,
+    dayfirst: bool = True,
+) -> int:
+    """
+    Carga un CSV unificado en leagues / teams / matches / match_stats.
     
-    Maneja automáticamente:
-    - Ligas CON columna Referee (Premier League): usa el valor
-    - Ligas SIN columna Referee (La Liga, etc.): asigna "Sin arbitro"
+    Args:
+        conn: Conexión SQLAlchemy (dentro de una transacción; no hace commit)
+        path: Ruta al CSV
+        league: Nombre de la liga
+        div: Código de la columna Div (filtra el CSV si existe)
+        season_id: season_id a asignar (opcional)
+        dayfirst: Fechas dd/mm/yyyy
+    
+    Returns:
+        Número de filas cargadas
+    
+    Raises:
+        ValueError: El CSV no tiene columna 'Date'
     """
-    df = pd.read_csv(csv)
+    df = pd.read_csv(path)
 
     if "Div" in df.columns and div:
         df = df[df["Div"] == div].copy()
 
     if "Date" not in df.columns:
-        raise typer.BadParameter("CSV debe incluir columna 'Date'")
+        raise ValueError("CSV debe incluir columna 'Date'")
     df["Date"] = pd.to_datetime(df["Date"], dayfirst=dayfirst, errors="coerce")
 
     # Verificar si el CSV tiene columna Referee
     has_referee = "Referee" in df.columns
     referee_msg = 'Sí' if has_referee else 'No (se usará "Sin arbitro")'
-    typer.echo(f"ℹ️  CSV tiene columna 'Referee': {referee_msg}")
+    print(f"ℹ️  CSV tiene columna 'Referee': {referee_msg}")
+
+    home_names = df["HomeTeam"].astype(str).str.strip()
+    away_names = df["AwayTeam"].astype(str).str.strip()
+    keep = (home_names != "") & (away_names != "") & df["Date"].notna()
+    df, home_names, away_names = df[keep], home_names[keep], away_names[keep]
 
-    with SessionLocal() as s:
+    # Liga y equipos (pocos, con caché) por el ORM sobre la misma conexión
+    with Session(bind=conn) as s:
         lg_id = _get_or_create_league(s, league)
         team_cache: dict[str, int] = {}
+        for name in (n for pair in zip(home_names, away_names) for n in pair):
+            if name not in team_cache:
+                team_cache[name] = _get_or_create_team(s, name, lg_id)
+
+    stage = _build_stage(
+        df,
+        [team_cache[n] for n in home_names],
+        [team_cache[n] for n in away_names],
+        season_id,
+    )
+    buf = io.StringIO()
+    stage.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+
+    with conn.connection.cursor() as cur:
+        cur.execute(_CREATE_STAGE)
+        cur.copy_expert(_COPY_STAGE, buf)
+        cur.execute("ANALYZE _stage_unified")
+        cur.execute(_RESOLVE_MATCH_IDS)
+        cur.execute(_UPDATE_MATCHES)
+        cur.execute(_INSERT_MATCHES)
+        cur.execute(_UPSERT_MATCH_STATS)
 
-        for _, r in df.iterrows():
-            hname = str(r["HomeTeam"]).strip()
-            aname = str(r["AwayTeam"]).strip()
-            if not hname or not aname or pd.isna(r["Date"]):
-                continue
+    return len(df)
 
-            if hname not in team_cache:
-                team_cache[hname] = _get_or_create_team(s, hname, lg_id)
-            if aname not in team_cache:
-                team_cache[aname] = _get_or_create_team(s, aname, lg_id)
 
-            mid = _upsert_match(s, r["Date"], team_cache[hname], team_cache[aname], r, season_id)
-            _upsert_match_stats(s, mid, r)
+@app.command()
+def run(
+    csv: str = typer.Argument(..., help="Ruta al CSV (E0 xx).csv"),
+    league: str = typer.Option("Premier League", help="Nombre de la liga"),
+    div: str = typer.Option("E0", help="Código de la columna Div (p.ej. E0)"),
+    season_id: int | None = typer.Option(None, help="season_id a asignar (opcional)"),
+    dayfirst: bool = typer.Option(True, help="Fechas dd/mm/yyyy"),
+):
+    """
+    Carga un CSV unificado y puebla las tablas de la base de datos.
+    
+    Maneja automáticamente:
+    - Ligas CON columna Referee (Premier League): usa el valor
+    - Ligas SIN columna Referee (La Liga, etc.): asigna "Sin arbitro"
+    """
+    # src.db se conecta a la BD del .env al importarse: solo lo necesita el CLI
+    # (los scripts de actualización llaman a load_csv con su propio engine)
+    from src.db import engine
+
+    try:
+        with engine.begin() as conn:
+            n = load_csv(conn, csv, league, div, season_id, dayfirst)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
 
-        s.commit()
-        typer.echo(f"✅ OK: cargado {len(df)} filas (liga={league}, div={div}, season_id={season_id})")
+    typer.echo(f"✅ OK: cargado {n} filas (liga={league}, div={div}, season_id={season_id})")
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
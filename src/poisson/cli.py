@@ -3,7 +3,7 @@ from datetime import datetime
 import typer
 from src.db import SessionLocal
 from src.models import Match, PoissonPrediction
-from .compute import compute_for_match, upsert_prediction
+from .compute import compute_for_match, upsert_prediction, upsert_predictions
 
 app = typer.Typer(help="Calcular Poisson para partidos")
 
@@ -38,9 +38,7 @@ def backfill(
             q = q.filter(Match.date <= dto)
 
         ids = [mid for (mid,) in q.order_by(Match.date.asc()).all()]
-        for mid in ids:
-            pred = compute_for_match(s, mid)
-            upsert_prediction(s, pred)
+        upsert_predictions(s, [compute_for_match(s, mid) for mid in ids])
         s.commit()
         typer.echo(f"OK: {len(ids)} predicciones generadas/actualizadas")
 
@@ -1,6 +1,7 @@
 from __future__ import annotations
+from functools import lru_cache
 from math import isfinite
-from scipy.stats import poisson
+import numpy as np
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
@@ -8,47 +9,63 @@ from src.models import Match, PoissonPrediction
 
 # --- helpers ---
 
+def poisson_pmf_matrix(lmbs, max_goals: int) -> np.ndarray:
+    """
+    PMF Poisson 0..max_goals para muchos λ a la vez, una fila por λ.
+
+    Recurrencia p[k] = p[k-1] * λ / k sobre todas las filas (cumprod): un solo
+    exp por λ, sin pow ni factoriales. λ <= 0 da [1, 0, ...].
+    """
+    lmbs = np.maximum(np.asarray(lmbs, dtype=np.float64).reshape(-1), 0.0)
+    steps = np.ones((len(lmbs), max_goals + 1))
+    steps[:, 1:] = lmbs[:, None] / np.arange(1, max_goals + 1)
+    return np.exp(-lmbs)[:, None] * np.cumprod(steps, axis=1)
+
+
+def poisson_pmf_vector(lmb: float, max_goals: int) -> np.ndarray:
+    """PMF Poisson para 0..max_goals de un solo λ (ver poisson_pmf_matrix)."""
+    return poisson_pmf_matrix([lmb], max_goals)[0]
+
+
 def xi(goals_for_avg: float, goals_against_avg: float, home: bool) -> float:
     home_adv = 1.1 if home else 1.0
     return max(0.01, goals_for_avg * goals_against_avg * 0.5 * home_adv)
 
 
+@lru_cache(maxsize=None)
+def _score_masks(max_goals: int) -> np.ndarray:
+    """
+    Máscaras 0/1 de la matriz de marcadores, apiladas (7, max_goals+1, max_goals+1):
+    local, empate, visita, over 2.5, under 2.5, BTTS sí, BTTS no.
+    """
+    hg, ag = np.indices((max_goals + 1, max_goals + 1))
+    over = hg + ag > 2
+    btts = (hg > 0) & (ag > 0)
+    return np.stack([hg > ag, hg == ag, hg < ag, over, ~over, btts, ~btts]).astype(np.float64)
+
+
+def score_probs_batch(lmbs_home, lmbs_away, max_goals: int = 10) -> np.ndarray:
+    """
+    Probabilidades de muchos partidos en una sola operación: tensor de
+    marcadores (n, max_goals+1, max_goals+1) reducido contra las máscaras.
+
+    Returns:
+        Array (n, 7) con columnas home, draw, away, over, under, btts_yes, btts_no
+    """
+    m = poisson_pmf_matrix(lmbs_home, max_goals)[:, :, None] * poisson_pmf_matrix(lmbs_away, max_goals)[:, None, :]
+    return np.einsum("nij,kij->nk", m, _score_masks(max_goals))
+
+
 def outcome_probs(lmb_home: float, lmb_away: float, max_goals: int = 10) -> tuple[float, float, float]:
-    p_home = p_draw = p_away = 0.0
-    for hg in range(0, max_goals + 1):
-        for ag in range(0, max_goals + 1):
-            p = poisson.pmf(hg, lmb_home) * poisson.pmf(ag, lmb_away)
-            if hg > ag:
-                p_home += p
-            elif hg == ag:
-                p_draw += p
-            else:
-                p_away += p
-    return p_home, p_draw, p_away
+    return tuple(score_probs_batch([lmb_home], [lmb_away], max_goals)[0, 0:3].tolist())
 
 
 def over_under_25(lmb_home: float, lmb_away: float, max_goals: int = 10) -> tuple[float, float]:
-    over = under = 0.0
-    for hg in range(0, max_goals + 1):
-        for ag in range(0, max_goals + 1):
-            p = poisson.pmf(hg, lmb_home) * poisson.pmf(ag, lmb_away)
-            if hg + ag > 2:
-                over += p
-            else:
-                under += p
-    return over, under
+    return tuple(score_probs_batch([lmb_home], [lmb_away], max_goals)[0, 3:5].tolist())
 
 
 def both_teams_score(lmb_home: float, lmb_away: float, max_goals: int = 10) -> tuple[float, float]:
-    yes = no = 0.0
-    for hg in range(0, max_goals + 1):
-        for ag in range(0, max_goals + 1):
-            p = poisson.pmf(hg, lmb_home) * poisson.pmf(ag, lmb_away)
-            if hg > 0 and ag > 0:
-                yes += p
-            else:
-                no += p
-    return yes, no
+    return tuple(score_probs_batch([lmb_home], [lmb_away], max_goals)[0, 5:7].tolist())
 
 
 def _inv(prob: float | None) -> float | None:
@@ -66,37 +83,6 @@ def compute_for_match(session: Session, match_id: int) -> PoissonPrediction:
     m: Match = session.get(Match, match_id)
     assert m, f"Match {match_id} no existe"
 
-    # medias simples de GF/GC por equipo usando últimos 5 partidos
-    def avg_for_against(team_id: int) -> tuple[float, float]:
-        rows = (
-            session.query(Match)
-            .filter((Match.home_team_id == team_id) | (Match.away_team_id == team_id))
-            .order_by(Match.date.desc())
-            .limit(5)
-            .all()
-        )
-        if not rows:
-            return 1.2, 1.2
-        gf, ga = [], []
-        for mt in rows:
-            if mt.home_team_id == team_id:
-                gf.append(mt.home_goals or 0)
-                ga.append(mt.away_goals or 0)
-            else:
-                gf.append(mt.away_goals or 0)
-                ga.append(mt.home_goals or 0)
-        return (float(sum(gf)/len(gf)), float(sum(ga)/len(ga)))
-
-    gf_h, ga_h = avg_for_against(m.home_team_id)
-    gf_a, ga_a = avg_for_against(m.away_team_id)
-
-    lmb_home = xi(gf_h, ga_a, home=True)
-    lmb_away = xi(gf_a, ga_h, home=False)
-
-    ph, pd, pa = outcome_probs(lmb_home, lmb_away)
-    over, under = over_under_25(lmb_home, lmb_away)
-    btts_y, btts_n = both_teams_score(lmb_home, lmb_away)
-
     avg_h, avg_a = _league_avgs(session, m.season_id)
 
     gfph, gcph = _home_rates(session, m.home_team_id, m.season_id)  # local
@@ -112,10 +98,8 @@ def compute_for_match(session: Session, match_id: int) -> PoissonPrediction:
     exp_home = max(0.01, IAL * IDV * avg_h)
     exp_away = max(0.01, IAV * IDL * avg_a)
 
-    # usa EH/EA como lambdas Poisson
-    ph, pd, pa = outcome_probs(exp_home, exp_away)
-    over, under = over_under_25(exp_home, exp_away)
-    btts_y, btts_n = both_teams_score(exp_home, exp_away)
+    # usa EH/EA como lambdas Poisson: una sola matriz de marcadores
+    ph, pd, pa, over, under, btts_y, btts_n = score_probs_batch([exp_home], [exp_away])[0].tolist()
 
     return PoissonPrediction(
         match_id=m.id,
@@ -173,4 +157,14 @@ def _away_rates(session: Session, team_id: int, season_id: int | None):
 
 def upsert_prediction(session: Session, pred: PoissonPrediction):
     session.query(PoissonPrediction).filter_by(match_id=pred.match_id).delete()
-    session.add(pred)
\ No newline at end of file
+    session.add(pred)
+
+
+def upsert_predictions(session: Session, preds: list[PoissonPrediction]):
+    """upsert_prediction para muchos partidos: un solo DELETE y un INSERT por lotes al hacer flush."""
+    if not preds:
+        return
+    session.query(PoissonPrediction).filter(
+        PoissonPrediction.match_id.in_([p.match_id for p in preds])
+    ).delete(synchronize_session=False)
+    session.add_all(preds)
\ No newline at end of file
@@ -4,7 +4,7 @@ from datetime import datetime, date, timedelta
 from sqlalchemy import select, and_
 from src.db import SessionLocal
 from src.models import Match
-from src.poisson.compute import compute_for_match, upsert_prediction
+from src.poisson.compute import compute_for_match, upsert_predictions
 
 # Importamos el backfill de Winston (ya probado)
 from src.weinston.cli import backfill as weinston_backfill  # <- tu backfill existente
@@ -38,11 +38,8 @@ def window(
     # 2) Poisson: sólo para la ventana pedida
     with SessionLocal() as s:
         mids = _window_query(s, d_from, d_to)
-        n = 0
-        for mid in mids:
-            pred = compute_for_match(s, mid)
-            upsert_prediction(s, pred)
-            n += 1
+        upsert_predictions(s, [compute_for_match(s, mid) for mid in mids])
+        n = len(mids)
         s.commit()
         typer.echo(f"OK ventana {d_from}..{d_to}: Poisson upsert {n} partidos")
 
@@ -71,11 +68,8 @@ def missing(
     """
     with SessionLocal() as s:
         ids = [r[0] for r in s.execute(sql, {"d_from": d_from, "d_to": d_to}).all()]
-        n=0
-        for mid in ids:
-            pred = compute_for_match(s, mid)
-            upsert_prediction(s, pred)
-            n+=1
+        upsert_predictions(s, [compute_for_match(s, mid) for mid in ids])
+        n = len(ids)
         s.commit()
         typer.echo(f"OK missing Poisson: {n} nuevos en {d_from}..{d_to}")
 
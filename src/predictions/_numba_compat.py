@@ -0,0 +1,29 @@
+# src/predictions/_numba_compat.py
+"""
+Importación opcional de Numba.
+
+Si numba está instalado, `njit` compila las funciones a código nativo.
+numba está en requirements.txt, así que es el camino de producción (los
+workflows instalan ese archivo). Si falta (p. ej. una plataforma sin wheel),
+`njit` es un decorador identidad y los llamadores usan la versión NumPy, con
+el mismo resultado.
+"""
+
+from __future__ import annotations
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:  # pragma: no cover - depende del entorno
+    HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """Sustituto de numba.njit: devuelve la función sin compilar."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def wrap(fn):
+            return fn
+
+        return wrap
@@ -0,0 +1,160 @@
+# src/predictions/_poisson_jit.py
+"""
+Núcleo numérico de la matriz de marcadores Poisson, compartido por
+upcoming_poisson y upcoming_weinston.
+
+Con numba, `aggregate_probs` es el doble bucle compilado a código nativo
+(cache=True guarda la compilación en __pycache__). Sin numba se usa la
+versión NumPy, que en Python puro es más rápida que el bucle sin compilar.
+"""
+
+from __future__ import annotations
+import math
+import threading
+from typing import Tuple
+import numpy as np
+from ._numba_compat import HAVE_NUMBA, njit, prange
+
+MAX_GOALS = 12
+# Tamaño de la matriz. Numba congela las globales al compilar: los kernels se
+# especializan para este tamaño (límites de bucle constantes, desenrollables)
+_N = MAX_GOALS + 1
+
+
+@njit(cache=True, fastmath=True)
+def _aggregate_probs_loop(lh: float, la: float) -> Tuple[float, float, float, float, float]:
+    n = _N
+    lh = max(lh, 0.0)
+    la = max(la, 0.0)
+
+    # Recurrencia p[k] = p[k-1] * λ / k: un solo exp por λ, sin factoriales
+    p_h = np.empty(n)
+    p_a = np.empty(n)
+    p_h[0] = math.exp(-lh)
+    p_a[0] = math.exp(-la)
+    for k in range(1, n):
+        p_h[k] = p_h[k - 1] * lh / k
+        p_a[k] = p_a[k - 1] * la / k
+
+    # Cola acumulada en el último bucket
+    rem_h = 1.0 - p_h.sum()
+    rem_a = 1.0 - p_a.sum()
+    if rem_h > 1e-12:
+        p_h[n - 1] += rem_h
+    if rem_a > 1e-12:
+        p_a[n - 1] += rem_a
+
+    home = draw = away = over25 = btts = 0.0
+    for i in range(n):
+        for j in range(n):
+            pij = p_h[i] * p_a[j]
+            if i > j:
+                home += pij
+            elif i == j:
+                draw += pij
+            else:
+                away += pij
+            if i + j >= 3:  # umbral 2.5
+                over25 += pij
+            if i >= 1 and j >= 1:
+                btts += pij
+    return home, draw, away, over25, btts
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def _aggregate_probs_loop_batch(lh: np.ndarray, la: np.ndarray) -> np.ndarray:
+    out = np.empty((lh.shape[0], 5))
+    for m in prange(lh.shape[0]):
+        out[m, 0], out[m, 1], out[m, 2], out[m, 3], out[m, 4] = _aggregate_probs_loop(lh[m], la[m])
+    return out
+
+
+# La capa de hilos por defecto de numba (workqueue) no admite lanzar kernels
+# paralelos desde varios hilos a la vez (p. ej. ligas en paralelo)
+_KERNEL_LOCK = threading.Lock()
+
+
+# Versión NumPy: índices y máscaras de la matriz fijos, se arman una vez
+_K = np.arange(_N)
+_INV_K = 1.0 / _K[1:]
+_I, _J = np.indices((_N, _N))
+_HOME_WIN = _I > _J
+_AWAY_WIN = _I < _J
+_OVER25 = _I + _J >= 3
+
+
+def _pmf_batch(lam: np.ndarray) -> np.ndarray:
+    # Una PMF por λ distinto (los equipos sin historial comparten λ de liga)
+    lam, inv = np.unique(np.maximum(lam, 0.0), return_inverse=True)
+    # Misma recurrencia que el kernel: exp(-λ) · Π λ/k (λ = 0 da [1, 0, ...])
+    steps = np.concatenate([np.ones((len(lam), 1)), lam[:, None] * _INV_K[None, :]], axis=1)
+    p = np.exp(-lam)[:, None] * np.cumprod(steps, axis=1)
+    rem = 1.0 - p.sum(axis=1)
+    p[:, -1] += np.where(rem > 1e-12, rem, 0.0)
+    return p[inv.reshape(-1)]
+
+
+def _pmf(lam: float) -> np.ndarray:
+    return _pmf_batch(np.array([lam], dtype=np.float64))[0]
+
+
+def _aggregate_probs_np_batch(lh: np.ndarray, la: np.ndarray) -> np.ndarray:
+    # (n, 13, 13): una matriz de marcadores por partido
+    m = _pmf_batch(lh)[:, :, None] * _pmf_batch(la)[:, None, :]
+    return np.stack([
+        m[:, _HOME_WIN].sum(axis=1),
+        np.trace(m, axis1=1, axis2=2),
+        m[:, _AWAY_WIN].sum(axis=1),
+        m[:, _OVER25].sum(axis=1),
+        m[:, 1:, 1:].sum(axis=(1, 2)),
+    ], axis=1)
+
+
+def _aggregate_probs_np(lh: float, la: float) -> Tuple[float, float, float, float, float]:
+    m = np.outer(_pmf(lh), _pmf(la))
+    return (
+        float(m[_HOME_WIN].sum()),
+        float(np.trace(m)),
+        float(m[_AWAY_WIN].sum()),
+        float(m[_OVER25].sum()),
+        float(m[1:, 1:].sum()),
+    )
+
+
+def aggregate_probs(lh: float, la: float) -> Tuple[float, float, float, float, float]:
+    """
+    Suma la matriz Poisson truncada (0..MAX_GOALS, cola en el último bucket).
+
+    Returns:
+        Tuple (home, draw, away, over25, btts)
+    """
+    if HAVE_NUMBA:
+        return _aggregate_probs_loop(float(lh), float(la))
+    return _aggregate_probs_np(lh, la)
+
+
+def aggregate_probs_batch(lh: np.ndarray, la: np.ndarray) -> np.ndarray:
+    """
+    aggregate_probs para muchos partidos a la vez.
+
+    Args:
+        lh, la: Lambdas local / visitante, un valor por partido
+
+    Returns:
+        Array (n, 5) con columnas (home, draw, away, over25, btts)
+    """
+    # Pares (λ_local, λ_visitante) repetidos se calculan una sola vez.
+    # Se deduplica por valor exacto: redondear λ cambiaría las probabilidades
+    pairs = np.column_stack([
+        np.asarray(lh, dtype=np.float64).reshape(-1),
+        np.asarray(la, dtype=np.float64).reshape(-1),
+    ])
+    pairs, inv = np.unique(pairs, axis=0, return_inverse=True)
+    lh = np.ascontiguousarray(pairs[:, 0])
+    la = np.ascontiguousarray(pairs[:, 1])
+    if HAVE_NUMBA:
+        with _KERNEL_LOCK:
+            out = _aggregate_probs_loop_batch(lh, la)
+    else:
+        out = _aggregate_probs_np_batch(lh, la)
+    return out[inv.reshape(-1)]
@@ -40,6 +40,12 @@ try:
 except ImportError:
     from src.predictions.upcoming_weinston import predict_and_upsert_weinston
 
+# Betting lines
+try:
+    from .betting_lines import generate_betting_lines, validate_betting_lines
+except ImportError:
+    from src.predictions.betting_lines import generate_betting_lines, validate_betting_lines
+
 
 app = typer.Typer(help="Predicciones pre-partido (Escenario 2)")
 
@@ -390,261 +396,12 @@ def betting_lines(
     # Import engine here after .env is loaded
     from src.db import engine
 
-    if model.lower() not in ['weinston', 'poisson']:
-        typer.echo("❌ Modelo debe ser 'weinston' o 'poisson'")
-        raise typer.Exit(code=1)
-
-    typer.echo(f"\n{'='*70}")
-    typer.echo(f"  GENERANDO BETTING LINES - {model.upper()}")
-    typer.echo(f"{'='*70}\n")
-    typer.echo(f"Season: {season_id}")
-    typer.echo(f"Rango: {date_from} a {date_to}\n")
-
     with engine.begin() as conn:
-        # 1. Obtener las betting lines fijas desde league_parameters
-        league_params_query = text("""
-            SELECT 
-                lp.betting_line_shots,
-                lp.betting_line_shots_ot,
-                lp.betting_line_corners,
-                lp.betting_line_cards,
-                lp.betting_line_fouls
-            FROM seasons s
-            JOIN league_parameters lp ON lp.league_id = s.league_id
-            WHERE s.id = :season_id
-            LIMIT 1
-        """)
-        
-        league_params = conn.execute(league_params_query, {"season_id": season_id}).mappings().first()
-        
-        if not league_params:
-            typer.echo("❌ No se encontraron parámetros de liga para esta temporada")
-            raise typer.Exit(code=1)
-        
-        # Usar valores fijos de league_parameters
-        FIXED_SHOTS_LINE = float(league_params['betting_line_shots'])
-        FIXED_SHOTS_OT_LINE = float(league_params['betting_line_shots_ot'])
-        FIXED_CORNERS_LINE = float(league_params['betting_line_corners'])
-        FIXED_CARDS_LINE = float(league_params['betting_line_cards'])
-        FIXED_FOULS_LINE = float(league_params['betting_line_fouls'])
-        
-        typer.echo(f"📋 Betting Lines Fijas (de league_parameters):")
-        typer.echo(f"   Shots: {FIXED_SHOTS_LINE}")
-        typer.echo(f"   Shots OT: {FIXED_SHOTS_OT_LINE}")
-        typer.echo(f"   Corners: {FIXED_CORNERS_LINE}")
-        typer.echo(f"   Cards: {FIXED_CARDS_LINE}")
-        typer.echo(f"   Fouls: {FIXED_FOULS_LINE}\n")
-
-        # ═══════════════════════════════════════════════════════════════
-        # Resetear secuencia de betting_lines_predictions
-        # ═══════════════════════════════════════════════════════════════
         try:
-            typer.echo("\n🔄 Verificando secuencia de IDs...")
-            
-            # Resetear la secuencia al máximo ID actual
-            reset_query = text("""
-                SELECT setval(
-                    'betting_lines_predictions_id_seq',
-                    COALESCE((SELECT MAX(id) FROM betting_lines_predictions), 1),
-                    true
-                )
-            """)
-            
-            result = conn.execute(reset_query).scalar()
-            
-            # Verificar el valor actual
-            check_query = text("SELECT last_value FROM betting_lines_predictions_id_seq")
-            current_val = conn.execute(check_query).scalar()
-            
-            typer.echo(f"✅ Secuencia reseteada a: {current_val}\n")
-            
-        except Exception as e:
-            typer.echo(f"⚠️  Advertencia al resetear secuencia: {e}")
-            typer.echo("   Continuando de todas formas...\n")
-
-        # Query para obtener partidos y sus predicciones
-        if model.lower() == 'weinston':
-            matches_query = text("""
-                SELECT 
-                    m.id as match_id,
-                    wp.shots_home,
-                    wp.shots_away,
-                    wp.shots_target_home,
-                    wp.shots_target_away,
-                    wp.corners_home,
-                    wp.corners_away,
-                    wp.cards_home,
-                    wp.cards_away,
-                    wp.fouls_home,
-                    wp.fouls_away
-                FROM matches m
-                JOIN weinston_predictions wp ON wp.match_id = m.id
-                WHERE m.season_id = :season_id
-                  AND m.date BETWEEN :date_from AND :date_to
-                  AND m.home_goals IS NULL
-                ORDER BY m.date
-            """)
-        else:  # poisson
-            typer.echo("⚠️  Betting lines con Poisson aún no implementado completamente")
-            typer.echo("   Usando predicciones de Weinston como referencia\n")
-            matches_query = text("""
-                SELECT 
-                    m.id as match_id,
-                    wp.shots_home,
-                    wp.shots_away,
-                    wp.shots_target_home,
-                    wp.shots_target_away,
-                    wp.corners_home,
-                    wp.corners_away,
-                    wp.cards_home,
-                    wp.cards_away,
-                    wp.fouls_home,
-                    wp.fouls_away
-                FROM matches m
-                JOIN weinston_predictions wp ON wp.match_id = m.id
-                WHERE m.season_id = :season_id
-                  AND m.date BETWEEN :date_from AND :date_to
-                  AND m.home_goals IS NULL
-                ORDER BY m.date
-            """)
-        
-        matches = conn.execute(matches_query, {
-            "season_id": season_id,
-            "date_from": date_from,
-            "date_to": date_to
-        }).mappings().all()
-        
-        if not matches:
-            typer.echo("⚠️  No se encontraron partidos en el rango especificado")
-            return
-        
-        typer.echo(f"📊 Partidos encontrados: {len(matches)}\n")
-        
-        generated_count = 0
-        
-        for match in matches:
-            # Calcular totales predichos
-            predicted_shots = match['shots_home'] + match['shots_away']
-            predicted_shots_ot = match['shots_target_home'] + match['shots_target_away']
-            predicted_corners = match['corners_home'] + match['corners_away']
-            predicted_cards = match['cards_home'] + match['cards_away']
-            predicted_fouls = match['fouls_home'] + match['fouls_away']
-            
-            # ✅ Usar betting lines FIJAS de league_parameters
-            shots_line = FIXED_SHOTS_LINE
-            shots_ot_line = FIXED_SHOTS_OT_LINE
-            corners_line = FIXED_CORNERS_LINE
-            cards_line = FIXED_CARDS_LINE
-            fouls_line = FIXED_FOULS_LINE
-            
-            # Determinar predicción (over/under)
-            shots_prediction = 'over' if predicted_shots > shots_line else 'under'
-            shots_ot_prediction = 'over' if predicted_shots_ot > shots_ot_line else 'under'
-            corners_prediction = 'over' if predicted_corners > corners_line else 'under'
-            cards_prediction = 'over' if predicted_cards > cards_line else 'under'
-            fouls_prediction = 'over' if predicted_fouls > fouls_line else 'under'
-            
-            # Factores de escala para normalizar el confidence
-            SCALE_SHOTS = 6.0
-            SCALE_SHOTS_OT = 2.5
-            SCALE_CORNERS = 3.0
-            SCALE_CARDS = 1.5
-            SCALE_FOULS = 5.0
-
-            # Calcular márgenes absolutos (distancia de la línea)
-            shots_margin = abs(predicted_shots - shots_line)
-            shots_ot_margin = abs(predicted_shots_ot - shots_ot_line)
-            corners_margin = abs(predicted_corners - corners_line)
-            cards_margin = abs(predicted_cards - cards_line)
-            fouls_margin = abs(predicted_fouls - fouls_line)
-
-            # ═══════════════════════════════════════════════════════════════════
-            # NUEVA FÓRMULA DE CONFIDENCE (MEJORADA)
-            # ═══════════════════════════════════════════════════════════════════
-            # Problema anterior: margin pequeño = confidence muy baja
-            # Solución: Base confidence de 40% cuando estamos cerca de la línea,
-            #           aumenta hasta 85% cuando estamos lejos
-            #
-            # Fórmula: 0.40 + (margin / scale) * 0.45
-            # Resultado: 40% (cerca) → 85% (lejos)
-            # ═══════════════════════════════════════════════════════════════════
-
-            shots_confidence = min(0.40 + (shots_margin / SCALE_SHOTS) * 0.45, 0.85)
-            shots_ot_confidence = min(0.40 + (shots_ot_margin / SCALE_SHOTS_OT) * 0.45, 0.85)
-            corners_confidence = min(0.40 + (corners_margin / SCALE_CORNERS) * 0.45, 0.85)
-            cards_confidence = min(0.40 + (cards_margin / SCALE_CARDS) * 0.45, 0.85)
-            fouls_confidence = min(0.40 + (fouls_margin / SCALE_FOULS) * 0.45, 0.85)
-            
-            # Insertar o actualizar en betting_lines_predictions
-            insert_query = text("""
-                INSERT INTO betting_lines_predictions (
-                    match_id, model,
-                    predicted_total_shots, shots_line, shots_prediction, shots_confidence,
-                    predicted_total_shots_on_target, shots_on_target_line, shots_on_target_prediction, shots_on_target_confidence,
-                    predicted_total_corners, corners_line, corners_prediction, corners_confidence,
-                    predicted_total_cards, cards_line, cards_prediction, cards_confidence,
-                    predicted_total_fouls, fouls_line, fouls_prediction, fouls_confidence
-                )
-                VALUES (
-                    :match_id, :model,
-                    :predicted_shots, :shots_line, :shots_prediction, :shots_confidence,
-                    :predicted_shots_ot, :shots_ot_line, :shots_ot_prediction, :shots_ot_confidence,
-                    :predicted_corners, :corners_line, :corners_prediction, :corners_confidence,
-                    :predicted_cards, :cards_line, :cards_prediction, :cards_confidence,
-                    :predicted_fouls, :fouls_line, :fouls_prediction, :fouls_confidence
-                )
-                ON CONFLICT (match_id, model) DO UPDATE SET
-                    predicted_total_shots = EXCLUDED.predicted_total_shots,
-                    shots_line = EXCLUDED.shots_line,
-                    shots_prediction = EXCLUDED.shots_prediction,
-                    shots_confidence = EXCLUDED.shots_confidence,
-                    predicted_total_shots_on_target = EXCLUDED.predicted_total_shots_on_target,
-                    shots_on_target_line = EXCLUDED.shots_on_target_line,
-                    shots_on_target_prediction = EXCLUDED.shots_on_target_prediction,
-                    shots_on_target_confidence = EXCLUDED.shots_on_target_confidence,
-                    predicted_total_corners = EXCLUDED.predicted_total_corners,
-                    corners_line = EXCLUDED.corners_line,
-                    corners_prediction = EXCLUDED.corners_prediction,
-                    corners_confidence = EXCLUDED.corners_confidence,
-                    predicted_total_cards = EXCLUDED.predicted_total_cards,
-                    cards_line = EXCLUDED.cards_line,
-                    cards_prediction = EXCLUDED.cards_prediction,
-                    cards_confidence = EXCLUDED.cards_confidence,
-                    predicted_total_fouls = EXCLUDED.predicted_total_fouls,
-                    fouls_line = EXCLUDED.fouls_line,
-                    fouls_prediction = EXCLUDED.fouls_prediction,
-                    fouls_confidence = EXCLUDED.fouls_confidence,
-                    updated_at = CURRENT_TIMESTAMP
-            """)
-            
-            conn.execute(insert_query, {
-                "match_id": match['match_id'],
-                "model": model.lower(),
-                "predicted_shots": predicted_shots,
-                "shots_line": shots_line,
-                "shots_prediction": shots_prediction,
-                "shots_confidence": shots_confidence,
-                "predicted_shots_ot": predicted_shots_ot,
-                "shots_ot_line": shots_ot_line,
-                "shots_ot_prediction": shots_ot_prediction,
-                "shots_ot_confidence": shots_ot_confidence,
-                "predicted_corners": predicted_corners,
-                "corners_line": corners_line,
-                "corners_prediction": corners_prediction,
-                "corners_confidence": corners_confidence,
-                "predicted_cards": predicted_cards,
-                "cards_line": cards_line,
-                "cards_prediction": cards_prediction,
-                "cards_confidence": cards_confidence,
-                "predicted_fouls": predicted_fouls,
-                "fouls_line": fouls_line,
-                "fouls_prediction": fouls_prediction,
-                "fouls_confidence": fouls_confidence
-            })
-            
-            generated_count += 1
-        
-        typer.echo(f"\n✅ Betting lines generadas: {generated_count}/{len(matches)} partidos\n")
+            generate_betting_lines(conn, season_id, date_from, date_to, model)
+        except ValueError as e:
+            typer.echo(f"❌ {e}")
+            raise typer.Exit(code=1)
 
 
 @app.command("betting-lines-validate")
@@ -662,120 +419,32 @@ def betting_lines_validate(
     # Import engine here after .env is loaded
     from src.db import engine
 
-    typer.echo(f"\n{'='*70}")
-    typer.echo(f"  VALIDANDO BETTING LINES")
-    typer.echo(f"{'='*70}\n")
-    typer.echo(f"Season: {season_id}")
-    typer.echo(f"Rango: {date_from} a {date_to}\n")
-
     with engine.begin() as conn:
-        # Actualizar resultados reales y validar predicciones
-        update_query = text("""
-            UPDATE betting_lines_predictions blp
-            SET 
-                -- Actualizar resultados reales
-                actual_total_shots = ms.home_shots + ms.away_shots,
-                actual_total_shots_on_target = ms.home_shots_on_target + ms.away_shots_on_target,
-                actual_total_corners = ms.home_corners + ms.away_corners,
-                actual_total_cards = ms.home_yellow_cards + ms.away_yellow_cards + 
-                                    COALESCE(ms.home_red_cards, 0) + COALESCE(ms.away_red_cards, 0),
-                actual_total_fouls = ms.home_fouls + ms.away_fouls,
-                
-                -- Validar predicciones (TRUE si acertó)
-                shots_hit = CASE 
-                    WHEN blp.shots_prediction = 'over' AND (ms.home_shots + ms.away_shots) > blp.shots_line THEN TRUE
-                    WHEN blp.shots_prediction = 'under' AND (ms.home_shots + ms.away_shots) < blp.shots_line THEN TRUE
-                    ELSE FALSE
-                END,
-                
-                shots_on_target_hit = CASE 
-                    WHEN blp.shots_on_target_prediction = 'over' AND (ms.home_shots_on_target + ms.away_shots_on_target) > blp.shots_on_target_line THEN TRUE
-                    WHEN blp.shots_on_target_prediction = 'under' AND (ms.home_shots_on_target + ms.away_shots_on_target) < blp.shots_on_target_line THEN TRUE
-                    ELSE FALSE
-                END,
-                
-                corners_hit = CASE 
-                    WHEN blp.corners_prediction = 'over' AND (ms.home_corners + ms.away_corners) > blp.corners_line THEN TRUE
-                    WHEN blp.corners_prediction = 'under' AND (ms.home_corners + ms.away_corners) < blp.corners_line THEN TRUE
-                    ELSE FALSE
-                END,
-                
-                cards_hit = CASE 
-                    WHEN blp.cards_prediction = 'over' AND (ms.home_yellow_cards + ms.away_yellow_cards + COALESCE(ms.home_red_cards, 0) + COALESCE(ms.away_red_cards, 0)) > blp.cards_line THEN TRUE
-                    WHEN blp.cards_prediction = 'under' AND (ms.home_yellow_cards + ms.away_yellow_cards + COALESCE(ms.home_red_cards, 0) + COALESCE(ms.away_red_cards, 0)) < blp.cards_line THEN TRUE
-                    ELSE FALSE
-                END,
-                
-                fouls_hit = CASE 
-                    WHEN blp.fouls_prediction = 'over' AND (ms.home_fouls + ms.away_fouls) > blp.fouls_line THEN TRUE
-                    WHEN blp.fouls_prediction = 'under' AND (ms.home_fouls + ms.away_fouls) < blp.fouls_line THEN TRUE
-                    ELSE FALSE
-                END,
-                
-                updated_at = CURRENT_TIMESTAMP
-                
-            FROM matches m
-            JOIN match_stats ms ON ms.match_id = m.id
-            WHERE blp.match_id = m.id
-              AND m.season_id = :season_id
-              AND m.date BETWEEN :date_from AND :date_to
-              AND m.home_goals IS NOT NULL
-              AND (blp.actual_total_shots IS NULL OR blp.updated_at < m.date + INTERVAL '1 day')
-        """)
-        
-        result = conn.execute(update_query, {
-            "season_id": season_id,
-            "date_from": date_from,
-            "date_to": date_to
-        })
-        
-        validated_count = result.rowcount
-        
-        typer.echo(f"✅ Betting lines validadas: {validated_count} partidos\n")
-        
-        # Mostrar accuracy
-        accuracy_query = text("""
-            SELECT 
-                blp.model,
-                COUNT(*) as total,
-                ROUND(AVG(CASE WHEN blp.shots_hit THEN 1.0 ELSE 0.0 END) * 100, 2) as shots_acc,
-                ROUND(AVG(CASE WHEN blp.shots_on_target_hit THEN 1.0 ELSE 0.0 END) * 100, 2) as shots_ot_acc,
-                ROUND(AVG(CASE WHEN blp.corners_hit THEN 1.0 ELSE 0.0 END) * 100, 2) as corners_acc,
-                ROUND(AVG(CASE WHEN blp.cards_hit THEN 1.0 ELSE 0.0 END) * 100, 2) as cards_acc,
-                ROUND(AVG(CASE WHEN blp.fouls_hit THEN 1.0 ELSE 0.0 END) * 100, 2) as fouls_acc,
-                ROUND(AVG(
-                    (CASE WHEN blp.shots_hit THEN 1.0 ELSE 0.0 END +
-                     CASE WHEN blp.shots_on_target_hit THEN 1.0 ELSE 0.0 END +
-                     CASE WHEN blp.corners_hit THEN 1.0 ELSE 0.0 END +
-                     CASE WHEN blp.cards_hit THEN 1.0 ELSE 0.0 END +
-                     CASE WHEN blp.fouls_hit THEN 1.0 ELSE 0.0 END) / 5.0
-                ) * 100, 2) as overall_acc
-            FROM betting_lines_predictions blp
-            JOIN matches m ON m.id = blp.match_id
-            WHERE m.season_id = :season_id
-              AND m.date BETWEEN :date_from AND :date_to
-              AND blp.actual_total_shots IS NOT NULL
-            GROUP BY blp.model
-        """)
-        
-        accuracy_results = conn.execute(accuracy_query, {
-            "season_id": season_id,
-            "date_from": date_from,
-            "date_to": date_to
-        }).mappings().all()
-        
-        if accuracy_results:
-            typer.echo("📊 ACCURACY POR MODELO:\n")
-            for row in accuracy_results:
-                typer.echo(f"  {row['model'].upper()}:")
-                typer.echo(f"    Total predicciones: {row['total']}")
-                typer.echo(f"    Accuracy general:   {row['overall_acc']}%")
-                typer.echo(f"    Tiros:     {row['shots_acc']}%")
-                typer.echo(f"    Tiros OT:  {row['shots_ot_acc']}%")
-                typer.echo(f"    Corners:   {row['corners_acc']}%")
-                typer.echo(f"    Tarjetas:  {row['cards_acc']}%")
-                typer.echo(f"    Faltas:    {row['fouls_acc']}%")
-                typer.echo()
+        validate_betting_lines(conn, season_id, date_from, date_to)
+
+
+# =====================================================================
+# VISTAS MATERIALIZADAS
+# =====================================================================
+
+@app.command("refresh-views")
+def refresh_views(
+    listen: bool = typer.Option(False, "--listen", help="Escuchar 'matches_changed' y refrescar al recibir cambios"),
+    debounce: float = typer.Option(30.0, help="Segundos para agrupar notificaciones (--listen)"),
+):
+    """
+    Refresca mv_league_avgs, mv_team_recent_strengths y mv_model_daily_metrics.
+
+    Ejecutar nightly y después de cargar resultados, o dejarlo con --listen.
+    """
+    from src.db import engine
+    from .materialized_views import refresh_materialized_views, listen_and_refresh
+
+    typer.echo("🔄 Refrescando vistas materializadas...")
+    refresh_materialized_views(engine)
+
+    if listen:
+        listen_and_refresh(engine, debounce_s=debounce)
 
 
 if __name__ == "__main__":
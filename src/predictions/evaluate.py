@@ -1,14 +1,101 @@
 
 from __future__ import annotations
+from functools import lru_cache
 from typing import Optional, List, Tuple, Dict, Any
-from math import sqrt
-from sqlalchemy import text
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from sqlalchemy import Integer, String, bindparam, text
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.dialects.postgresql import ARRAY
 from src.db import engine
+from .materialized_views import try_refresh_view
+
+# Índice 0/1/2 -> pick 1X2 (mismo orden que prob_home_win/prob_draw/prob_away_win)
+_PICKS_1X2 = ("1", "X", "2")
+_PICKS_1X2_ARR = np.array(_PICKS_1X2)
+# weinston_predictions.result_1x2: 1 = local, 2 = visitante, resto = empate
+_WEINSTON_PICKS = {1: "1", 2: "2"}
+
+_SELECT_BASE = """
+    SELECT
+      m.id AS mid, m.season_id, m.date, m.home_goals, m.away_goals,
+      pp.prob_home_win, pp.prob_draw, pp.prob_away_win,
+      pp.over_2, pp.under_2, pp.both_score, pp.both_noscore,
+      wp.local_goals, wp.away_goals AS w_away_goals,
+      wp.result_1x2,
+      wp.over_2 AS win_over2,
+      wp.both_score AS win_btts
+    FROM matches m
+    LEFT JOIN poisson_predictions pp ON pp.match_id = m.id
+    LEFT JOIN weinston_predictions wp ON wp.match_id = m.id
+    WHERE m.season_id = :season_id
+      AND m.home_goals IS NOT NULL
+      AND m.away_goals IS NOT NULL
+"""
+
+@lru_cache(maxsize=8)
+def _select_stmt(has_from: bool, has_to: bool, has_ids: bool) -> TextClause:
+    """
+    SELECT especializado por forma de filtros (hay 8 combinaciones).
+
+    Cada forma tiene su propio SQL fijo, así SQLAlchemy reutiliza la
+    compilación y Postgres ve un predicado sin ramas "IS NULL OR ...".
+    """
+    sql = _SELECT_BASE
+    binds = [bindparam("season_id", type_=Integer())]
+    if has_from:
+        sql += "      AND m.date >= CAST(:date_from AS date)\n"
+        binds.append(bindparam("date_from", type_=String()))
+    if has_to:
+        sql += "      AND m.date <= CAST(:date_to AS date)\n"
+        binds.append(bindparam("date_to", type_=String()))
+    if has_ids:
+        sql += "      AND m.id = ANY(:ids)\n"
+        binds.append(bindparam("ids", type_=ARRAY(Integer())))
+    sql += "    ORDER BY m.date, m.id\n"
+    return text(sql).bindparams(*binds)
+
+# Upsert por lotes con psycopg2.extras.execute_values: un INSERT multi-VALUES
+# por página (executemany de psycopg2 manda un INSERT por fila)
+_UPSERT_OUTCOMES = """
+  INSERT INTO prediction_outcomes (
+    match_id, model,
+    pick_1x2, hit_1x2,
+    pick_over25, hit_over25,
+    pick_btts, hit_btts,
+    abs_err_home_goals, abs_err_away_goals, rmse_goals,
+    updated_at
+  )
+  VALUES %s
+  ON CONFLICT (match_id, model) DO UPDATE SET
+    pick_1x2 = EXCLUDED.pick_1x2,
+    hit_1x2 = EXCLUDED.hit_1x2,
+    pick_over25 = EXCLUDED.pick_over25,
+    hit_over25 = EXCLUDED.hit_over25,
+    pick_btts = EXCLUDED.pick_btts,
+    hit_btts = EXCLUDED.hit_btts,
+    abs_err_home_goals = EXCLUDED.abs_err_home_goals,
+    abs_err_away_goals = EXCLUDED.abs_err_away_goals,
+    rmse_goals = EXCLUDED.rmse_goals,
+    updated_at = now()
+"""
+
+_UPSERT_OUTCOMES_TEMPLATE = """(
+    %(mid)s, %(model)s,
+    %(p1x2)s, %(h1x2)s,
+    %(pover)s, %(hover)s,
+    %(pbtts)s, %(hbtts)s,
+    %(ae_h)s, %(ae_a)s, %(rmse)s,
+    now()
+)"""
+
+# Filas por INSERT multi-VALUES (mismo valor que upcoming_poisson / upcoming_weinston)
+UPSERT_PAGE_SIZE = 500
 
 def _res_1x2(hg: int, ag: int) -> str:
-    if hg > ag: return "1"
-    if hg < ag: return "2"
-    return "X"
+    # 1 - sign(hg - ag): local gana -> 0, empate -> 1, visitante gana -> 2
+    return _PICKS_1X2[(hg < ag) - (hg > ag) + 1]
 
 def _over25(hg: int, ag: int) -> str:
     total_goals = hg + ag
@@ -26,10 +113,121 @@ def _normalize_string(value: Any) -> Optional[str]:
     return str_value
 
 def _argmax_1x2(ph: float, px: float, pa: float) -> str:
-    m = max(ph, px, pa)
-    if m == ph: return "1"
-    if m == px: return "X"
-    return "2"
+    # En empate gana el primero (1 > X > 2), igual que np.argmax
+    return _PICKS_1X2[0 if (ph >= px and ph >= pa) else (1 if px >= pa else 2)]
+
+def _num(df: pd.DataFrame, col: str) -> np.ndarray:
+    """Columna como float64 (None/Decimal -> NaN/float)."""
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+
+def _fetch(conn, params: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Fase 1: trae partidos + predicciones de ambos modelos en un solo SELECT
+    y agrega el resultado real (act_1x2 / act_over / act_btts).
+    """
+    stmt = _select_stmt("date_from" in params, "date_to" in params, "ids" in params)
+    result = conn.execute(stmt, params)
+    df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    if df.empty:
+        return df
+
+    hg = _num(df, "home_goals")
+    ag = _num(df, "away_goals")
+    # Partidos sin resultado (el WHERE ya los excluye, se mantiene por seguridad)
+    df["has_result"] = ~(np.isnan(hg) | np.isnan(ag))
+
+    hg = np.nan_to_num(hg).astype(np.int64)
+    ag = np.nan_to_num(ag).astype(np.int64)
+    df["act_1x2"] = _PICKS_1X2_ARR[1 - np.sign(hg - ag)]
+    df["act_over"] = (hg + ag) >= 3
+    df["act_btts"] = (hg > 0) & (ag > 0)
+    df["hg"] = hg
+    df["ag"] = ag
+    return df
+
+def _compute_poisson(
+    df: pd.DataFrame,
+    pick_over_thresh: float,
+    pick_btts_thresh: float,
+) -> pd.DataFrame:
+    """Fase 2 (Poisson): picks y aciertos vectorizados, una fila por partido."""
+    ph = _num(df, "prob_home_win")
+    d = df[df["has_result"].to_numpy() & ~np.isnan(ph)]
+
+    probs = np.nan_to_num(np.column_stack([
+        _num(d, "prob_home_win"), _num(d, "prob_draw"), _num(d, "prob_away_win"),
+    ]))
+    pick_over_b = np.nan_to_num(_num(d, "over_2")) >= pick_over_thresh
+    pick_btts_b = np.nan_to_num(_num(d, "both_score")) >= pick_btts_thresh
+
+    # np.argmax devuelve el primer máximo: mismo desempate que _argmax_1x2
+    pick_1x2 = _PICKS_1X2_ARR[np.argmax(probs, axis=1)] if len(d) else np.array([], dtype=str)
+
+    return pd.DataFrame({
+        "mid": d["mid"].to_numpy(),
+        "model": "poisson",
+        "p1x2": pick_1x2,
+        "h1x2": pick_1x2 == d["act_1x2"].to_numpy(),
+        "pover": np.where(pick_over_b, "OVER", "UNDER"),
+        "hover": pick_over_b == d["act_over"].to_numpy(),
+        "pbtts": np.where(pick_btts_b, "YES", "NO"),
+        "hbtts": pick_btts_b == d["act_btts"].to_numpy(),
+        "ae_h": None, "ae_a": None, "rmse": None,
+    })
+
+def _compute_weinston(df: pd.DataFrame) -> pd.DataFrame:
+    """Fase 2 (Weinston): errores de goles y picks, una fila por partido."""
+    lh = _num(df, "local_goals")
+    d = df[df["has_result"].to_numpy() & ~np.isnan(lh)]
+
+    lh = _num(d, "local_goals")
+    la = np.nan_to_num(_num(d, "w_away_goals"))
+    hg = d["hg"].to_numpy()
+    ag = d["ag"].to_numpy()
+
+    # 1X2: 1 = local, 2 = visitante, resto = empate; NULL -> sin pick
+    wr = d["result_1x2"]
+    pick_1x2 = wr.map(lambda v: None if v is None or pd.isna(v) else _WEINSTON_PICKS.get(v, "X"))
+    hit_1x2 = (pick_1x2 == d["act_1x2"]).where(pick_1x2.notna(), None)
+
+    # ✅ FIX: Use same logic as /api/recalculate-outcomes for consistency
+    over_raw = d["win_over2"].map(_normalize_string, na_action="ignore")
+    btts_raw = d["win_btts"].map(_normalize_string, na_action="ignore")
+
+    # Ensure valid values (matching recalculate-outcomes logic)
+    pick_over = over_raw.where(over_raw.isin(["OVER", "UNDER"]), "UNDER")
+    pick_btts = np.where(btts_raw == "YES", "YES", "NO")
+
+    act_over = np.where(d["act_over"].to_numpy(), "OVER", "UNDER")
+    act_btts = np.where(d["act_btts"].to_numpy(), "YES", "NO")
+    hit_over = pd.Series(pick_over.to_numpy() == act_over, index=d.index).where(over_raw.notna(), None)
+    hit_btts = pd.Series(pick_btts == act_btts, index=d.index).where(btts_raw.notna(), None)
+
+    return pd.DataFrame({
+        "mid": d["mid"].to_numpy(),
+        "model": "weinston",
+        "p1x2": pick_1x2.to_numpy(dtype=object),
+        "h1x2": hit_1x2.to_numpy(dtype=object),
+        "pover": pick_over.to_numpy(dtype=object),
+        "hover": hit_over.to_numpy(dtype=object),
+        "pbtts": pick_btts,
+        "hbtts": hit_btts.to_numpy(dtype=object),
+        "ae_h": np.abs(lh - hg),
+        "ae_a": np.abs(la - ag),
+        "rmse": np.sqrt(((lh - hg) ** 2 + (la - ag) ** 2) / 2.0),
+    })
+
+def _upsert(conn, out: pd.DataFrame) -> int:
+    """Fase 3: upsert por lotes (execute_values) sobre prediction_outcomes."""
+    if out.empty:
+        return 0
+    # Tipos nativos de Python y NaN -> None para el driver
+    payload = out.astype(object).where(out.notna(), None).to_dict("records")
+    # Mismo cursor/transacción que conn
+    with conn.connection.cursor() as cur:
+        execute_values(cur, _UPSERT_OUTCOMES, payload,
+                       template=_UPSERT_OUTCOMES_TEMPLATE, page_size=UPSERT_PAGE_SIZE)
+    return len(payload)
 
 def evaluate(
     season_id: int,
@@ -41,64 +239,17 @@ def evaluate(
 ) -> Dict[str, int]:
     """
     Crea/actualiza prediction_outcomes para ambos modelos.
-    """
-    base = """
-    SELECT
-      m.id AS mid, m.season_id, m.date, m.home_goals, m.away_goals,
-      pp.prob_home_win, pp.prob_draw, pp.prob_away_win,
-      pp.over_2, pp.under_2, pp.both_score, pp.both_noscore,
-      wp.local_goals, wp.away_goals,
-      wp.result_1x2,
-      wp.over_2 AS win_over2,
-      wp.both_score AS win_btts
-    FROM matches m
-    LEFT JOIN poisson_predictions pp ON pp.match_id = m.id
-    LEFT JOIN weinston_predictions wp ON wp.match_id = m.id
-    WHERE m.season_id = :season_id
-      AND m.home_goals IS NOT NULL
-      AND m.away_goals IS NOT NULL
+
+    Tres fases: un SELECT (_fetch), cálculo vectorizado por modelo
+    (_compute_poisson / _compute_weinston) y un upsert por lotes (_upsert).
     """
     params: Dict[str, Any] = {"season_id": season_id}
     if date_from:
-        base += " AND m.date >= :date_from"
         params["date_from"] = date_from
     if date_to:
-        base += " AND m.date <= :date_to"
         params["date_to"] = date_to
     if only_matches:
-        base += " AND m.id = ANY(:ids)"
-        params["ids"] = only_matches
-    base += " ORDER BY m.date, m.id"
-
-    upsert = text("""
-      INSERT INTO prediction_outcomes (
-        match_id, model,
-        pick_1x2, hit_1x2,
-        pick_over25, hit_over25,
-        pick_btts, hit_btts,
-        abs_err_home_goals, abs_err_away_goals, rmse_goals,
-        updated_at
-      )
-      VALUES (
-        :mid, :model,
-        :p1x2, :h1x2,
-        :pover, :hover,
-        :pbtts, :hbtts,
-        :ae_h, :ae_a, :rmse,
-        now()
-      )
-      ON CONFLICT (match_id, model) DO UPDATE SET
-        pick_1x2 = EXCLUDED.pick_1x2,
-        hit_1x2 = EXCLUDED.hit_1x2,
-        pick_over25 = EXCLUDED.pick_over25,
-        hit_over25 = EXCLUDED.hit_over25,
-        pick_btts = EXCLUDED.pick_btts,
-        hit_btts = EXCLUDED.hit_btts,
-        abs_err_home_goals = EXCLUDED.abs_err_home_goals,
-        abs_err_away_goals = EXCLUDED.abs_err_away_goals,
-        rmse_goals = EXCLUDED.rmse_goals,
-        updated_at = now();
-    """)
+        params["ids"] = list(only_matches)
 
     counters = {"poisson": 0, "weinston": 0}
     skipped = {"no_result": 0, "no_predictions": 0}
@@ -107,137 +258,21 @@ def evaluate(
     print(f"📅 Rango de fechas: {date_from} a {date_to}")
 
     with engine.begin() as conn:
-        rows = conn.execute(text(base), params).mappings().all()
-        
-        print(f"📊 Total partidos encontrados: {len(rows)}")
-        
-        for i, r in enumerate(rows):
-            mid = r["mid"]
-            
-            # ✅ NUEVO: Verificar home_goals y away_goals
-            if r["home_goals"] is None or r["away_goals"] is None:
-                print(f"\n⚠️  PARTIDO {i+1}/{len(rows)} - Match ID: {mid}")
-                print(f"   ⚠️  Sin resultado cargado (home_goals o away_goals es NULL)")
-                print(f"   ⏭️  Saltando...\n")
-                skipped["no_result"] += 1
-                continue
-            
-            hg, ag = int(r["home_goals"]), int(r["away_goals"])
-            
-            # ✅ NUEVO: Verificar si hay predicciones
-            if r["prob_home_win"] is None and r["local_goals"] is None:
-                print(f"\n⚠️  PARTIDO {i+1}/{len(rows)} - Match ID: {mid}")
-                print(f"   Resultado: {hg}-{ag}")
-                print(f"   ❌ NO HAY PREDICCIONES para este partido")
-                print(f"   💡 Ejecuta: python update_predictions.py → Opción 3 (PREDICT)")
-                print(f"   ⏭️  Saltando...\n")
-                skipped["no_predictions"] += 1
-                continue
-            
-            print(f"\n🏈 PARTIDO {i+1}/{len(rows)} - Match ID: {mid}")
-            print(f"   Resultado real: {hg}-{ag}")
-            
-            # Calcular resultados reales
-            act_1x2 = _res_1x2(hg, ag)
-            act_over = _over25(hg, ag)
-            act_btts = _btts(hg, ag)
-            
-            print(f"   Resultados reales: 1X2={act_1x2}, O/U={act_over}, BTTS={act_btts}")
-
-            # --- POISSON ---
-            if r["prob_home_win"] is not None:
-                ph = float(r["prob_home_win"] or 0.0)
-                px = float(r["prob_draw"] or 0.0)
-                pa = float(r["prob_away_win"] or 0.0)
-                p_over = float(r["over_2"] or 0.0)
-                p_btts = float(r["both_score"] or 0.0)
-
-                pick_1x2 = _argmax_1x2(ph, px, pa)
-                pick_over = "OVER" if p_over >= pick_over_thresh else "UNDER"
-                pick_btts = "YES" if p_btts >= pick_btts_thresh else "NO"
-                
-                hit_1x2 = (pick_1x2 == act_1x2)
-                hit_over = (pick_over == act_over)
-                hit_btts = (pick_btts == act_btts)
-                
-                print(f"   Poisson predicciones: 1X2={pick_1x2}, O/U={pick_over}, BTTS={pick_btts}")
-                print(f"   Poisson aciertos: 1X2={hit_1x2}, O/U={hit_over}, BTTS={hit_btts}")
-
-                conn.execute(upsert, {
-                    "mid": mid, "model": "poisson",
-                    "p1x2": pick_1x2, "h1x2": hit_1x2,
-                    "pover": pick_over, "hover": hit_over,
-                    "pbtts": pick_btts, "hbtts": hit_btts,
-                    "ae_h": None, "ae_a": None, "rmse": None
-                })
-                counters["poisson"] += 1
-            else:
-                print(f"   ⚠️  No hay predicciones Poisson para este partido")
-
-            # --- WEINSTON ---
-            if r["local_goals"] is not None:
-                lh = float(r["local_goals"] or 0.0)
-                la = float(r["away_goals"] or 0.0)
-                
-                print(f"   Weinston goles predichos: {lh:.2f}-{la:.2f}")
-                print(f"   Weinston datos raw: over_2='{r['win_over2']}', btts='{r['win_btts']}', result_1x2='{r['result_1x2']}'")
-                
-                wr = r["result_1x2"]
-                if wr is None:
-                    pick_w_1x2 = None
-                    hit_w_1x2 = None
-                    print(f"   Weinston 1X2: No hay predicción")
-                else:
-                    pick_w_1x2 = "1" if wr == 1 else ("2" if wr == 2 else "X")
-                    hit_w_1x2 = (pick_w_1x2 == act_1x2)
-                    print(f"   Weinston 1X2: {pick_w_1x2} (acierto: {hit_w_1x2})")
-                
-                # ✅ FIX: Use same logic as /api/recalculate-outcomes for consistency
-                pick_w_over_raw = _normalize_string(r["win_over2"])
-                pick_w_btts_raw = _normalize_string(r["win_btts"])
-
-                # Ensure valid values (matching recalculate-outcomes logic)
-                pick_w_over = pick_w_over_raw if pick_w_over_raw in ['OVER', 'UNDER'] else 'UNDER'
-                pick_w_btts = 'YES' if (pick_w_btts_raw == 'YES') else 'NO'
-
-                print(f"   Weinston raw: over='{pick_w_over_raw}', btts='{pick_w_btts_raw}'")
-                print(f"   Weinston normalized: over='{pick_w_over}', btts='{pick_w_btts}'")
-
-                hit_over = None
-                hit_btts = None
-
-                if pick_w_over_raw is not None:
-                    hit_over = (pick_w_over == act_over)
-                    print(f"   Weinston O/U: {pick_w_over} vs {act_over} = {hit_over}")
-                else:
-                    print(f"   Weinston O/U: No hay predicción válida")
-
-                if pick_w_btts_raw is not None:
-                    hit_btts = (pick_w_btts == act_btts)
-                    print(f"   Weinston BTTS: {pick_w_btts} vs {act_btts} = {hit_btts}")
-                else:
-                    print(f"   Weinston BTTS: No hay predicción válida")
-
-                ae_h = abs(lh - hg)
-                ae_a = abs(la - ag)
-                rmse = sqrt(((lh - hg) ** 2 + (la - ag) ** 2) / 2.0)
-                
-                print(f"   Weinston errores: RMSE={rmse:.3f}, AE_home={ae_h:.2f}, AE_away={ae_a:.2f}")
-
-                conn.execute(upsert, {
-                    "mid": mid, "model": "weinston",
-                    "p1x2": pick_w_1x2, 
-                    "h1x2": hit_w_1x2,
-                    "pover": pick_w_over, 
-                    "hover": hit_over,
-                    "pbtts": pick_w_btts, 
-                    "hbtts": hit_btts,
-                    "ae_h": ae_h, "ae_a": ae_a, "rmse": rmse
-                })
-                counters["weinston"] += 1
-            else:
-                print(f"   ⚠️  No hay predicciones Weinston para este partido")
+        df = _fetch(conn, params)
         
+        print(f"📊 Total partidos encontrados: {len(df)}")
+
+        if df.empty:
+            return counters
+
+        has_result = df["has_result"].to_numpy()
+        no_preds = has_result & np.isnan(_num(df, "prob_home_win")) & np.isnan(_num(df, "local_goals"))
+        skipped["no_result"] = int((~has_result).sum())
+        skipped["no_predictions"] = int(no_preds.sum())
+
+        counters["poisson"] = _upsert(conn, _compute_poisson(df, pick_over_thresh, pick_btts_thresh))
+        counters["weinston"] = _upsert(conn, _compute_weinston(df))
+
         print(f"\n✅ Evaluación completada:")
         print(f"   Poisson procesados: {counters['poisson']}")
         print(f"   Weinston procesados: {counters['weinston']}")
@@ -249,4 +284,7 @@ def evaluate(
             print(f"   ⚠️  Saltados (sin predicciones): {skipped['no_predictions']}")
             print(f"\n💡 TIP: Ejecuta 'python update_predictions.py' → Opción 3 (PREDICT) primero\n")
 
-    return counters
\ No newline at end of file
+    # metrics_by_model lee de esta vista; se refresca ya confirmada la evaluación
+    try_refresh_view(engine, "mv_model_daily_metrics")
+
+    return counters
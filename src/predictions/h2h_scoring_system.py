@@ -1,7 +1,7 @@
 # src/predictions/h2h_scoring_system.py
 from __future__ import annotations
 from typing import Dict, List, Optional, Tuple, Any
-from sqlalchemy import text, Connection
+from sqlalchemy import text
 from src.db import engine
 from datetime import datetime
 
@@ -21,6 +21,8 @@ def calculate_h2h_scoring(
     3. Calcula cuántas veces se cumplió cada predicción históricamente
     4. Genera una puntuación (0-12) que indica la confianza histórica
     
+    Los pasos 1-3 se resuelven en una sola consulta (_H2H_SCORING_SQL).
+    
     Returns:
         {
             "match_id": int,
@@ -36,18 +38,24 @@ def calculate_h2h_scoring(
     """
     
     with engine.begin() as conn:
-        # 1. Obtener las predicciones de Weinston para este partido
-        weinston_predictions = _get_weinston_predictions(conn, match_id)
-        if not weinston_predictions:
+        r = conn.execute(_H2H_SCORING_SQL, {
+            "match_id": match_id,
+            "home_team_id": home_team_id,
+            "away_team_id": away_team_id,
+            "current_season_id": season_id,
+            "n_recent": n_recent
+        }).fetchone()
+
+        # 1. Sin fila = sin predicciones de Weinston para este partido
+        if not r:
             return {"error": "No hay predicciones de Weinston para este partido"}
         
-        # 2. Obtener enfrentamientos directos históricos
-        h2h_matches = _get_h2h_matches(conn, home_team_id, away_team_id, season_id, match_id, n_recent)
-        if len(h2h_matches) < 3:  # Mínimo 3 partidos para análisis
-            return {"error": f"Pocos datos H2H: solo {len(h2h_matches)} partidos"}
+        # 2. Enfrentamientos directos históricos
+        if r.n_h2h < 3:  # Mínimo 3 partidos para análisis
+            return {"error": f"Pocos datos H2H: solo {r.n_h2h} partidos"}
         
-        # 3. Calcular scoring para cada estadística
-        scoring_results = _calculate_scoring_by_stat(weinston_predictions, h2h_matches, len(h2h_matches))
+        # 3. Scoring por estadística (aciertos ya contados en SQL)
+        scoring_results = _calculate_scoring_by_stat(_build_predictions(r), r)
         
         # 4. Calcular confianza general
         scores = [result["score"] for result in scoring_results.values() if result["score"] is not None]
@@ -58,116 +66,71 @@ def calculate_h2h_scoring(
 
         return {
             "match_id": match_id,
-            "total_h2h_matches": len(h2h_matches),
+            "total_h2h_matches": r.n_h2h,
             "predictions": scoring_results,
-            "h2h_matches": h2h_matches,
+            "h2h_matches": r.h2h_matches,
             "overall_confidence": round(overall_confidence, 2)
         }
 
-def _get_weinston_predictions(conn: Connection, match_id: int) -> Optional[Dict[str, Any]]:
-    """
-    Obtiene las predicciones de Weinston para un partido.
-    
-    ✅ CORREGIDO: Lee los thresholds de league_parameters según la liga del partido
-    """
-    query = text("""
+# Predicción de Weinston (con líneas de league_parameters) + últimos N
+# enfrentamientos directos + aciertos por estadística, en un solo round-trip.
+# Cada sentido del enfrentamiento es un range scan sobre
+# idx_matches_h2h_played (migrations/add_h2h_match_index.sql).
+# Una comparación contra NULL (estadística faltante) no cuenta como válida.
+_H2H_SCORING_SQL = text("""
+    WITH pred AS (
         SELECT 
-            wp.local_goals,
-            wp.away_goals,
-            wp.over_2,
+            (wp.local_goals + wp.away_goals)::float8 AS total_goals,
+            (wp.shots_home + wp.shots_away)::float8 AS total_shots,
+            (wp.shots_target_home + wp.shots_target_away)::float8 AS total_shots_target,
+            (wp.fouls_home + wp.fouls_away)::float8 AS total_fouls,
+            (wp.cards_home + wp.cards_away)::float8 AS total_cards,
+            (wp.corners_home + wp.corners_away)::float8 AS total_corners,
             wp.both_score,
-            wp.shots_home,
-            wp.shots_away,
-            wp.shots_target_home,
-            wp.shots_target_away,
-            wp.fouls_home,
-            wp.fouls_away,
-            wp.cards_home,
-            wp.cards_away,
-            wp.corners_home,
-            wp.corners_away,
-            -- ✅ NUEVO: Obtener thresholds de league_parameters
-            lp.betting_line_shots,
-            lp.betting_line_shots_ot,
-            lp.betting_line_fouls,
-            lp.betting_line_cards,
-            lp.betting_line_corners
+            -- ✅ Thresholds de league_parameters según la liga del partido
+            lp.betting_line_shots::float8 AS line_shots,
+            lp.betting_line_shots_ot::float8 AS line_shots_ot,
+            lp.betting_line_fouls::float8 AS line_fouls,
+            lp.betting_line_cards::float8 AS line_cards,
+            lp.betting_line_corners::float8 AS line_corners,
+            (wp.local_goals + wp.away_goals) >= 2.5 AS over_goals,
+            (wp.shots_home + wp.shots_away) >= lp.betting_line_shots AS over_shots,
+            (wp.shots_target_home + wp.shots_target_away) >= lp.betting_line_shots_ot AS over_shots_ot,
+            (wp.fouls_home + wp.fouls_away) >= lp.betting_line_fouls AS over_fouls,
+            (wp.cards_home + wp.cards_away) >= lp.betting_line_cards AS over_cards,
+            (wp.corners_home + wp.corners_away) >= lp.betting_line_corners AS over_corners
         FROM weinston_predictions wp
         JOIN matches m ON m.id = wp.match_id
         JOIN seasons s ON s.id = m.season_id
         JOIN league_parameters lp ON lp.league_id = s.league_id
         WHERE wp.match_id = :match_id
-    """)
-    
-    result = conn.execute(query, {"match_id": match_id}).fetchone()
-    if not result:
-        return None
-    
-    # Calcular totales predichos
-    total_goals = float(result.local_goals) + float(result.away_goals)
-    total_shots = float(result.shots_home) + float(result.shots_away)
-    total_shots_target = float(result.shots_target_home) + float(result.shots_target_away)
-    total_fouls = float(result.fouls_home) + float(result.fouls_away)
-    total_cards = float(result.cards_home) + float(result.cards_away)
-    total_corners = float(result.corners_home) + float(result.corners_away)
-    
-    # ✅ Usar thresholds de league_parameters
-    line_shots = float(result.betting_line_shots)
-    line_shots_ot = float(result.betting_line_shots_ot)
-    line_fouls = float(result.betting_line_fouls)
-    line_cards = float(result.betting_line_cards)
-    line_corners = float(result.betting_line_corners)
-    
-    return {
-        "goles": {
-            "predicted_total": total_goals,
-            "line": 2.5,  # Este sí es universal
-            "prediction": "OVER_2_5" if total_goals >= 2.5 else "UNDER_2_5"
-        },
-        "tiros": {
-            "predicted_total": total_shots,
-            "line": line_shots,  # ✅ Dinámico por liga
-            "prediction": f"OVER_{line_shots}" if total_shots >= line_shots else f"UNDER_{line_shots}"
-        },
-        "tiros_al_arco": {
-            "predicted_total": total_shots_target,
-            "line": line_shots_ot,  # ✅ Dinámico por liga
-            "prediction": f"OVER_{line_shots_ot}" if total_shots_target >= line_shots_ot else f"UNDER_{line_shots_ot}"
-        },
-        "faltas": {
-            "predicted_total": total_fouls,
-            "line": line_fouls,  # ✅ Dinámico por liga
-            "prediction": f"OVER_{line_fouls}" if total_fouls >= line_fouls else f"UNDER_{line_fouls}"
-        },
-        "tarjetas": {
-            "predicted_total": total_cards,
-            "line": line_cards,  # ✅ Dinámico por liga
-            "prediction": f"OVER_{line_cards}" if total_cards >= line_cards else f"UNDER_{line_cards}"
-        },
-        "corners": {
-            "predicted_total": total_corners,
-            "line": line_corners,  # ✅ Dinámico por liga
-            "prediction": f"OVER_{line_corners}" if total_corners >= line_corners else f"UNDER_{line_corners}"
-        },
-        "btts": {
-            "prediction": result.both_score  # "YES" o "NO"
-        }
-    }
-
-def _get_h2h_matches(
-    conn: Connection, 
-    home_team_id: int, 
-    away_team_id: int, 
-    current_season_id: int,
-    match_id: int,
-    n_recent: int
-) -> List[Dict[str, Any]]:
-    """
-    Obtiene los últimos N enfrentamientos directos entre estos equipos.
-    Incluye tanto partidos donde home_team jugó de local vs away_team,
-    como partidos donde away_team jugó de local vs home_team.
-    """
-    query = text("""
+    ),
+    h2h_ids AS (
+        (
+            SELECT id, date FROM matches
+            WHERE home_team_id = :home_team_id AND away_team_id = :away_team_id
+              AND season_id <= :current_season_id  -- Incluir temporada actual y anteriores
+              AND home_goals IS NOT NULL  -- Solo partidos finalizados
+              AND away_goals IS NOT NULL
+              AND id != :match_id  -- Excluir el partido actual que estamos analizando
+            ORDER BY date DESC
+            LIMIT :n_recent
+        )
+        UNION ALL
+        (
+            SELECT id, date FROM matches
+            WHERE home_team_id = :away_team_id AND away_team_id = :home_team_id
+              AND season_id <= :current_season_id
+              AND home_goals IS NOT NULL
+              AND away_goals IS NOT NULL
+              AND id != :match_id
+            ORDER BY date DESC
+            LIMIT :n_recent
+        )
+        ORDER BY date DESC
+        LIMIT :n_recent
+    ),
+    h2h AS (
         SELECT 
             m.id,
             m.date,
@@ -207,218 +170,113 @@ def _get_h2h_matches(
             CASE WHEN (m.home_goals + m.away_goals) >= 3 THEN TRUE ELSE FALSE END as over_25,
             CASE WHEN m.home_goals > 0 AND m.away_goals > 0 THEN TRUE ELSE FALSE END as btts
             
-        FROM matches m
+        FROM h2h_ids
+        JOIN matches m ON m.id = h2h_ids.id
         JOIN teams th ON th.id = m.home_team_id
         JOIN teams ta ON ta.id = m.away_team_id
         JOIN seasons s ON s.id = m.season_id
         LEFT JOIN match_stats ms ON ms.match_id = m.id
-        
-        WHERE m.season_id <= :current_season_id  -- Incluir temporada actual y anteriores
-          AND m.home_goals IS NOT NULL  -- Solo partidos finalizados
-          AND m.away_goals IS NOT NULL
-          AND m.id != :match_id  -- Excluir el partido actual que estamos analizando
-          AND (
-              (m.home_team_id = :home_team_id AND m.away_team_id = :away_team_id) OR
-              (m.home_team_id = :away_team_id AND m.away_team_id = :home_team_id)
-          )
-        
-        ORDER BY m.date DESC
-        LIMIT :n_recent
-    """)
-    
-    results = conn.execute(query, {
-        "home_team_id": home_team_id,
-        "away_team_id": away_team_id,
-        "current_season_id": current_season_id,
-        "match_id": match_id,
-        "n_recent": n_recent
-    }).mappings().all()
+    )
+    SELECT
+        pred.*,
+        agg.*
+    FROM pred
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*)::int AS n_h2h,
+            COUNT(h.total_goals)::int AS goles_valid,
+            COUNT(*) FILTER (WHERE (h.total_goals >= 2.5) = pred.over_goals)::int AS goles_hits,
+            COUNT(h.total_shots)::int AS tiros_valid,
+            COUNT(*) FILTER (WHERE (h.total_shots >= pred.line_shots) = pred.over_shots)::int AS tiros_hits,
+            COUNT(h.total_shots_target)::int AS tiros_al_arco_valid,
+            COUNT(*) FILTER (WHERE (h.total_shots_target >= pred.line_shots_ot) = pred.over_shots_ot)::int AS tiros_al_arco_hits,
+            COUNT(h.total_fouls)::int AS faltas_valid,
+            COUNT(*) FILTER (WHERE (h.total_fouls >= pred.line_fouls) = pred.over_fouls)::int AS faltas_hits,
+            COUNT(h.total_cards)::int AS tarjetas_valid,
+            COUNT(*) FILTER (WHERE (h.total_cards >= pred.line_cards) = pred.over_cards)::int AS tarjetas_hits,
+            COUNT(h.total_corners)::int AS corners_valid,
+            COUNT(*) FILTER (WHERE (h.total_corners >= pred.line_corners) = pred.over_corners)::int AS corners_hits,
+            COUNT(h.btts)::int AS btts_valid,
+            COUNT(*) FILTER (WHERE h.btts = (pred.both_score = 'YES'))::int AS btts_hits,
+            COALESCE(json_agg(h ORDER BY h.date DESC), '[]'::json) AS h2h_matches
+        FROM h2h h
+    ) agg
+""")
+
+def _over_under(predicted_total: Any, line: Any, over: Any, label: str) -> Optional[Dict[str, Any]]:
+    """
+    Predicción OVER/UNDER de una estadística.
+
+    over es NULL cuando falta la estadística de Weinston o la línea de la liga
+    (p. ej. filas del backfill sin match_stats): sin decisión no hay
+    predicción, así que devuelve None en vez de etiquetarla UNDER.
+    """
+    if over is None:
+        return None
+    return {
+        "predicted_total": predicted_total,
+        "line": line,
+        "prediction": f"OVER_{label}" if over else f"UNDER_{label}"
+    }
+
+def _build_predictions(r: Any) -> Dict[str, Any]:
+    """
+    Arma el dict de predicciones de Weinston a partir de la fila de _H2H_SCORING_SQL.
     
-    return [dict(row) for row in results]
+    ✅ CORREGIDO: Los thresholds vienen de league_parameters según la liga del partido
+    Las estadísticas sin decisión (valor o línea NULL) quedan fuera del dict.
+    """
+    # El label conserva el formato de Python (OVER_10.0), por eso se arma aquí
+    predictions = {
+        "goles": _over_under(r.total_goals, 2.5, r.over_goals, "2_5"),  # Línea universal
+        # ✅ Líneas dinámicas por liga
+        "tiros": _over_under(r.total_shots, r.line_shots, r.over_shots, r.line_shots),
+        "tiros_al_arco": _over_under(r.total_shots_target, r.line_shots_ot, r.over_shots_ot, r.line_shots_ot),
+        "faltas": _over_under(r.total_fouls, r.line_fouls, r.over_fouls, r.line_fouls),
+        "tarjetas": _over_under(r.total_cards, r.line_cards, r.over_cards, r.line_cards),
+        "corners": _over_under(r.total_corners, r.line_corners, r.over_corners, r.line_corners),
+        "btts": {
+            "prediction": r.both_score  # "YES" o "NO"
+        }
+    }
+    return {key: pred for key, pred in predictions.items() if pred is not None}
+
+# (clave de predicción, columna de aciertos, columna de partidos válidos)
+# de _H2H_SCORING_SQL, en el orden en que se reportan
+_SCORED_STATS: List[Tuple[str, str, str]] = [
+    (key, f"{key}_hits", f"{key}_valid")
+    for key in ("goles", "tiros", "tiros_al_arco", "faltas", "tarjetas", "corners", "btts")
+]
 
 def _calculate_scoring_by_stat(
     predictions: Dict[str, Any], 
-    h2h_matches: List[Dict[str, Any]], 
-    total_matches: int
+    counts: Any
 ) -> Dict[str, Dict[str, Any]]:
     """
-    Calcula el scoring para cada estadística comparando la predicción 
-    con el historial de enfrentamientos directos.
+    Arma el scoring de cada estadística a partir de los aciertos contados
+    en SQL (columnas <clave>_hits / <clave>_valid de _H2H_SCORING_SQL).
     """
     results = {}
-    
-    # 1. GOLES
-    if "goles" in predictions:
-        pred = predictions["goles"]
-        hit_count = 0
-        valid_matches = 0
-        
-        for match in h2h_matches:
-            if match["total_goals"] is not None:
-                valid_matches += 1
-                actual_over_25 = match["total_goals"] >= 3
-                predicted_over_25 = pred["prediction"] == "OVER_2_5"
-                
-                if actual_over_25 == predicted_over_25:
-                    hit_count += 1
-        
-        results["goles"] = {
-            "prediction": pred["prediction"],
-            "predicted_total": pred["predicted_total"],
-            "line": pred["line"],
-            "hit_count": hit_count,
-            "valid_matches": valid_matches,
-            "score": hit_count if valid_matches > 0 else None,
-            "percentage": round(hit_count / valid_matches * 100, 1) if valid_matches > 0 else None
-        }
-    
-    # 2. TIROS
-    if "tiros" in predictions:
-        pred = predictions["tiros"]
-        hit_count = 0
-        valid_matches = 0
-        
-        for match in h2h_matches:
-            if match["total_shots"] is not None:
-                valid_matches += 1
-                actual_over = match["total_shots"] >= pred["line"]
-                predicted_over = pred["prediction"].startswith("OVER")
-                
-                if actual_over == predicted_over:
-                    hit_count += 1
-        
-        results["tiros"] = {
-            "prediction": pred["prediction"],
-            "predicted_total": pred["predicted_total"],
-            "line": pred["line"],
-            "hit_count": hit_count,
-            "valid_matches": valid_matches,
-            "score": hit_count if valid_matches > 0 else None,
-            "percentage": round(hit_count / valid_matches * 100, 1) if valid_matches > 0 else None
-        }
-    
-    # 3. TIROS AL ARCO
-    if "tiros_al_arco" in predictions:
-        pred = predictions["tiros_al_arco"]
-        hit_count = 0
-        valid_matches = 0
-        
-        for match in h2h_matches:
-            if match["total_shots_target"] is not None:
-                valid_matches += 1
-                actual_over = match["total_shots_target"] >= pred["line"]
-                predicted_over = pred["prediction"].startswith("OVER")
-                
-                if actual_over == predicted_over:
-                    hit_count += 1
-        
-        results["tiros_al_arco"] = {
-            "prediction": pred["prediction"],
-            "predicted_total": pred["predicted_total"],
-            "line": pred["line"],
-            "hit_count": hit_count,
-            "valid_matches": valid_matches,
-            "score": hit_count if valid_matches > 0 else None,
-            "percentage": round(hit_count / valid_matches * 100, 1) if valid_matches > 0 else None
-        }
-    
-    # 4. FALTAS
-    if "faltas" in predictions:
-        pred = predictions["faltas"]
-        hit_count = 0
-        valid_matches = 0
-        
-        for match in h2h_matches:
-            if match["total_fouls"] is not None:
-                valid_matches += 1
-                actual_over = match["total_fouls"] >= pred["line"]
-                predicted_over = pred["prediction"].startswith("OVER")
-                
-                if actual_over == predicted_over:
-                    hit_count += 1
-        
-        results["faltas"] = {
-            "prediction": pred["prediction"],
-            "predicted_total": pred["predicted_total"],
-            "line": pred["line"],
-            "hit_count": hit_count,
-            "valid_matches": valid_matches,
-            "score": hit_count if valid_matches > 0 else None,
-            "percentage": round(hit_count / valid_matches * 100, 1) if valid_matches > 0 else None
-        }
-    
-    # 5. TARJETAS
-    if "tarjetas" in predictions:
-        pred = predictions["tarjetas"]
-        hit_count = 0
-        valid_matches = 0
-        
-        for match in h2h_matches:
-            if match["total_cards"] is not None:
-                valid_matches += 1
-                actual_over = match["total_cards"] >= pred["line"]
-                predicted_over = pred["prediction"].startswith("OVER")
-                
-                if actual_over == predicted_over:
-                    hit_count += 1
-        
-        results["tarjetas"] = {
-            "prediction": pred["prediction"],
-            "predicted_total": pred["predicted_total"],
-            "line": pred["line"],
-            "hit_count": hit_count,
-            "valid_matches": valid_matches,
-            "score": hit_count if valid_matches > 0 else None,
-            "percentage": round(hit_count / valid_matches * 100, 1) if valid_matches > 0 else None
-        }
-    
-    # 6. CORNERS
-    if "corners" in predictions:
-        pred = predictions["corners"]
-        hit_count = 0
-        valid_matches = 0
-        
-        for match in h2h_matches:
-            if match["total_corners"] is not None:
-                valid_matches += 1
-                actual_over = match["total_corners"] >= pred["line"]
-                predicted_over = pred["prediction"].startswith("OVER")
-                
-                if actual_over == predicted_over:
-                    hit_count += 1
-        
-        results["corners"] = {
-            "prediction": pred["prediction"],
-            "predicted_total": pred["predicted_total"],
-            "line": pred["line"],
-            "hit_count": hit_count,
-            "valid_matches": valid_matches,
-            "score": hit_count if valid_matches > 0 else None,
-            "percentage": round(hit_count / valid_matches * 100, 1) if valid_matches > 0 else None
-        }
-    
-    # 7. BTTS
-    if "btts" in predictions:
-        pred = predictions["btts"]
-        hit_count = 0
-        valid_matches = 0
-        
-        for match in h2h_matches:
-            if match["btts"] is not None:
-                valid_matches += 1
-                actual_btts = match["btts"]
-                predicted_btts = pred["prediction"] == "YES"
-                
-                if actual_btts == predicted_btts:
-                    hit_count += 1
-        
-        results["btts"] = {
-            "prediction": pred["prediction"],
-            "hit_count": hit_count,
-            "valid_matches": valid_matches,
-            "score": hit_count if valid_matches > 0 else None,
-            "percentage": round(hit_count / valid_matches * 100, 1) if valid_matches > 0 else None
-        }
+    get_pred = predictions.get
+
+    for key, hits_col, valid_col in _SCORED_STATS:
+        pred = get_pred(key)
+        if pred is None:
+            continue
+
+        hit_count = getattr(counts, hits_col)
+        valid_matches = getattr(counts, valid_col)
+        has_valid = valid_matches > 0
+
+        result = {"prediction": pred["prediction"]}
+        if key != "btts":
+            result["predicted_total"] = pred["predicted_total"]
+            result["line"] = pred["line"]
+        result["hit_count"] = hit_count
+        result["valid_matches"] = valid_matches
+        result["score"] = hit_count if has_valid else None
+        result["percentage"] = round(hit_count / valid_matches * 100, 1) if has_valid else None
+        results[key] = result
     
     return results
 
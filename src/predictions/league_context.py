@@ -11,13 +11,81 @@ de forma independiente, utilizando las tablas existentes:
 """
 
 from __future__ import annotations
+import logging
+import time
 from dataclasses import dataclass
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Tuple
 from sqlalchemy import text
 from sqlalchemy.engine import Connection
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+# Contextos ya cargados: (url de la BD, season_id) -> (instante de carga, contexto)
+_CONTEXT_CACHE: Dict[Tuple[str, int], Tuple[float, "LeagueContext"]] = {}
+# Segundos que un contexto se considera vigente
+CONTEXT_CACHE_TTL = 600.0
+
+
+_Q_SEASON_CONTEXT = text("""
+    SELECT 
+        s.id as season_id,
+        s.year_start || '/' || s.year_end as season_year,
+        l.id as league_id,
+        l.name as league_name,
+        l.country,
+        wp.mu_home as wp_mu_home,
+        wp.mu_away as wp_mu_away,
+        wp.home_adv as wp_home_adv,
+        lp.avg_home_goals as lp_avg_home,
+        lp.avg_away_goals as lp_avg_away,
+        lp.home_field_advantage as lp_hfa
+    FROM seasons s
+    JOIN leagues l ON l.id = s.league_id
+    LEFT JOIN weinston_params wp ON wp.season_id = s.id
+    LEFT JOIN league_parameters lp ON lp.league_id = l.id
+    WHERE s.id = :season_id
+    LIMIT 1
+""")
+
+
+_Q_SEASON_CONTEXTS = text("""
+    SELECT DISTINCT ON (s.id)
+        s.id as season_id,
+        s.year_start || '/' || s.year_end as season_year,
+        l.id as league_id,
+        l.name as league_name,
+        l.country,
+        wp.mu_home as wp_mu_home,
+        wp.mu_away as wp_mu_away,
+        wp.home_adv as wp_home_adv,
+        lp.avg_home_goals as lp_avg_home,
+        lp.avg_away_goals as lp_avg_away,
+        lp.home_field_advantage as lp_hfa
+    FROM seasons s
+    JOIN leagues l ON l.id = s.league_id
+    LEFT JOIN weinston_params wp ON wp.season_id = s.id
+    LEFT JOIN league_parameters lp ON lp.league_id = l.id
+    WHERE s.id = ANY(:season_ids)
+    ORDER BY s.id
+""")
+
+
+# Totales incrementales por liga (migrations/create_league_running_stats.sql):
+# lectura por PK en vez de AVG sobre todo el histórico.
+# Sin filtro m.date < CURRENT_DATE a propósito: un partido cuenta en cuanto
+# tiene resultado (también el mismo día), ver el comentario de la migración.
+_Q_LEAGUE_AVERAGES = text("""
+    SELECT 
+        (sum_home / NULLIF(n, 0))::float as avg_home,
+        (sum_away / NULLIF(n, 0))::float as avg_away,
+        n as sample_size
+    FROM league_running_stats
+    WHERE league_id = :league_id
+""")
+
+
+@dataclass(frozen=True)
 class LeagueContext:
     """
     Contexto de liga para predicciones.
@@ -47,6 +115,48 @@ class LeagueContext:
         """
         Carga el contexto completo de liga desde un season_id.
         
+        El resultado se cachea por (base de datos, season_id) durante
+        CONTEXT_CACHE_TTL segundos: un lote de predicciones pide el mismo
+        contexto muchas veces y es de solo lectura (dataclass frozen).
+        
+        Args:
+            conn: Conexión a la base de datos
+            season_id: ID de la temporada
+            
+        Returns:
+            LeagueContext con todos los parámetros cargados
+            
+        Raises:
+            ValueError: Si el season_id no existe o no tiene league_id
+        """
+        key = (conn.engine.url.render_as_string(hide_password=True), season_id)
+        now = time.monotonic()
+        cached = _CONTEXT_CACHE.get(key)
+        if cached is not None and now - cached[0] < CONTEXT_CACHE_TTL:
+            return cached[1]
+        
+        ctx = cls._load_from_season(conn, season_id)
+        _CONTEXT_CACHE[key] = (now, ctx)
+        return ctx
+    
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Descarta los contextos cacheados (ej: tras reentrenar parámetros)."""
+        _CONTEXT_CACHE.clear()
+    
+    @classmethod
+    def invalidate(cls, season_id: int) -> None:
+        """Descarta el contexto cacheado de una temporada (ej: tras guardar sus weinston_params)."""
+        # Varios workers pueden invalidar la misma temporada a la vez (retrain en
+        # paralelo): list() toma las claves de una vez y pop tolera las ya borradas
+        for key in [k for k in list(_CONTEXT_CACHE) if k[1] == season_id]:
+            _CONTEXT_CACHE.pop(key, None)
+    
+    @classmethod
+    def _load_from_season(cls, conn: Connection, season_id: int) -> 'LeagueContext':
+        """
+        Carga el contexto completo de liga desde un season_id (sin caché).
+        
         Prioridad de carga de parámetros:
         1. weinston_params (específico por temporada) ← Más específico
         2. league_parameters (promedio por liga)
@@ -63,35 +173,67 @@ class LeagueContext:
             ValueError: Si el season_id no existe o no tiene league_id
         """
         # Intentar cargar desde weinston_params primero (más específico)
-        query = text("""
-            SELECT 
-                s.id as season_id,
-                s.year_start || '/' || s.year_end as season_year,
-                l.id as league_id,
-                l.name as league_name,
-                l.country,
-                wp.mu_home as wp_mu_home,
-                wp.mu_away as wp_mu_away,
-                wp.home_adv as wp_home_adv,
-                lp.avg_home_goals as lp_avg_home,
-                lp.avg_away_goals as lp_avg_away,
-                lp.home_field_advantage as lp_hfa
-            FROM seasons s
-            JOIN leagues l ON l.id = s.league_id
-            LEFT JOIN weinston_params wp ON wp.season_id = s.id
-            LEFT JOIN league_parameters lp ON lp.league_id = l.id
-            WHERE s.id = :season_id
-            LIMIT 1
-        """)
-        
         try:
-            row = conn.execute(query, {"season_id": season_id}).one()
+            row = conn.execute(_Q_SEASON_CONTEXT, {"season_id": season_id}).one()
         except Exception as e:
             raise ValueError(
                 f"No se pudo cargar información para season_id={season_id}. "
                 f"Asegúrate de que existe y tiene league_id asignado. Error: {e}"
             )
         
+        return cls._from_row(conn, row, season_id)
+    
+    @classmethod
+    def from_seasons(cls, conn: Connection, season_ids: List[int]) -> Dict[int, 'LeagueContext']:
+        """
+        Carga los contextos de varias temporadas con una sola consulta.
+        
+        Usa (y alimenta) la misma caché que from_season; solo las
+        temporadas que no están cacheadas van a la base de datos.
+        
+        Args:
+            conn: Conexión a la base de datos
+            season_ids: IDs de las temporadas
+            
+        Returns:
+            Dict season_id -> LeagueContext
+            
+        Raises:
+            ValueError: Si algún season_id no existe o no tiene league_id
+        """
+        url = conn.engine.url.render_as_string(hide_password=True)
+        now = time.monotonic()
+        out: Dict[int, LeagueContext] = {}
+        missing = []
+        for sid in dict.fromkeys(season_ids):
+            cached = _CONTEXT_CACHE.get((url, sid))
+            if cached is not None and now - cached[0] < CONTEXT_CACHE_TTL:
+                out[sid] = cached[1]
+            else:
+                missing.append(sid)
+        
+        if missing:
+            rows = conn.execute(_Q_SEASON_CONTEXTS, {"season_ids": missing}).fetchall()
+            for row in rows:
+                ctx = cls._from_row(conn, row, row.season_id)
+                _CONTEXT_CACHE[(url, row.season_id)] = (now, ctx)
+                out[row.season_id] = ctx
+            
+            not_found = [sid for sid in missing if sid not in out]
+            if not_found:
+                raise ValueError(
+                    f"No se pudo cargar información para season_id={not_found}. "
+                    f"Asegúrate de que existen y tienen league_id asignado."
+                )
+        
+        return out
+    
+    @classmethod
+    def _from_row(cls, conn: Connection, row: Any, season_id: int) -> 'LeagueContext':
+        """
+        Arma el contexto desde una fila de _Q_SEASON_CONTEXT(S), aplicando
+        la prioridad weinston_params > league_parameters > cálculo dinámico.
+        """
         # Prioridad 1: weinston_params (si existe)
         if row.wp_mu_home is not None:
             avg_home = float(row.wp_mu_home)
@@ -108,18 +250,21 @@ class LeagueContext:
         
         # Prioridad 3: Cálculo dinámico (fallback)
         else:
-            print(f"⚠️  No hay parámetros precalculados para {row.league_name}")
-            print(f"   Calculando desde datos históricos...")
+            logger.warning(
+                "⚠️  No hay parámetros precalculados para %s, calculando desde datos históricos",
+                row.league_name,
+            )
             avg_home, avg_away = cls._calculate_league_averages(
                 conn, row.league_id
             )
             hfa = 1.05
             source = "cálculo dinámico"
         
-        print(f"✅ Contexto cargado desde: {source}")
-        print(f"   Liga: {row.league_name}")
-        print(f"   Promedios: {avg_home:.3f} (H) / {avg_away:.3f} (A)")
-        print(f"   HFA: {hfa:.3f}")
+        # Formato perezoso: con el nivel en WARNING no se interpola nada
+        logger.info(
+            "✅ Contexto cargado desde: %s | Liga: %s | Promedios: %.3f (H) / %.3f (A) | HFA: %.3f",
+            source, row.league_name, avg_home, avg_away, hfa,
+        )
         
         return cls(
             league_id=row.league_id,
@@ -146,27 +291,16 @@ class LeagueContext:
         Returns:
             Tuple (avg_home_goals, avg_away_goals)
         """
-        query = text("""
-            SELECT 
-                AVG(m.home_goals)::float as avg_home,
-                AVG(m.away_goals)::float as avg_away,
-                COUNT(*) as sample_size
-            FROM matches m
-            JOIN seasons s ON s.id = m.season_id
-            WHERE s.league_id = :league_id
-              AND m.home_goals IS NOT NULL
-              AND m.away_goals IS NOT NULL
-              AND m.date < CURRENT_DATE
-        """)
-        
-        row = conn.execute(query, {"league_id": league_id}).one()
+        row = conn.execute(_Q_LEAGUE_AVERAGES, {"league_id": league_id}).one_or_none()
         
-        if row.sample_size == 0:
-            print(f"⚠️  No hay datos históricos para league_id={league_id}")
-            print(f"   Usando valores por defecto (1.4, 1.1)")
+        if row is None or row.sample_size == 0:
+            logger.warning(
+                "⚠️  No hay datos históricos para league_id=%s, usando valores por defecto (1.4, 1.1)",
+                league_id,
+            )
             return 1.4, 1.1
         
-        print(f"✅ Promedios calculados desde {row.sample_size} partidos")
+        logger.info("✅ Promedios calculados desde %s partidos", row.sample_size)
         return row.avg_home or 1.4, row.avg_away or 1.1
     
     def __str__(self) -> str:
@@ -182,6 +316,9 @@ class LeagueContext:
         return self.__str__()
 
 
+_Q_LEAGUE_ID = text("SELECT league_id FROM seasons WHERE id = :sid")
+
+
 def get_league_id(conn: Connection, season_id: int) -> int:
     """
     Helper: Obtiene el league_id de un season_id.
@@ -196,8 +333,7 @@ def get_league_id(conn: Connection, season_id: int) -> int:
     Raises:
         ValueError: Si el season_id no existe o no tiene league_id
     """
-    query = text("SELECT league_id FROM seasons WHERE id = :sid")
-    result = conn.execute(query, {"sid": season_id}).scalar()
+    result = conn.execute(_Q_LEAGUE_ID, {"sid": season_id}).scalar()
     
     if result is None:
         raise ValueError(
@@ -207,6 +343,24 @@ def get_league_id(conn: Connection, season_id: int) -> int:
     return result
 
 
+_Q_ALL_LEAGUES = text("""
+    SELECT 
+        l.id,
+        l.name,
+        l.country,
+        COUNT(DISTINCT s.id) as seasons_count,
+        MIN(s.year_start) as first_season,
+        MAX(s.year_start) as latest_season,
+        COUNT(DISTINCT m.id) as total_matches
+    FROM leagues l
+    LEFT JOIN seasons s ON s.league_id = l.id
+    LEFT JOIN matches m ON m.season_id = s.id
+    GROUP BY l.id, l.name, l.country
+    HAVING COUNT(DISTINCT s.id) > 0  -- Solo ligas con temporadas
+    ORDER BY l.name
+""")
+
+
 def get_all_leagues(conn: Connection) -> list[Dict[str, Any]]:
     """
     Obtiene todas las ligas con información resumida.
@@ -217,27 +371,30 @@ def get_all_leagues(conn: Connection) -> list[Dict[str, Any]]:
     Returns:
         Lista de diccionarios con información de ligas
     """
-    query = text("""
-        SELECT 
-            l.id,
-            l.name,
-            l.country,
-            COUNT(DISTINCT s.id) as seasons_count,
-            MIN(s.year_start) as first_season,
-            MAX(s.year_start) as latest_season,
-            COUNT(DISTINCT m.id) as total_matches
-        FROM leagues l
-        LEFT JOIN seasons s ON s.league_id = l.id
-        LEFT JOIN matches m ON m.season_id = s.id
-        GROUP BY l.id, l.name, l.country
-        HAVING COUNT(DISTINCT s.id) > 0  -- Solo ligas con temporadas
-        ORDER BY l.name
-    """)
-    
-    rows = conn.execute(query).mappings().all()
+    rows = conn.execute(_Q_ALL_LEAGUES).mappings().all()
     return [dict(r) for r in rows]
 
 
+_Q_SEASONS_BY_LEAGUE = text("""
+    SELECT 
+        s.id,
+        s.year_start || '/' || s.year_end as season_name,
+        s.year_start,
+        s.year_end,
+        s.league_id,
+        l.name as league_name,
+        COUNT(m.id) as matches_count,
+        MIN(m.date) as first_match,
+        MAX(m.date) as last_match
+    FROM seasons s
+    JOIN leagues l ON l.id = s.league_id
+    LEFT JOIN matches m ON m.season_id = s.id
+    WHERE s.league_id = :league_id
+    GROUP BY s.id, s.year_start, s.year_end, s.league_id, l.name
+    ORDER BY s.year_start DESC
+""")
+
+
 def get_seasons_by_league(
     conn: Connection, 
     league_id: int
@@ -252,29 +409,24 @@ def get_seasons_by_league(
     Returns:
         Lista de diccionarios con información de temporadas
     """
-    query = text("""
-        SELECT 
-            s.id,
-            s.year_start || '/' || s.year_end as season_name,
-            s.year_start,
-            s.year_end,
-            s.league_id,
-            l.name as league_name,
-            COUNT(m.id) as matches_count,
-            MIN(m.date) as first_match,
-            MAX(m.date) as last_match
-        FROM seasons s
-        JOIN leagues l ON l.id = s.league_id
-        LEFT JOIN matches m ON m.season_id = s.id
-        WHERE s.league_id = :league_id
-        GROUP BY s.id, s.year_start, s.year_end, s.league_id, l.name
-        ORDER BY s.year_start DESC
-    """)
-    
-    rows = conn.execute(query, {"league_id": league_id}).mappings().all()
+    rows = conn.execute(_Q_SEASONS_BY_LEAGUE, {"league_id": league_id}).mappings().all()
     return [dict(r) for r in rows]
 
 
+_Q_ACTIVE_LEAGUES = text("""
+    SELECT 
+        l.id,
+        l.name,
+        l.country,
+        mv.total_matches,
+        mv.latest_season
+    FROM leagues l
+    JOIN mv_league_avgs mv ON mv.league_id = l.id
+    WHERE mv.total_matches >= :min_matches
+    ORDER BY mv.total_matches DESC
+""")
+
+
 def get_active_leagues(conn: Connection, min_matches: int = 100) -> list[Dict[str, Any]]:
     """
     Obtiene solo las ligas con suficientes datos para hacer predicciones.
@@ -286,23 +438,7 @@ def get_active_leagues(conn: Connection, min_matches: int = 100) -> list[Dict[st
     Returns:
         Lista de ligas activas
     """
-    query = text("""
-        SELECT 
-            l.id,
-            l.name,
-            l.country,
-            COUNT(DISTINCT m.id) as total_matches,
-            MAX(s.year_start) as latest_season
-        FROM leagues l
-        JOIN seasons s ON s.league_id = l.id
-        JOIN matches m ON m.season_id = s.id
-        WHERE m.home_goals IS NOT NULL
-        GROUP BY l.id, l.name, l.country
-        HAVING COUNT(DISTINCT m.id) >= :min_matches
-        ORDER BY total_matches DESC
-    """)
-    
-    rows = conn.execute(query, {"min_matches": min_matches}).mappings().all()
+    rows = conn.execute(_Q_ACTIVE_LEAGUES, {"min_matches": min_matches}).mappings().all()
     return [dict(r) for r in rows]
 
 
@@ -311,6 +447,7 @@ if __name__ == "__main__":
     from sqlalchemy import create_engine
     from src.config import settings
     
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     engine = create_engine(settings.sqlalchemy_url)
     
     with engine.begin() as conn:
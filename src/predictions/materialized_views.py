@@ -0,0 +1,132 @@
+# src/predictions/materialized_views.py
+"""
+Refresco de las vistas materializadas de predicción.
+
+Las vistas se crean en migrations/create_prediction_materialized_views.sql:
+- mv_league_avgs: promedios de goles por liga
+- mv_team_recent_strengths: últimos 20 partidos local/visitante por equipo
+- mv_model_daily_metrics: aciertos diarios por modelo
+  (migrations/create_model_daily_metrics_view.sql)
+
+Se refrescan con REFRESH ... CONCURRENTLY (no bloquea lecturas), ya sea
+a demanda, o escuchando el canal 'matches_changed' que dispara el trigger
+sobre matches. En producción las refrescan los scripts de actualización
+(refresh_prediction_inputs tras cargar resultados y antes de predecir) y el
+workflow nightly .github/workflows/refresh-views.yml.
+"""
+
+from __future__ import annotations
+import select
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+MATERIALIZED_VIEWS = (
+    "mv_league_avgs",
+    "mv_team_recent_strengths",
+    "mv_model_daily_metrics",
+)
+
+# Vistas que leen las predicciones (upcoming_core, get_active_leagues)
+PREDICTION_INPUT_VIEWS = (
+    "mv_league_avgs",
+    "mv_team_recent_strengths",
+)
+
+# Ventana con la que se construyó mv_team_recent_strengths
+MV_N_RECENT = 20
+
+
+def refresh_view(conn: Connection, view: str) -> None:
+    """Refresca una vista materializada dentro de la transacción de conn."""
+    if view not in MATERIALIZED_VIEWS:
+        raise ValueError(f"Vista materializada desconocida: {view}")
+    conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+
+
+def try_refresh_view(engine: Engine, view: str) -> bool:
+    """
+    Refresca una vista en su propia transacción, después de que el llamador
+    confirmó sus escrituras. Un fallo (p. ej. vista sin crear) se informa y
+    no se propaga: las escrituras ya están guardadas y la vista se puede
+    refrescar luego con 'refresh-views'.
+
+    Returns:
+        True si se refrescó
+    """
+    try:
+        with engine.begin() as conn:
+            refresh_view(conn, view)
+        return True
+    except Exception as e:
+        print(f"   ⚠️  No se pudo refrescar {view}: {e}")
+        print("   💡 Ejecuta 'python -m src.predictions.cli refresh-views'")
+        return False
+
+
+def refresh_prediction_inputs(engine: Engine) -> bool:
+    """
+    Refresca las vistas que leen las predicciones, cada una en su propia
+    transacción (ver try_refresh_view). Llamar después de confirmar una carga
+    de resultados y antes de predecir: las vistas fijan CURRENT_DATE al
+    refrescarse.
+
+    Returns:
+        True si se refrescaron todas
+    """
+    ok = True
+    for view in PREDICTION_INPUT_VIEWS:
+        ok = try_refresh_view(engine, view) and ok
+    return ok
+
+
+def refresh_materialized_views(engine: Engine) -> None:
+    """
+    Refresca todas las vistas materializadas de predicción.
+
+    Args:
+        engine: Engine de SQLAlchemy de la base de datos a refrescar
+    """
+    with engine.begin() as conn:
+        for view in MATERIALIZED_VIEWS:
+            refresh_view(conn, view)
+            print(f"   ✅ {view} actualizada")
+
+
+def listen_and_refresh(engine: Engine, debounce_s: float = 30.0, timeout_s: Optional[float] = None) -> None:
+    """
+    Escucha 'matches_changed' y refresca las vistas cuando llegan cambios.
+
+    Las notificaciones que llegan dentro de debounce_s se agrupan en un
+    solo refresco (una carga de resultados genera muchas).
+
+    Args:
+        engine: Engine de SQLAlchemy
+        debounce_s: Segundos de espera para agrupar notificaciones
+        timeout_s: Terminar tras este tiempo sin notificaciones (None = nunca)
+    """
+    raw = engine.raw_connection()
+    try:
+        dbapi_conn = raw.driver_connection
+        dbapi_conn.autocommit = True
+        with dbapi_conn.cursor() as cur:
+            cur.execute("LISTEN matches_changed")
+        print("👂 Escuchando 'matches_changed'...")
+
+        while True:
+            if select.select([dbapi_conn], [], [], timeout_s) == ([], [], []):
+                print("⏱️  Sin cambios, terminando")
+                return
+            dbapi_conn.poll()
+            if not dbapi_conn.notifies:
+                continue
+
+            # Agrupar la ráfaga de notificaciones en un solo refresco
+            while select.select([dbapi_conn], [], [], debounce_s) != ([], [], []):
+                dbapi_conn.poll()
+            dbapi_conn.notifies.clear()
+
+            print("🔄 Cambios en matches, refrescando vistas...")
+            refresh_materialized_views(engine)
+    finally:
+        raw.close()
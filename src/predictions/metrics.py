@@ -3,42 +3,43 @@ from typing import Optional, List, Dict, Any
 from sqlalchemy import text
 from src.db import engine
 
-def metrics_by_model(
-    season_id: int,
-    date_from: Optional[str] = None,
-    date_to: Optional[str] = None,
-) -> List[Dict[str, Any]]:
-    sql = """
+# Suma los conteos diarios de mv_model_daily_metrics
+# (migrations/create_model_daily_metrics_view.sql) en vez de recorrer
+# prediction_outcomes completo en cada request. Todo sale como float/bigint
+# (sin NUMERIC -> Decimal); NULLIF deja NULL si no hay partidos decididos.
+_Q_METRICS_BY_MODEL = text("""
     SELECT
-      po.model,
+      model,
+
+      SUM(decided_1x2)::bigint                                      AS decided_1x2,
+      SUM(hits_1x2)::bigint                                         AS hits_1x2,
+      (SUM(hits_1x2)::float / NULLIF(SUM(decided_1x2), 0))          AS acc_1x2,
 
-      COUNT(*) FILTER (WHERE po.hit_1x2 IS NOT NULL)                 AS decided_1x2,
-      COUNT(*) FILTER (WHERE po.hit_1x2 IS TRUE)                     AS hits_1x2,
-      CASE WHEN COUNT(*) FILTER (WHERE po.hit_1x2 IS NOT NULL) > 0
-           THEN AVG((po.hit_1x2)::int)::float ELSE NULL END         AS acc_1x2,
+      SUM(decided_over25)::bigint                                   AS decided_over25,
+      SUM(hits_over25)::bigint                                      AS hits_over25,
+      (SUM(hits_over25)::float / NULLIF(SUM(decided_over25), 0))    AS acc_over25,
 
-      COUNT(*) FILTER (WHERE po.hit_over25 IS NOT NULL)              AS decided_over25,
-      COUNT(*) FILTER (WHERE po.hit_over25 IS TRUE)                  AS hits_over25,
-      CASE WHEN COUNT(*) FILTER (WHERE po.hit_over25 IS NOT NULL) > 0
-           THEN AVG((po.hit_over25)::int)::float ELSE NULL END      AS acc_over25,
+      SUM(decided_btts)::bigint                                     AS decided_btts,
+      SUM(hits_btts)::bigint                                        AS hits_btts,
+      (SUM(hits_btts)::float / NULLIF(SUM(decided_btts), 0))        AS acc_btts,
 
-      COUNT(*) FILTER (WHERE po.hit_btts IS NOT NULL)                AS decided_btts,
-      COUNT(*) FILTER (WHERE po.hit_btts IS TRUE)                    AS hits_btts,
-      CASE WHEN COUNT(*) FILTER (WHERE po.hit_btts IS NOT NULL) > 0
-           THEN AVG((po.hit_btts)::int)::float ELSE NULL END        AS acc_btts,
+      (SUM(rmse_sum) / NULLIF(SUM(rmse_n), 0))::float               AS avg_rmse_goals
+    FROM mv_model_daily_metrics
+    WHERE season_id = :season_id
+      AND (CAST(:date_from AS date) IS NULL OR d >= CAST(:date_from AS date))
+      AND (CAST(:date_to AS date)   IS NULL OR d <= CAST(:date_to AS date))
+    GROUP BY model
+    ORDER BY model;
+""")
 
-      AVG(po.rmse_goals)                                            AS avg_rmse_goals
-    FROM prediction_outcomes po
-    JOIN matches m ON m.id = po.match_id
-    WHERE m.season_id = :season_id
-      AND (:date_from IS NULL OR m.date >= :date_from)
-      AND (:date_to   IS NULL OR m.date <= :date_to)
-    GROUP BY po.model
-    ORDER BY po.model;
-    """
+def metrics_by_model(
+    season_id: int,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> List[Dict[str, Any]]:
     with engine.begin() as conn:
         rows = conn.execute(
-            text(sql),
+            _Q_METRICS_BY_MODEL,
             {"season_id": season_id, "date_from": date_from, "date_to": date_to}
         ).mappings().all()
         return [dict(r) for r in rows]
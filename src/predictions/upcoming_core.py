@@ -1,14 +1,16 @@
 from __future__ import annotations
+import numpy as np
 from sqlalchemy import text
-from typing import Optional
+from typing import List, Optional
 from .league_context import LeagueContext, get_league_id
+from .materialized_views import MV_N_RECENT
 # src/predictions/upcoming_core.py
 """
 Versión REFACTORIZADA con soporte multi-liga.
 
 CAMBIOS PRINCIPALES:
 1. Importa LeagueContext
-2. load_team_strengths ahora acepta league_ctx y filtra por league_id
+2. load_team_strengths recibe el LeagueContext y filtra por league_id
 3. load_team_stat_profiles ahora acepta season_id, league_ctx y filtra por league_id
 4. Todas las queries filtran por league_id en lugar de usar datos globales
 """
@@ -24,18 +26,156 @@ CAMBIOS PRINCIPALES:
 
 
 
-def _blend(value, prior, n, k=5):
-    """Shrinkage hacia el prior de liga para pocos partidos."""
-    if value is None:
-        value = prior
+# Partidos "virtuales" al promedio de liga en el shrinkage
+SHRINK_K = 5
+
+
+def _blend(value, prior, n, k=SHRINK_K):
+    """
+    Shrinkage hacia el prior de liga para pocos partidos.
+
+    Acepta escalares o arrays NumPy (se evalúa en bloque); NaN = sin dato -> prior.
+    """
+    value = np.where(np.isnan(value), prior, value)
     return (n * value + k * prior) / (n + k)
 
 
+# Fortalezas sobre una ventana arbitraria de n_recent partidos (sin vista materializada).
+# Top-N por equipo con LATERAL: cada equipo es un range scan sobre
+# idx_matches_home_recent / idx_matches_away_recent
+# (migrations/add_team_recent_match_indexes.sql), sin ordenar toda la liga.
+_LIVE_STRENGTHS_SQL = """
+        WITH league_seasons AS (
+          SELECT id FROM seasons WHERE league_id = :comp_id
+        )
+        SELECT
+          t.id AS team_id,
+          h.n_home,
+          h.home_gf,
+          h.home_ga,
+          a.n_away,
+          a.away_gf,
+          a.away_ga
+        FROM teams t
+        CROSS JOIN LATERAL (
+          SELECT COUNT(*)                  AS n_home,
+                 AVG(r.home_goals)::float  AS home_gf,
+                 AVG(r.away_goals)::float  AS home_ga
+          FROM (
+            SELECT m.home_goals, m.away_goals
+            FROM matches m
+            WHERE m.home_team_id = t.id
+              AND m.home_goals IS NOT NULL
+              AND m.away_goals IS NOT NULL
+              AND m.date < CURRENT_DATE
+              AND m.season_id IN (SELECT id FROM league_seasons)
+            ORDER BY m.date DESC
+            LIMIT :n_recent
+          ) r
+        ) h
+        CROSS JOIN LATERAL (
+          SELECT COUNT(*)                  AS n_away,
+                 AVG(r.away_goals)::float  AS away_gf,
+                 AVG(r.home_goals)::float  AS away_ga
+          FROM (
+            SELECT m.home_goals, m.away_goals
+            FROM matches m
+            WHERE m.away_team_id = t.id
+              AND m.home_goals IS NOT NULL
+              AND m.away_goals IS NOT NULL
+              AND m.date < CURRENT_DATE
+              AND m.season_id IN (SELECT id FROM league_seasons)
+            ORDER BY m.date DESC
+            LIMIT :n_recent
+          ) r
+        ) a
+    """
+
+# Ventana por defecto: precalculada en mv_team_recent_strengths
+_MV_STRENGTHS_SQL = """
+        SELECT team_id, n_home, home_gf, home_ga, n_away, away_gf, away_ga
+        FROM mv_team_recent_strengths
+        WHERE league_id = :comp_id
+"""
+
+# Shrinkage (_blend) + ratio contra el promedio de liga, resueltos en Postgres.
+# Un promedio de liga <= 0 deja el factor en 1.0, igual que antes.
+_STRENGTHS_SQL = """
+    WITH base AS ({base})
+    SELECT
+      team_id,
+      COALESCE(((n_home * COALESCE(home_gf, :lg_home) + :k * :lg_home) / (n_home + :k))
+               / NULLIF(GREATEST(:lg_home, 0), 0), 1.0)::float AS attack_home,
+      COALESCE(((n_home * COALESCE(home_ga, :lg_away) + :k * :lg_away) / (n_home + :k))
+               / NULLIF(GREATEST(:lg_away, 0), 0), 1.0)::float AS defense_home,
+      COALESCE(((n_away * COALESCE(away_gf, :lg_away) + :k * :lg_away) / (n_away + :k))
+               / NULLIF(GREATEST(:lg_away, 0), 0), 1.0)::float AS attack_away,
+      COALESCE(((n_away * COALESCE(away_ga, :lg_home) + :k * :lg_home) / (n_away + :k))
+               / NULLIF(GREATEST(:lg_home, 0), 0), 1.0)::float AS defense_away
+    FROM base
+    -- Solo equipos con al menos 1 partido
+    WHERE COALESCE(n_home, 0) + COALESCE(n_away, 0) > 0
+"""
+
+_Q_STRENGTHS_MV = text(_STRENGTHS_SQL.format(base=_MV_STRENGTHS_SQL))
+_Q_STRENGTHS_LIVE = text(_STRENGTHS_SQL.format(base=_LIVE_STRENGTHS_SQL))
+
+# La vista sirve si ya incluye el último partido terminado de la liga. Si en
+# matches hay uno más reciente (resultados cargados o un día nuevo desde el
+# último refresco), las fortalezas se calculan en vivo
+_Q_MV_STRENGTHS_FRESH = text("""
+    SELECT
+      COALESCE((SELECT MAX(last_date)
+                FROM mv_team_recent_strengths
+                WHERE league_id = :comp_id), '-infinity'::date)
+      >= COALESCE((SELECT MAX(m.date)
+                   FROM matches m
+                   JOIN seasons s ON s.id = m.season_id
+                   WHERE s.league_id = :comp_id
+                     AND m.home_goals IS NOT NULL
+                     AND m.away_goals IS NOT NULL
+                     AND m.date < CURRENT_DATE), '-infinity'::date) AS fresh
+""")
+
+
+def _use_strengths_mv(conn, league_id: int, n_recent: int) -> bool:
+    """True si n_recent es la ventana de la vista y la vista está al día."""
+    if n_recent != MV_N_RECENT:
+        return False
+    if conn.execute(_Q_MV_STRENGTHS_FRESH, {"comp_id": league_id}).scalar():
+        return True
+    print("   ⚠️  mv_team_recent_strengths desactualizada, fortalezas en vivo")
+    return False
+
+
+# Partidos a predecir con las fortalezas de local y visitante ya unidas:
+# un solo round-trip en vez de fortalezas + equipos de cada partido
+_FIXTURE_STRENGTHS_SQL = """
+    WITH st AS ({strengths})
+    SELECT
+      m.id AS match_id,
+      m.home_team_id,
+      m.away_team_id,
+      h.attack_home,
+      h.defense_home,
+      a.attack_away,
+      a.defense_away
+    FROM matches m
+    LEFT JOIN st h ON h.team_id = m.home_team_id
+    LEFT JOIN st a ON a.team_id = m.away_team_id
+    WHERE m.id = ANY(:ids)
+"""
+
+_Q_FIXTURE_STRENGTHS_MV = text(_FIXTURE_STRENGTHS_SQL.format(
+    strengths=_STRENGTHS_SQL.format(base=_MV_STRENGTHS_SQL)))
+_Q_FIXTURE_STRENGTHS_LIVE = text(_FIXTURE_STRENGTHS_SQL.format(
+    strengths=_STRENGTHS_SQL.format(base=_LIVE_STRENGTHS_SQL)))
+
+
 def load_team_strengths(
     conn, 
-    season_id: int, 
+    league_ctx: LeagueContext,
     n_recent: int = 20,
-    league_ctx: Optional[LeagueContext] = None
 ):
     """
     Calcula fortalezas por equipo a partir de TODO el histórico disponible
@@ -46,24 +186,20 @@ def load_team_strengths(
     
     Args:
         conn: Conexión a la base de datos
-        season_id: ID de la temporada
+        league_ctx: Contexto de liga ya cargado (promedios y HFA salen de aquí,
+            sin volver a consultar la liga)
         n_recent: Número de partidos recientes a considerar (default: 20)
-        league_ctx: Contexto de liga (se carga automáticamente si no se provee)
 
     Returns:
-        Tuple (strengths: dict, lg_home_gf: float, lg_away_gf: float, HFA: float)
+        Tuple (idx, attack_home, defense_home, attack_away, defense_away,
+               lg_home_gf, lg_away_gf, HFA)
         
-        strengths[team_id] = {
-            'attack_home': float,   # Factor ofensivo en casa
-            'defense_home': float,  # Factor defensivo en casa
-            'attack_away': float,   # Factor ofensivo de visitante
-            'defense_away': float   # Factor defensivo de visitante
-        }
+        idx[team_id] -> posición del equipo en los arrays
+        attack_home[i]:  Factor ofensivo en casa
+        defense_home[i]: Factor defensivo en casa
+        attack_away[i]:  Factor ofensivo de visitante
+        defense_away[i]: Factor defensivo de visitante
     """
-    # Obtener contexto de liga
-    if league_ctx is None:
-        league_ctx = LeagueContext.from_season(conn, season_id)
-    
     league_id = league_ctx.league_id
     lg_home_gf = league_ctx.avg_home_goals
     lg_away_gf = league_ctx.avg_away_goals
@@ -73,77 +209,160 @@ def load_team_strengths(
     print(f"   Promedios de liga: {lg_home_gf:.2f} (H) / {lg_away_gf:.2f} (A)")
     
     # 🔥 CAMBIO CLAVE: Filtrar por league_id
-    q_strengths = text(f"""
-        WITH played AS (
-          SELECT m.id, m.date, m.home_team_id, m.away_team_id, 
-                 m.home_goals, m.away_goals
-          FROM matches m
-          JOIN seasons s ON s.id = m.season_id
-          WHERE s.league_id = :comp_id
-            AND m.home_goals IS NOT NULL 
-            AND m.away_goals IS NOT NULL
-            AND m.date < CURRENT_DATE
-        ),
-        home_recent AS (
-          SELECT p.*,
-                 ROW_NUMBER() OVER (PARTITION BY home_team_id ORDER BY date DESC) AS rn
-          FROM played p
-        ),
-        away_recent AS (
-          SELECT p.*,
-                 ROW_NUMBER() OVER (PARTITION BY away_team_id ORDER BY date DESC) AS rn
-          FROM played p
-        ),
-        h AS (
-          SELECT * FROM home_recent WHERE rn <= :n_recent
-        ),
-        a AS (
-          SELECT * FROM away_recent WHERE rn <= :n_recent
-        )
-        SELECT
-          t.id AS team_id,
-          COALESCE(COUNT(h.id), 0)        AS n_home,
-          AVG(h.home_goals)::float        AS home_gf,
-          AVG(h.away_goals)::float        AS home_ga,
-          COALESCE(COUNT(a.id), 0)        AS n_away,
-          AVG(a.away_goals)::float        AS away_gf,
-          AVG(a.home_goals)::float        AS away_ga
-        FROM teams t
-        LEFT JOIN h ON h.home_team_id = t.id
-        LEFT JOIN a ON a.away_team_id = t.id
-        GROUP BY t.id
-    """)
-    
-    strengths = {}
-    teams_processed = 0
-    
-    for tid, n_home, home_gf, home_ga, n_away, away_gf, away_ga in conn.execute(
-        q_strengths, 
-        {"comp_id": league_id, "n_recent": n_recent}
-    ):
-        n_home = int(n_home or 0)
-        n_away = int(n_away or 0)
-        
-        # Solo procesar equipos con al menos 1 partido
-        if n_home == 0 and n_away == 0:
-            continue
-
-        # Shrinkage a promedio de liga si hay pocos partidos
-        home_gf = _blend(home_gf, lg_home_gf, n_home)
-        home_ga = _blend(home_ga, lg_away_gf, n_home)
-        away_gf = _blend(away_gf, lg_away_gf, n_away)
-        away_ga = _blend(away_ga, lg_home_gf, n_away)
-
-        strengths[int(tid)] = {
-            "attack_home":  (home_gf / lg_home_gf) if lg_home_gf > 0 else 1.0,
-            "defense_home": (home_ga / lg_away_gf) if lg_away_gf > 0 else 1.0,
-            "attack_away":  (away_gf / lg_away_gf) if lg_away_gf > 0 else 1.0,
-            "defense_away": (away_ga / lg_home_gf) if lg_home_gf > 0 else 1.0,
-        }
-        teams_processed += 1
+    q_strengths = _Q_STRENGTHS_MV if _use_strengths_mv(conn, league_id, n_recent) else _Q_STRENGTHS_LIVE
+
+    rows = conn.execute(q_strengths, {
+        "comp_id": league_id,
+        "n_recent": n_recent,
+        "lg_home": float(lg_home_gf),
+        "lg_away": float(lg_away_gf),
+        "k": SHRINK_K,  # mismo k que _blend
+    })
+    rows = rows.fetchall()
+
+    # ✅ Structure-of-arrays: un array por factor, indexado por posición
+    idx = {int(r.team_id): i for i, r in enumerate(rows)}
+    factors = np.array(
+        [(r.attack_home, r.defense_home, r.attack_away, r.defense_away) for r in rows],
+        dtype=np.float64,
+    ).reshape(len(rows), 4)
+    attack_home, defense_home, attack_away, defense_away = (
+        np.ascontiguousarray(factors[:, j]) for j in range(4)
+    )
+
+    print(f"   ✅ Fortalezas calculadas para {len(idx)} equipos")
+    return idx, attack_home, defense_home, attack_away, defense_away, lg_home_gf, lg_away_gf, HFA
+
 
-    print(f"   ✅ Fortalezas calculadas para {teams_processed} equipos")
-    return strengths, lg_home_gf, lg_away_gf, HFA
+def load_fixture_strengths(
+    conn,
+    league_ctx: LeagueContext,
+    match_ids: List[int],
+    n_recent: int = 20,
+):
+    """
+    Fortalezas de local y visitante de cada partido en una sola query
+    (mismo cálculo que load_team_strengths, unido a matches en SQL).
+
+    Args:
+        conn: Conexión a la base de datos
+        league_ctx: Contexto de liga ya cargado
+        match_ids: IDs de los partidos
+        n_recent: Número de partidos recientes a considerar (default: 20)
+
+    Returns:
+        Tuple (match_ids, attack_home, defense_home, attack_away, defense_away,
+               lg_home_gf, lg_away_gf, HFA)
+
+        Arrays alineados por partido: attack_home/defense_home son del equipo
+        local y attack_away/defense_away del visitante; NaN si el equipo no
+        tiene historial en la liga.
+    """
+    lg_home_gf = league_ctx.avg_home_goals
+    lg_away_gf = league_ctx.avg_away_goals
+    HFA = league_ctx.hfa
+
+    if _use_strengths_mv(conn, league_ctx.league_id, n_recent):
+        q = _Q_FIXTURE_STRENGTHS_MV
+    else:
+        q = _Q_FIXTURE_STRENGTHS_LIVE
+    rows = conn.execute(q, {
+        "ids": list(match_ids),
+        "comp_id": league_ctx.league_id,
+        "n_recent": n_recent,
+        "lg_home": float(lg_home_gf),
+        "lg_away": float(lg_away_gf),
+        "k": SHRINK_K,  # mismo k que _blend
+    }).fetchall()
+
+    mids = np.array([r.match_id for r in rows], dtype=np.int64)
+    factors = np.array(
+        [(r.attack_home, r.defense_home, r.attack_away, r.defense_away) for r in rows],
+        dtype=np.float64,
+    ).reshape(len(rows), 4)
+    attack_home, defense_home, attack_away, defense_away = (
+        np.ascontiguousarray(factors[:, j]) for j in range(4)
+    )
+    return mids, attack_home, defense_home, attack_away, defense_away, lg_home_gf, lg_away_gf, HFA
+
+
+# (columna local, columna visitante, nombre) de la query de perfiles
+_PROFILE_STATS = [
+    ("sh", "sa", "shots"),
+    ("sth", "sta", "shots_target"),
+    ("fh", "fa", "fouls"),
+    ("ch", "ca", "cards"),
+    ("coh", "coa", "corners"),
+]
+# Códigos de bucket: 0 y 1 son del equipo local, 2 y 3 del visitante
+_PROFILE_BUCKETS = ("home_for", "home_against", "away_for", "away_against")
+
+
+def _profile_values_sql() -> str:
+    """
+    Filas del VALUES que desdobla cada partido en (team_id, stat, bucket, value):
+    por estadística, local a favor / en contra y visitante a favor / en contra.
+    """
+    rows = []
+    for j, (h, a, _) in enumerate(_PROFILE_STATS):
+        rows += [
+            f"(p.home_team_id, {j}, 0, p.{h})",
+            f"(p.home_team_id, {j}, 1, p.{a})",
+            f"(p.away_team_id, {j}, 2, p.{a})",
+            f"(p.away_team_id, {j}, 3, p.{h})",
+        ]
+    return ",\n            ".join(rows)
+
+
+# Ventanas de los últimos n_recent valores NO nulos por (equipo, stat, bucket)
+# resueltas en Postgres: llega una fila por clave, no el histórico completo.
+# El grouping set (stat) da los promedios de liga sobre todo el histórico;
+# cada valor aparece en dos buckets, así que suma y cuenta se duplican por
+# igual y el promedio no cambia.
+_Q_STAT_PROFILES = text(f"""
+    WITH played AS MATERIALIZED (
+        SELECT 
+            m.date, 
+            m.home_team_id, 
+            m.away_team_id,
+            ms.home_shots as sh, 
+            ms.away_shots as sa, 
+            ms.home_shots_on_target as sth, 
+            ms.away_shots_on_target as sta,
+            ms.home_fouls as fh, 
+            ms.away_fouls as fa, 
+            (COALESCE(ms.home_yellow_cards, 0) + COALESCE(ms.home_red_cards, 0)) as ch,
+            (COALESCE(ms.away_yellow_cards, 0) + COALESCE(ms.away_red_cards, 0)) as ca,
+            ms.home_corners as coh, 
+            ms.away_corners as coa
+        FROM matches m
+        JOIN seasons s ON s.id = m.season_id
+        JOIN match_stats ms ON ms.match_id = m.id
+        WHERE s.league_id = :comp_id
+          AND m.home_goals IS NOT NULL
+          AND m.away_goals IS NOT NULL
+          AND m.date < CURRENT_DATE
+    ),
+    ranked AS (
+        SELECT v.team_id, v.stat, v.bucket, v.value,
+               ROW_NUMBER() OVER (PARTITION BY v.team_id, v.stat, v.bucket ORDER BY p.date DESC) AS rn
+        FROM played p
+        CROSS JOIN LATERAL (VALUES
+            {_profile_values_sql()}
+        ) AS v(team_id, stat, bucket, value)
+        WHERE v.value IS NOT NULL
+    )
+    SELECT
+        GROUPING(team_id, bucket) <> 0                       AS is_league,
+        team_id,
+        stat,
+        bucket,
+        (AVG(value) FILTER (WHERE rn <= :n_recent))::float   AS mean,
+        COUNT(*) FILTER (WHERE rn <= :n_recent)              AS n,
+        (AVG(value))::float                                  AS league_mean
+    FROM ranked
+    GROUP BY GROUPING SETS ((team_id, stat, bucket), (stat))
+""")
 
 
 def load_team_stat_profiles(
@@ -185,104 +404,64 @@ def load_team_stat_profiles(
     print(f"📊 Cargando perfiles estadísticos: {league_ctx.league_name}")
     
     # 🔥 CAMBIO CLAVE: Usar match_stats real + filtrar por league_id
-    q = text("""
-        SELECT 
-            m.date, 
-            m.home_team_id, 
-            m.away_team_id,
-            ms.home_shots as sh, 
-            ms.away_shots as sa, 
-            ms.home_shots_on_target as sth, 
-            ms.away_shots_on_target as sta,
-            ms.home_fouls as fh, 
-            ms.away_fouls as fa, 
-            (COALESCE(ms.home_yellow_cards, 0) + COALESCE(ms.home_red_cards, 0)) as ch,
-            (COALESCE(ms.away_yellow_cards, 0) + COALESCE(ms.away_red_cards, 0)) as ca,
-            ms.home_corners as coh, 
-            ms.away_corners as coa
-        FROM matches m
-        JOIN seasons s ON s.id = m.season_id
-        JOIN match_stats ms ON ms.match_id = m.id
-        WHERE s.league_id = :comp_id
-          AND m.date < CURRENT_DATE
-        ORDER BY m.date DESC
-    """)
-    
-    rows = conn.execute(q, {"comp_id": league_id}).fetchall()
-    
-    stats = [
-        ("sh", "sa", "shots"),
-        ("sth", "sta", "shots_target"),
-        ("fh", "fa", "fouls"),
-        ("ch", "ca", "cards"),
-        ("coh", "coa", "corners"),
-    ]
-
-    # Acumular listas por equipo y condición
-    from collections import defaultdict, deque
-    prof = defaultdict(lambda: defaultdict(lambda: {
-        "home_for": deque(maxlen=n_recent),
-        "home_against": deque(maxlen=n_recent),
-        "away_for": deque(maxlen=n_recent),
-        "away_against": deque(maxlen=n_recent),
-    }))
-    league_sums = {name: [0.0, 0] for _, _, name in stats}  # sum, cnt
-
-    for row in rows:
-        date, h, a = row.date, row.home_team_id, row.away_team_id
-        
-        for h_col, a_col, name in stats:
-            vh = getattr(row, h_col)
-            va = getattr(row, a_col)
-            
-            # Liga
-            if vh is not None:
-                league_sums[name][0] += float(vh)
-                league_sums[name][1] += 1
-            if va is not None:
-                league_sums[name][0] += float(va)
-                league_sums[name][1] += 1
-            
-            # Perfiles
-            if vh is not None:
-                prof[h][name]["home_for"].append(float(vh))
-            if va is not None:
-                prof[h][name]["home_against"].append(float(va))
-            if va is not None:
-                prof[a][name]["away_for"].append(float(va))
-            if vh is not None:
-                prof[a][name]["away_against"].append(float(vh))
-
-    league_means = {}
-    for name, (s, c) in league_sums.items():
-        league_means[name] = (s / c) if c else 0.0
-
-    # Convertir de deque a promedios con shrinkage
-    def avg(lst): 
-        arr = list(lst)
-        return (sum(arr)/len(arr)) if arr else None
+    # Ventanas y promedios resueltos en SQL (_Q_STAT_PROFILES)
+    # Una sola pasada sobre el resultado: se itera sin fetchall()
+    rows = conn.execute(
+        _Q_STAT_PROFILES.execution_options(yield_per=1000),
+        {"comp_id": league_id, "n_recent": n_recent},
+    )
+
+    n_stats = len(_PROFILE_STATS)
+    n_buckets = len(_PROFILE_BUCKETS)
+    league_mean_by_code = [0.0] * n_stats
+    keys, window_means, window_counts = [], [], []
+    # Desempaquetado por posición (orden del SELECT), sin acceso por atributo
+    for is_league, team_id, stat, bucket, mean, n, league_mean in rows:
+        if is_league:
+            league_mean_by_code[stat] = league_mean or 0.0
+        else:
+            keys.append((team_id, stat, bucket))
+            window_means.append(mean)
+            window_counts.append(n)
+
+    league_means = {name: league_mean_by_code[j] for j, (_, _, name) in enumerate(_PROFILE_STATS)}
+
+    if not keys:
+        print(f"   ⚠️  Sin estadísticas para {league_ctx.league_name}")
+        return {}, league_means
+
+    # Media y tamaño de cada ventana en arrays (equipo, stat, bucket):
+    # una asignación con índices en vez de un acumulador por clave
+    keys = np.array(keys, dtype=np.int64)
+    team_ids, t = np.unique(keys[:, 0], return_inverse=True)
+    team_pos = {int(tid): i for i, tid in enumerate(team_ids)}
+    means = np.full((len(team_ids), n_stats, n_buckets), np.nan)
+    filled = np.zeros((len(team_ids), n_stats, n_buckets), dtype=np.int64)
+    means[t, keys[:, 1], keys[:, 2]] = window_means
+    filled[t, keys[:, 1], keys[:, 2]] = window_counts
+
+    # Cuenta de muestras
+    n_h = filled[:, :, 0] + filled[:, :, 1]
+    n_a = filled[:, :, 2] + filled[:, :, 3]
+
+    # Shrinkage de todas las ventanas en bloque, con v faltante -> lg
+    lg = np.array([league_means[name] or 0.001 for _, _, name in _PROFILE_STATS])[None, :, None]
+    n = np.stack([n_h, n_h, n_a, n_a], axis=-1)
+    blended = _blend(means, lg, n)
 
     out = {}
-    for tid, per_stat in prof.items():
-        out[tid] = {}
-        for name, buckets in per_stat.items():
-            hf = avg(buckets["home_for"])
-            ha = avg(buckets["home_against"])
-            af = avg(buckets["away_for"])
-            aa = avg(buckets["away_against"])
-            
-            # Cuenta de muestras
-            n_h = len(buckets["home_for"]) + len(buckets["home_against"])
-            n_a = len(buckets["away_for"]) + len(buckets["away_against"])
-            
-            lg = league_means[name] or 0.001
-            out[tid][name] = {
-                "home_for":      _blend(hf, lg, n_h),
-                "home_against":  _blend(ha, lg, n_h),
-                "away_for":      _blend(af, lg, n_a),
-                "away_against":  _blend(aa, lg, n_a),
-                "n_home": n_h, 
-                "n_away": n_a,
+    for tid, t in team_pos.items():
+        for j, (_, _, name) in enumerate(_PROFILE_STATS):
+            if not filled[t, j].any():
+                continue
+            hf, ha, af, aa = blended[t, j].tolist()
+            out.setdefault(int(tid), {})[name] = {
+                "home_for":      hf,
+                "home_against":  ha,
+                "away_for":      af,
+                "away_against":  aa,
+                "n_home": int(n_h[t, j]), 
+                "n_away": int(n_a[t, j]),
             }
     
     print(f"   ✅ Perfiles cargados para {len(out)} equipos")
@@ -309,7 +488,7 @@ if __name__ == "__main__":
         print("PREMIER LEAGUE")
         print("="*70)
         ctx_pl = LeagueContext.from_season(conn, season_id=1)
-        strengths_pl, _, _, _ = load_team_strengths(conn, 1, league_ctx=ctx_pl)
+        strengths_pl, *_ = load_team_strengths(conn, ctx_pl)
         print(f"Equipos con fortalezas: {len(strengths_pl)}")
         
         # La Liga
@@ -317,7 +496,7 @@ if __name__ == "__main__":
         print("LA LIGA")
         print("="*70)
         ctx_laliga = LeagueContext.from_season(conn, season_id=2)
-        strengths_laliga, _, _, _ = load_team_strengths(conn, 2, league_ctx=ctx_laliga)
+        strengths_laliga, *_ = load_team_strengths(conn, ctx_laliga)
         print(f"Equipos con fortalezas: {len(strengths_laliga)}")
         
         # Verificar que las fortalezas son diferentes
@@ -5,15 +5,16 @@ Predicciones Poisson con soporte multi-liga.
 CAMBIOS:
 1. Importa LeagueContext
 2. predict_and_upsert_poisson acepta league_ctx opcional
-3. Pasa league_ctx a load_team_strengths
+3. Pasa league_ctx a load_fixture_strengths (partidos + fortalezas en una query)
 4. Muestra información de la liga en logs
 """
 
 from __future__ import annotations
-import math
+import numpy as np
 from typing import List, Dict, Optional
-from sqlalchemy import text
-from .upcoming_core import load_team_strengths
+from psycopg2.extras import execute_values
+from ._poisson_jit import aggregate_probs_batch
+from .upcoming_core import load_fixture_strengths
 from .league_context import LeagueContext  # ← NUEVO IMPORT
 
 # --- [NUEVO] helper de cuotas ----------------------------------------------
@@ -27,40 +28,11 @@ def _odds(p: float | None, cushion: float = ODDS_MARGIN) -> float | None:
     """
     if p is None or p <= 0:
         return None
-    return round((1.0 / float(p)) * (1.0 + float(cushion)), 4)
-
-
-def _poisson_pmf(lam: float, k: int) -> float:
-    if lam <= 0:
-        return 1.0 if k == 0 else 0.0
-    return math.exp(-lam) * (lam ** k) / math.factorial(k)
-
-
-def _aggregate_probs(lh: float, la: float, max_goals: int = 12) -> Dict[str, float]:
-    """Suma de la matriz Poisson truncada (0..max_goals) con cola en el último bucket."""
-    p_h = [_poisson_pmf(lh, k) for k in range(max_goals + 1)]
-    p_a = [_poisson_pmf(la, k) for k in range(max_goals + 1)]
-    rem_h = 1.0 - sum(p_h)
-    rem_a = 1.0 - sum(p_a)
-    if rem_h > 1e-12:
-        p_h[-1] += rem_h
-    if rem_a > 1e-12:
-        p_a[-1] += rem_a
-
-    home = draw = away = over25 = btts = 0.0
-    for i, ph in enumerate(p_h):
-        for j, pa in enumerate(p_a):
-            pij = ph * pa
-            if i > j:
-                home += pij
-            elif i == j:
-                draw += pij
-            else:
-                away += pij
-            if i + j >= 3:  # umbral 2.5
-                over25 += pij
-            if i >= 1 and j >= 1:
-                btts += pij
+    return round((1.0 / p) * (1.0 + cushion), 4)
+
+
+def _outcome_probs(home: float, draw: float, away: float, over25: float, btts: float) -> Dict[str, float]:
+    """Probabilidades de una fila de aggregate_probs_batch + sus complementos."""
 
     under25 = max(0.0, 1.0 - over25)
     nbtts = max(0.0, 1.0 - btts)
@@ -71,6 +43,54 @@ def _aggregate_probs(lh: float, la: float, max_goals: int = 12) -> Dict[str, flo
     }
 
 
+# Upsert por lotes con psycopg2.extras.execute_values: un INSERT multi-VALUES
+# por página en vez de un round-trip por partido
+_UPSERT_POISSON = """
+    INSERT INTO poisson_predictions
+    (
+        match_id,
+        expected_home_goals, expected_away_goals,
+        prob_home_win, prob_draw, prob_away_win,
+        over_2, under_2, both_score, both_noscore,
+        -- nuevas columnas de cuotas
+        min_odds_1, min_odds_x, min_odds_2,
+        min_odds_over25, min_odds_under25,
+        min_odds_btts_yes, min_odds_btts_no
+    )
+    VALUES %s
+    ON CONFLICT (match_id) DO UPDATE SET
+        expected_home_goals = EXCLUDED.expected_home_goals,
+        expected_away_goals = EXCLUDED.expected_away_goals,
+        prob_home_win       = EXCLUDED.prob_home_win,
+        prob_draw           = EXCLUDED.prob_draw,
+        prob_away_win       = EXCLUDED.prob_away_win,
+        over_2              = EXCLUDED.over_2,
+        under_2             = EXCLUDED.under_2,
+        both_score          = EXCLUDED.both_score,
+        both_noscore        = EXCLUDED.both_noscore,
+        min_odds_1          = EXCLUDED.min_odds_1,
+        min_odds_x          = EXCLUDED.min_odds_x,
+        min_odds_2          = EXCLUDED.min_odds_2,
+        min_odds_over25     = EXCLUDED.min_odds_over25,
+        min_odds_under25    = EXCLUDED.min_odds_under25,
+        min_odds_btts_yes   = EXCLUDED.min_odds_btts_yes,
+        min_odds_btts_no    = EXCLUDED.min_odds_btts_no
+"""
+
+_UPSERT_POISSON_TEMPLATE = """(
+    %(mid)s,
+    %(ehg)s, %(eag)s,
+    %(pH)s, %(pD)s, %(pA)s,
+    %(pO25)s, %(pU25)s, %(pBTTS)s, %(pNBTS)s,
+    %(odds1)s, %(oddsX)s, %(odds2)s,
+    %(oddsO25)s, %(oddsU25)s,
+    %(oddsBTTS)s, %(oddsNBTS)s
+)"""
+
+# Filas por INSERT multi-VALUES
+UPSERT_PAGE_SIZE = 500
+
+
 def predict_and_upsert_poisson(
     conn, 
     season_id: int, 
@@ -94,77 +114,28 @@ def predict_and_upsert_poisson(
     print(f"   Liga: {league_ctx.league_name}")
     print(f"   Temporada: {league_ctx.season_year}")
     print(f"   Partidos a predecir: {len(match_ids)}")
+    if not match_ids:
+        return
     
-    # ✅ CAMBIO: Pasar league_ctx a load_team_strengths
-    strengths, lg_home_gf, lg_away_gf, HFA = load_team_strengths(
-        conn, season_id, league_ctx=league_ctx
-    )
-    
-    print(f"   Equipos con fortalezas: {len(strengths)}")
-
-    q_matches = text("""
-        SELECT id, home_team_id, away_team_id
-        FROM matches
-        WHERE id = ANY(:ids)
-    """)
-    rows = conn.execute(q_matches, {"ids": match_ids}).fetchall()
-
-    upsert = text("""
-        INSERT INTO poisson_predictions
-        (
-            match_id,
-            expected_home_goals, expected_away_goals,
-            prob_home_win, prob_draw, prob_away_win,
-            over_2, under_2, both_score, both_noscore,
-            -- nuevas columnas de cuotas
-            min_odds_1, min_odds_x, min_odds_2,
-            min_odds_over25, min_odds_under25,
-            min_odds_btts_yes, min_odds_btts_no
-        )
-        VALUES
-        (
-            :mid,
-            :ehg, :eag,
-            :pH, :pD, :pA,
-            :pO25, :pU25, :pBTTS, :pNBTS,
-            :odds1, :oddsX, :odds2,
-            :oddsO25, :oddsU25,
-            :oddsBTTS, :oddsNBTS
-        )
-        ON CONFLICT (match_id) DO UPDATE SET
-            expected_home_goals = EXCLUDED.expected_home_goals,
-            expected_away_goals = EXCLUDED.expected_away_goals,
-            prob_home_win       = EXCLUDED.prob_home_win,
-            prob_draw           = EXCLUDED.prob_draw,
-            prob_away_win       = EXCLUDED.prob_away_win,
-            over_2              = EXCLUDED.over_2,
-            under_2             = EXCLUDED.under_2,
-            both_score          = EXCLUDED.both_score,
-            both_noscore        = EXCLUDED.both_noscore,
-            min_odds_1          = EXCLUDED.min_odds_1,
-            min_odds_x          = EXCLUDED.min_odds_x,
-            min_odds_2          = EXCLUDED.min_odds_2,
-            min_odds_over25     = EXCLUDED.min_odds_over25,
-            min_odds_under25    = EXCLUDED.min_odds_under25,
-            min_odds_btts_yes   = EXCLUDED.min_odds_btts_yes,
-            min_odds_btts_no    = EXCLUDED.min_odds_btts_no
-    """)
-
-    predictions_saved = 0
-    for mid, h, a in rows:
-        sh = strengths.get(h)
-        sa = strengths.get(a)
-        
-        if not sh or not sa:
-            # Equipos sin historial en esta liga: usar promedios de liga
-            lam_h = lg_home_gf * HFA
-            lam_a = lg_away_gf
-        else:
-            # Equipos con historial: usar fortalezas específicas
-            lam_h = lg_home_gf * sh["attack_home"] * sa["defense_away"] * HFA
-            lam_a = lg_away_gf * sa["attack_away"] * sh["defense_home"]
-
-        probs = _aggregate_probs(lam_h, lam_a)
+    # ✅ Partidos + fortalezas de ambos equipos en una sola query
+    (mids, attack_home, defense_home, attack_away, defense_away,
+     lg_home_gf, lg_away_gf, HFA) = load_fixture_strengths(conn, league_ctx, match_ids)
+
+    # Si falta el historial de alguno de los dos equipos en esta liga se usan
+    # los promedios de liga
+    known = ~np.isnan(attack_home) & ~np.isnan(attack_away)
+    print(f"   Partidos con fortalezas de ambos equipos: {int(known.sum())}/{len(mids)}")
+
+    lams_h = np.where(known, lg_home_gf * attack_home * defense_away * HFA, lg_home_gf * HFA)
+    lams_a = np.where(known, lg_away_gf * attack_away * defense_home, lg_away_gf)
+
+    # Matriz de marcadores de todos los partidos en una llamada
+    outcomes = aggregate_probs_batch(lams_h, lams_a)
+
+    # .tolist() ya entrega int/float de Python: el payload no necesita casts
+    payload = []
+    for mid, lam_h, lam_a, row_probs in zip(mids.tolist(), lams_h.tolist(), lams_a.tolist(), outcomes.tolist()):
+        probs = _outcome_probs(*row_probs)
 
         # Calcular las cuotas a partir de las probabilidades
         odds = {
@@ -177,13 +148,19 @@ def predict_and_upsert_poisson(
             "oddsNBTS": _odds(probs.get("pNBTS")),
         }
 
-        conn.execute(upsert, {
-            "mid": int(mid),
-            "ehg": float(lam_h),
-            "eag": float(lam_a),
+        payload.append({
+            "mid": mid,
+            "ehg": lam_h,
+            "eag": lam_a,
             **probs,  # pH, pD, pA, pO25, pU25, pBTTS, pNBTS
             **odds    # odds1, oddsX, odds2, oddsO25, oddsU25, oddsBTTS, oddsNBTS
         })
-        predictions_saved += 1
+
+    # Mismo cursor/transacción que conn
+    if payload:
+        with conn.connection.cursor() as cur:
+            execute_values(cur, _UPSERT_POISSON, payload,
+                           template=_UPSERT_POISSON_TEMPLATE, page_size=UPSERT_PAGE_SIZE)
+    predictions_saved = len(payload)
     
     print(f"   ✅ {predictions_saved} predicciones guardadas en poisson_predictions")
\ No newline at end of file
@@ -1,7 +1,9 @@
 from __future__ import annotations
-import math
+import numpy as np
 from typing import List, Tuple, Dict, Optional
+from psycopg2.extras import execute_values
 from sqlalchemy import text
+from ._poisson_jit import aggregate_probs_batch
 from .league_context import LeagueContext  # ← NUEVO IMPORT
 
 # src/predictions/upcoming_weinston.py
@@ -17,43 +19,46 @@ CAMBIOS PRINCIPALES:
 
 
 
-def _poisson_pmf(lam: float, k: int) -> float:
-    if lam <= 0:
-        return 1.0 if k == 0 else 0.0
-    return math.exp(-lam) * (lam ** k) / math.factorial(k)
+# Partidos y ratings de local / visitante en una sola query.
+# weinston_ratings guarda numeric: se castea a float8 en el servidor para que
+# psycopg2 lo decodifique directo a float (numeric llega como Decimal)
+_Q_FIXTURE_RATINGS = text("""
+    SELECT m.id, m.home_team_id, m.away_team_id,
+           rh.atk_home::float8 AS atk_home, rh.def_home::float8 AS def_home,
+           ra.atk_away::float8 AS atk_away, ra.def_away::float8 AS def_away
+    FROM matches m
+    LEFT JOIN weinston_ratings rh
+           ON rh.team_id = m.home_team_id
+          AND rh.season_id = :season_id
+          AND rh.league_id = :league_id  -- ← FILTRO AGREGADO
+    LEFT JOIN weinston_ratings ra
+           ON ra.team_id = m.away_team_id
+          AND ra.season_id = :season_id
+          AND ra.league_id = :league_id
+    WHERE m.id = ANY(:ids)
+""")
 
-def _aggregate_probs(lh: float, la: float, max_goals: int = 12) -> Dict[str, float]:
-    p_h = [_poisson_pmf(lh, k) for k in range(max_goals + 1)]
-    p_a = [_poisson_pmf(la, k) for k in range(max_goals + 1)]
-    rem_h = 1.0 - sum(p_h); rem_a = 1.0 - sum(p_a)
-    if rem_h > 1e-12: p_h[-1] += rem_h
-    if rem_a > 1e-12: p_a[-1] += rem_a
 
-    home = draw = away = over25 = btts = 0.0
-    for i, ph in enumerate(p_h):
-        for j, pa in enumerate(p_a):
-            pij = ph * pa
-            if i > j: home += pij
-            elif i == j: draw += pij
-            else: away += pij
-            if i + j >= 3: over25 += pij
-            if i >= 1 and j >= 1: btts += pij
-
-    return {"pH": home, "pD": draw, "pA": away, "pO25": over25, "pBTTS": btts}
-
-
-def _load_weinston_ratings(
+def _load_fixture_ratings(
     conn, 
     season_id: int,
+    match_ids: List[int],
     league_ctx: Optional[LeagueContext] = None  # ← NUEVO PARÁMETRO
-) -> Dict[int, Dict[str, float]]:
+):
     """
-    Carga los ratings de Weinston FILTRADO POR LIGA.
+    Carga los partidos y los ratings de Weinston de sus equipos FILTRADO POR LIGA.
     
     Args:
         conn: Conexión a BD
         season_id: ID de la temporada
+        match_ids: IDs de los partidos a predecir
         league_ctx: Contexto de liga (se carga si no se provee)
+
+    Returns:
+        Tuple (matches, atk_home, def_home, atk_away, def_away): matches son
+        filas (id, home_team_id, away_team_id); los ratings son arrays
+        alineados por partido (local: atk_home/def_home, visitante:
+        atk_away/def_away), NaN si el equipo no tiene ratings
     """
     if league_ctx is None:
         league_ctx = LeagueContext.from_season(conn, season_id)
@@ -61,24 +66,21 @@ def _load_weinston_ratings(
     league_id = league_ctx.league_id
     
     # ⚠️ CAMBIO CRÍTICO: Filtrar por league_id
-    q = text("""
-        SELECT team_id, atk_home, def_home, atk_away, def_away
-        FROM weinston_ratings
-        WHERE season_id = :season_id
-          AND league_id = :league_id  -- ← FILTRO AGREGADO
-    """)
-    
-    ratings = {}
-    for row in conn.execute(q, {"season_id": season_id, "league_id": league_id}):
-        ratings[int(row.team_id)] = {
-            "atk_home": float(row.atk_home),
-            "def_home": float(row.def_home),
-            "atk_away": float(row.atk_away),
-            "def_away": float(row.def_away),
-        }
-    
-    print(f"   📊 Ratings cargados para {len(ratings)} equipos")
-    return ratings
+    rows = conn.execute(
+        _Q_FIXTURE_RATINGS, {"ids": match_ids, "season_id": season_id, "league_id": league_id}
+    ).fetchall()
+
+    # ✅ Structure-of-arrays: un array por rating, una posición por partido
+    matches = [(r.id, r.home_team_id, r.away_team_id) for r in rows]
+    ratings = np.array(
+        [(r.atk_home, r.def_home, r.atk_away, r.def_away) for r in rows], dtype=np.float64
+    ).reshape(len(rows), 4)
+    atk_home, def_home, atk_away, def_away = (np.ascontiguousarray(ratings[:, j]) for j in range(4))
+
+    rated = {h for (_, h, _), r in zip(matches, ratings[:, 0]) if not np.isnan(r)}
+    rated |= {a for (_, _, a), r in zip(matches, ratings[:, 2]) if not np.isnan(r)}
+    print(f"   📊 Ratings cargados para {len(rated)} equipos")
+    return matches, atk_home, def_home, atk_away, def_away
 
 
 def _load_league_params(
@@ -105,12 +107,112 @@ def _load_league_params(
     return mu_home, mu_away, home_adv
 
 
+# AVG sobre enteros devuelve numeric: ::float8 evita construir un Decimal por valor
+_Q_TEAM_STAT_PROFILES = text("""
+    WITH team_stats AS MATERIALIZED (
+        SELECT 
+            m.home_team_id as team_id,
+            'home' as location,
+            ms.home_shots as shots_for,
+            ms.away_shots as shots_against,
+            ms.home_shots_on_target as shots_target_for,
+            ms.away_shots_on_target as shots_target_against,
+            ms.home_fouls as fouls_for,
+            ms.away_fouls as fouls_against,
+            (COALESCE(ms.home_yellow_cards, 0) + COALESCE(ms.home_red_cards, 0)) as cards_for,
+            (COALESCE(ms.away_yellow_cards, 0) + COALESCE(ms.away_red_cards, 0)) as cards_against,
+            ms.home_corners as corners_for,
+            ms.away_corners as corners_against,
+            m.date
+        FROM matches m
+        JOIN seasons s ON s.id = m.season_id
+        JOIN match_stats ms ON ms.match_id = m.id
+        WHERE s.league_id = :league_id  -- ← FILTRO AGREGADO
+          AND m.home_goals IS NOT NULL
+          AND m.away_goals IS NOT NULL
+        
+        UNION ALL
+        
+        SELECT 
+            m.away_team_id as team_id,
+            'away' as location,
+            ms.away_shots as shots_for,
+            ms.home_shots as shots_against,
+            ms.away_shots_on_target as shots_target_for,
+            ms.home_shots_on_target as shots_target_against,
+            ms.away_fouls as fouls_for,
+            ms.home_fouls as fouls_against,
+            (COALESCE(ms.away_yellow_cards, 0) + COALESCE(ms.away_red_cards, 0)) as cards_for,
+            (COALESCE(ms.home_yellow_cards, 0) + COALESCE(ms.home_red_cards, 0)) as cards_against,
+            ms.away_corners as corners_for,
+            ms.home_corners as corners_against,
+            m.date
+        FROM matches m
+        JOIN seasons s ON s.id = m.season_id
+        JOIN match_stats ms ON ms.match_id = m.id
+        WHERE s.league_id = :league_id  -- ← FILTRO AGREGADO
+          AND m.home_goals IS NOT NULL
+          AND m.away_goals IS NOT NULL
+    ),
+    -- Solo los equipos pedidos (NULL = todos): la ventana es por equipo, así
+    -- que filtrar antes del ROW_NUMBER no cambia el resultado
+    recent_stats AS (
+        SELECT *,
+               ROW_NUMBER() OVER (PARTITION BY team_id, location ORDER BY date DESC) as rn
+        FROM team_stats
+        WHERE CAST(:team_ids AS int[]) IS NULL OR team_id = ANY(:team_ids)
+    ),
+    -- Promedios de liga: columnas de local de todos los partidos jugados
+    -- (lg_n = partidos con match_stats en la liga)
+    league_means AS (
+        SELECT 
+            COUNT(*) as lg_n,
+            AVG(shots_for)::float8 as lg_shots,
+            AVG(shots_target_for)::float8 as lg_shots_target,
+            AVG(fouls_for)::float8 as lg_fouls,
+            AVG(cards_for)::float8 as lg_cards,
+            AVG(corners_for)::float8 as lg_corners
+        FROM team_stats
+        WHERE location = 'home'
+    ),
+    profiles AS (
+    SELECT 
+        team_id,
+        location,
+        AVG(shots_for)::float8 as avg_shots_for,
+        AVG(shots_against)::float8 as avg_shots_against,
+        AVG(shots_target_for)::float8 as avg_shots_target_for,
+        AVG(shots_target_against)::float8 as avg_shots_target_against,
+        AVG(fouls_for)::float8 as avg_fouls_for,
+        AVG(fouls_against)::float8 as avg_fouls_against,
+        AVG(cards_for)::float8 as avg_cards_for,
+        AVG(cards_against)::float8 as avg_cards_against,
+        AVG(corners_for)::float8 as avg_corners_for,
+        AVG(corners_against)::float8 as avg_corners_against
+    FROM recent_stats
+    WHERE rn <= :n_recent
+    GROUP BY team_id, location
+    )
+    -- league_means siempre da una fila: aunque ningún equipo pedido tenga
+    -- historial, los promedios de liga llegan (con team_id NULL)
+    SELECT lg.*, p.*
+    FROM league_means lg
+    LEFT JOIN profiles p ON TRUE
+""")
+
+
+# Estadísticas de los perfiles (columnas avg_<stat>_for / avg_<stat>_against)
+_PROFILE_STATS = ("shots", "shots_target", "fouls", "cards", "corners")
+_PROFILE_KEYS = tuple((f"avg_{stat}_for", f"avg_{stat}_against") for stat in _PROFILE_STATS)
+
+
 def _load_team_stat_profiles(
     conn, 
     season_id: int, 
     n_recent: int = 20,
-    league_ctx: Optional[LeagueContext] = None  # ← NUEVO PARÁMETRO
-) -> Tuple[Dict, Dict]:
+    league_ctx: Optional[LeagueContext] = None,  # ← NUEVO PARÁMETRO
+    team_ids: Optional[List[int]] = None
+) -> Tuple[Dict[int, int], np.ndarray, np.ndarray]:
     """
     Carga perfiles estadísticos de equipos FILTRADO POR LIGA.
     
@@ -119,174 +221,142 @@ def _load_team_stat_profiles(
         season_id: ID de la temporada
         n_recent: Número de partidos recientes
         league_ctx: Contexto de liga (se carga si no se provee)
+        team_ids: Equipos a perfilar (None = todos los de la liga); los
+            promedios de liga siempre usan toda la liga
+
+    Returns:
+        Tuple (idx, profiles, league_means):
+        - idx[team_id] es la posición del equipo en profiles
+        - profiles: array (equipos, stats, 4) con columnas
+          (home_for, home_against, away_for, away_against); NaN = sin partidos
+          en esa localía
+        - league_means: array (stats,) en el orden de _PROFILE_STATS, o None
+          si la liga no tiene partidos con match_stats
     """
     if league_ctx is None:
         league_ctx = LeagueContext.from_season(conn, season_id)
     
     league_id = league_ctx.league_id
     
-    profiles = {}
-    
     # ⚠️ CAMBIO CRÍTICO: Filtrar por league_id en la query
-    q = text("""
-        WITH team_stats AS (
-            SELECT 
-                m.home_team_id as team_id,
-                'home' as location,
-                ms.home_shots as shots_for,
-                ms.away_shots as shots_against,
-                ms.home_shots_on_target as shots_target_for,
-                ms.away_shots_on_target as shots_target_against,
-                ms.home_fouls as fouls_for,
-                ms.away_fouls as fouls_against,
-                (COALESCE(ms.home_yellow_cards, 0) + COALESCE(ms.home_red_cards, 0)) as cards_for,
-                (COALESCE(ms.away_yellow_cards, 0) + COALESCE(ms.away_red_cards, 0)) as cards_against,
-                ms.home_corners as corners_for,
-                ms.away_corners as corners_against,
-                m.date
-            FROM matches m
-            JOIN seasons s ON s.id = m.season_id
-            JOIN match_stats ms ON ms.match_id = m.id
-            WHERE s.league_id = :league_id  -- ← FILTRO AGREGADO
-              AND m.home_goals IS NOT NULL
-            
-            UNION ALL
-            
-            SELECT 
-                m.away_team_id as team_id,
-                'away' as location,
-                ms.away_shots as shots_for,
-                ms.home_shots as shots_against,
-                ms.away_shots_on_target as shots_target_for,
-                ms.home_shots_on_target as shots_target_against,
-                ms.away_fouls as fouls_for,
-                ms.home_fouls as fouls_against,
-                (COALESCE(ms.away_yellow_cards, 0) + COALESCE(ms.away_red_cards, 0)) as cards_for,
-                (COALESCE(ms.home_yellow_cards, 0) + COALESCE(ms.home_red_cards, 0)) as cards_against,
-                ms.away_corners as corners_for,
-                ms.home_corners as corners_against,
-                m.date
-            FROM matches m
-            JOIN seasons s ON s.id = m.season_id
-            JOIN match_stats ms ON ms.match_id = m.id
-            WHERE s.league_id = :league_id  -- ← FILTRO AGREGADO
-              AND m.away_goals IS NOT NULL
-        ),
-        recent_stats AS (
-            SELECT *,
-                   ROW_NUMBER() OVER (PARTITION BY team_id, location ORDER BY date DESC) as rn
-            FROM team_stats
-        )
-        SELECT 
-            team_id,
-            location,
-            AVG(shots_for) as avg_shots_for,
-            AVG(shots_against) as avg_shots_against,
-            AVG(shots_target_for) as avg_shots_target_for,
-            AVG(shots_target_against) as avg_shots_target_against,
-            AVG(fouls_for) as avg_fouls_for,
-            AVG(fouls_against) as avg_fouls_against,
-            AVG(cards_for) as avg_cards_for,
-            AVG(cards_against) as avg_cards_against,
-            AVG(corners_for) as avg_corners_for,
-            AVG(corners_against) as avg_corners_against
-        FROM recent_stats
-        WHERE rn <= :n_recent
-        GROUP BY team_id, location
-    """)
-    
-    rows = conn.execute(q, {"league_id": league_id, "n_recent": n_recent}).fetchall()
-    
-    for row in rows:
-        team_id = int(row.team_id)
-        location = row.location
-        
-        if team_id not in profiles:
-            profiles[team_id] = {
-                "shots": {}, "shots_target": {}, "fouls": {}, "cards": {}, "corners": {}
-            }
-        
-        prefix = "home" if location == "home" else "away"
-        
-        profiles[team_id]["shots"][f"{prefix}_for"] = float(row.avg_shots_for or 0)
-        profiles[team_id]["shots"][f"{prefix}_against"] = float(row.avg_shots_against or 0)
-        profiles[team_id]["shots_target"][f"{prefix}_for"] = float(row.avg_shots_target_for or 0)
-        profiles[team_id]["shots_target"][f"{prefix}_against"] = float(row.avg_shots_target_against or 0)
-        profiles[team_id]["fouls"][f"{prefix}_for"] = float(row.avg_fouls_for or 0)
-        profiles[team_id]["fouls"][f"{prefix}_against"] = float(row.avg_fouls_against or 0)
-        profiles[team_id]["cards"][f"{prefix}_for"] = float(row.avg_cards_for or 0)
-        profiles[team_id]["cards"][f"{prefix}_against"] = float(row.avg_cards_against or 0)
-        profiles[team_id]["corners"][f"{prefix}_for"] = float(row.avg_corners_for or 0)
-        profiles[team_id]["corners"][f"{prefix}_against"] = float(row.avg_corners_against or 0)
-    
-    # ⚠️ CAMBIO: Filtrar league_means por liga también
-    q_league = text("""
-        SELECT 
-            AVG(ms.home_shots) as avg_shots,
-            AVG(ms.home_shots_on_target) as avg_shots_target,
-            AVG(ms.home_fouls) as avg_fouls,
-            AVG(COALESCE(ms.home_yellow_cards, 0) + COALESCE(ms.home_red_cards, 0)) as avg_cards,
-            AVG(ms.home_corners) as avg_corners
-        FROM match_stats ms
-        JOIN matches m ON m.id = ms.match_id
-        JOIN seasons s ON s.id = m.season_id
-        WHERE s.league_id = :league_id  -- ← FILTRO AGREGADO
-    """)
-    
-    row_league = conn.execute(q_league, {"league_id": league_id}).fetchone()
-    
-    league_means = {
-        "shots": float(row_league.avg_shots or 12.0),
-        "shots_target": float(row_league.avg_shots_target or 4.0),
-        "fouls": float(row_league.avg_fouls or 11.0),
-        "cards": float(row_league.avg_cards or 2.0),
-        "corners": float(row_league.avg_corners or 5.0)
-    }
-    
-    print(f"   📈 Perfiles estadísticos cargados para {len(profiles)} equipos")
-    
-    return profiles, league_means
+    result = conn.execute(
+        _Q_TEAM_STAT_PROFILES.execution_options(yield_per=2048),
+        {"league_id": league_id, "n_recent": n_recent,
+         "team_ids": None if team_ids is None else list(team_ids)},
+    )
 
+    # ✅ Structure-of-arrays: una fila por (equipo, localía)
+    idx: Dict[int, int] = {}
+    team_pos, cols, values = [], [], []
+    lg = {}
+    for row in result.mappings():
+        lg = row
+        if row["team_id"] is None:
+            # Ningún equipo pedido tiene historial: solo promedios de liga
+            continue
+        team_pos.append(idx.setdefault(int(row["team_id"]), len(idx)))
+        cols.append(0 if row["location"] == "home" else 2)
+        values.append([(row[k_for] or 0, row[k_against] or 0) for k_for, k_against in _PROFILE_KEYS])
 
-def _exp_stat(stat: str, home_id: int, away_id: int, profiles: Dict, league_means: Dict) -> Tuple[float, float]:
-    """Combina ataque y defensa: 60% for + 40% against"""
-    lg = league_means.get(stat, 0.0)
+    profiles = np.full((len(idx), len(_PROFILE_STATS), 4), np.nan)
+    if values:
+        t = np.array(team_pos)[:, None]
+        c = np.array(cols)[:, None]
+        v = np.array(values, dtype=np.float64)
+        profiles[t, np.arange(len(_PROFILE_STATS)), c] = v[:, :, 0]
+        profiles[t, np.arange(len(_PROFILE_STATS)), c + 1] = v[:, :, 1]
     
-    home_profile = profiles.get(home_id, {}).get(stat, {})
-    away_profile = profiles.get(away_id, {}).get(stat, {})
+    # ⚠️ CAMBIO: league_means por liga, en las mismas filas (columnas lg_*)
+    if not lg.get("lg_n"):
+        print("   📈 Liga sin match_stats: sin perfiles estadísticos")
+        return idx, profiles, None
+    league_means = np.array([
+        float(lg.get("lg_shots") or 12.0),
+        float(lg.get("lg_shots_target") or 4.0),
+        float(lg.get("lg_fouls") or 11.0),
+        float(lg.get("lg_cards") or 2.0),
+        float(lg.get("lg_corners") or 5.0),
+    ])
     
-    home_for = float(home_profile.get("home_for", lg))
-    away_against = float(away_profile.get("away_against", lg))
-    home_val = 0.6 * home_for + 0.4 * away_against
+    print(f"   📈 Perfiles estadísticos cargados para {len(idx)} equipos")
     
-    away_for = float(away_profile.get("away_for", lg))
-    home_against = float(home_profile.get("home_against", lg))
-    away_val = 0.6 * away_for + 0.4 * home_against
-    
-    return home_val, away_val
+    return idx, profiles, league_means
+
+
+def _exp_stats(
+    home_idx: np.ndarray, away_idx: np.ndarray, profiles: np.ndarray, league_means: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Combina ataque y defensa: 60% for + 40% against.
+
+    Devuelve (home_vals, away_vals), arrays (partidos, stats). home_idx/away_idx
+    son posiciones en profiles; -1 = equipo sin perfil (promedio de liga).
+    """
+    # Fila NaN en la posición -1; NaN -> promedio de liga de la stat
+    p = np.concatenate([profiles, np.full((1,) + profiles.shape[1:], np.nan)])
+    p = np.where(np.isnan(p), league_means[None, :, None], p)
+    home, away = p[home_idx], p[away_idx]
+
+    home_vals = 0.6 * home[:, :, 0] + 0.4 * away[:, :, 3]
+    away_vals = 0.6 * away[:, :, 2] + 0.4 * home[:, :, 1]
+    return home_vals, away_vals
 
 
 def _calculate_weinston_lambdas(
-    home_team_id: int, away_team_id: int,
-    ratings: Dict[int, Dict[str, float]],
+    atk_home: np.ndarray, def_home: np.ndarray,
+    atk_away: np.ndarray, def_away: np.ndarray,
     mu_home: float, mu_away: float, home_adv: float
-) -> Tuple[float, float]:
-    """Calcula λ usando ratings de Weinston"""
-    home_ratings = ratings.get(home_team_id, {
-        "atk_home": 1.0, "def_home": 1.0, "atk_away": 1.0, "def_away": 1.0
-    })
-    away_ratings = ratings.get(away_team_id, {
-        "atk_home": 1.0, "def_home": 1.0, "atk_away": 1.0, "def_away": 1.0
-    })
-    
-    lam_home = mu_home * home_ratings["atk_home"] * away_ratings["def_away"] * home_adv
-    lam_away = mu_away * away_ratings["atk_away"] * home_ratings["def_home"]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula λ de todos los partidos a la vez usando ratings de Weinston.
+
+    Los ratings vienen alineados por partido (local / visitante); NaN =
+    equipo sin ratings (factor 1.0).
+    """
+    ah, dh = np.nan_to_num(atk_home, nan=1.0), np.nan_to_num(def_home, nan=1.0)
+    aa, da = np.nan_to_num(atk_away, nan=1.0), np.nan_to_num(def_away, nan=1.0)
+
+    lam_home = mu_home * ah * da * home_adv
+    lam_away = mu_away * aa * dh
 
     # Cap to realistic range: no team should be predicted > 6 goals in a single match
-    lam_home = min(float(lam_home), 6.0)
-    lam_away = min(float(lam_away), 6.0)
+    return np.minimum(lam_home, 6.0), np.minimum(lam_away, 6.0)
 
-    return lam_home, lam_away
+
+# Upsert por lotes con psycopg2.extras.execute_values: un INSERT multi-VALUES
+# por página en vez de un round-trip por partido
+_UPSERT_WEINSTON = """
+    INSERT INTO weinston_predictions
+        (match_id, local_goals, away_goals, result_1x2, over_2, both_score,
+         prob_home_win, prob_draw, prob_away_win, prob_over_25, prob_btts,
+         shots_home, shots_away, shots_target_home, shots_target_away,
+         fouls_home, fouls_away, cards_home, cards_away,
+         corners_home, corners_away, win_corners)
+    VALUES %s
+    ON CONFLICT (match_id) DO UPDATE SET
+        local_goals = EXCLUDED.local_goals, away_goals = EXCLUDED.away_goals,
+        result_1x2 = EXCLUDED.result_1x2, over_2 = EXCLUDED.over_2, both_score = EXCLUDED.both_score,
+        prob_home_win = EXCLUDED.prob_home_win, prob_draw = EXCLUDED.prob_draw, prob_away_win = EXCLUDED.prob_away_win,
+        prob_over_25 = EXCLUDED.prob_over_25, prob_btts = EXCLUDED.prob_btts,
+        shots_home = EXCLUDED.shots_home, shots_away = EXCLUDED.shots_away,
+        shots_target_home = EXCLUDED.shots_target_home, shots_target_away = EXCLUDED.shots_target_away,
+        fouls_home = EXCLUDED.fouls_home, fouls_away = EXCLUDED.fouls_away,
+        cards_home = EXCLUDED.cards_home, cards_away = EXCLUDED.cards_away,
+        corners_home = EXCLUDED.corners_home, corners_away = EXCLUDED.corners_away,
+        win_corners = EXCLUDED.win_corners
+"""
+
+_UPSERT_WEINSTON_TEMPLATE = """
+    (%(mid)s, %(lg)s, %(ag)s, %(r1x2)s, %(over2)s, %(btts)s,
+     %(pH)s, %(pD)s, %(pA)s, %(pO25)s, %(pBTTS)s,
+     %(sh)s, %(sa)s, %(sth)s, %(sta)s, %(fh)s, %(fa)s, %(ch)s, %(ca)s, %(coh)s, %(coa)s, %(wc)s)
+"""
+
+# Filas por INSERT multi-VALUES
+UPSERT_PAGE_SIZE = 500
+
+# Código result_1x2 por columna de aggregate_probs_batch (home, draw, away)
+_R1X2_CODES = np.array([1, 0, 2])
 
 
 def predict_and_upsert_weinston(
@@ -316,68 +386,64 @@ def predict_and_upsert_weinston(
     print(f"   Partidos a predecir: {len(match_ids)}")
     
     # ✅ CAMBIO: Pasar league_ctx a todas las funciones auxiliares
-    ratings = _load_weinston_ratings(conn, season_id, league_ctx=league_ctx)
+    matches, atk_home, def_home, atk_away, def_away = _load_fixture_ratings(
+        conn, season_id, match_ids, league_ctx=league_ctx
+    )
+    if not matches:
+        print("   ⚠️  Sin partidos que predecir")
+        return
     mu_home, mu_away, home_adv = _load_league_params(conn, season_id, league_ctx=league_ctx)
     
     print(f"   🔢 Parámetros: μ_home={mu_home:.3f}, μ_away={mu_away:.3f}, HFA={home_adv:.3f}")
     
     try:
-        profiles, league_means = _load_team_stat_profiles(conn, season_id, n_recent=20, league_ctx=league_ctx)
+        # Solo los equipos de estos partidos, no toda la liga
+        fixture_teams = sorted({t for _, h, a in matches for t in (h, a)})
+        prof_idx, profiles, league_means = _load_team_stat_profiles(
+            conn, season_id, n_recent=20, league_ctx=league_ctx, team_ids=fixture_teams
+        )
         use_profiles = True
     except Exception as e:
         print(f"   ⚠️  No se pudieron cargar perfiles: {e}")
         print(f"   ⚠️  Usando estimaciones basadas en lambdas")
-        profiles, league_means = {}, {}
+        prof_idx, profiles, league_means = {}, None, None
         use_profiles = False
     
-    q_matches = text("SELECT id, home_team_id, away_team_id FROM matches WHERE id = ANY(:ids)")
-    matches = conn.execute(q_matches, {"ids": match_ids}).fetchall()
-
-    upsert = text("""
-        INSERT INTO weinston_predictions
-            (match_id, local_goals, away_goals, result_1x2, over_2, both_score,
-             prob_home_win, prob_draw, prob_away_win, prob_over_25, prob_btts,
-             shots_home, shots_away, shots_target_home, shots_target_away,
-             fouls_home, fouls_away, cards_home, cards_away,
-             corners_home, corners_away, win_corners)
-        VALUES
-            (:mid, :lg, :ag, :r1x2, :over2, :btts,
-             :pH, :pD, :pA, :pO25, :pBTTS,
-             :sh, :sa, :sth, :sta, :fh, :fa, :ch, :ca, :coh, :coa, :wc)
-        ON CONFLICT (match_id) DO UPDATE SET
-            local_goals = EXCLUDED.local_goals, away_goals = EXCLUDED.away_goals,
-            result_1x2 = EXCLUDED.result_1x2, over_2 = EXCLUDED.over_2, both_score = EXCLUDED.both_score,
-            prob_home_win = EXCLUDED.prob_home_win, prob_draw = EXCLUDED.prob_draw, prob_away_win = EXCLUDED.prob_away_win,
-            prob_over_25 = EXCLUDED.prob_over_25, prob_btts = EXCLUDED.prob_btts,
-            shots_home = EXCLUDED.shots_home, shots_away = EXCLUDED.shots_away,
-            shots_target_home = EXCLUDED.shots_target_home, shots_target_away = EXCLUDED.shots_target_away,
-            fouls_home = EXCLUDED.fouls_home, fouls_away = EXCLUDED.fouls_away,
-            cards_home = EXCLUDED.cards_home, cards_away = EXCLUDED.cards_away,
-            corners_home = EXCLUDED.corners_home, corners_away = EXCLUDED.corners_away,
-            win_corners = EXCLUDED.win_corners
-    """)
-
-    predictions_saved = 0
-    for mid, home_id, away_id in matches:
-        lh, la = _calculate_weinston_lambdas(home_id, away_id, ratings, mu_home, mu_away, home_adv)
-        pr = _aggregate_probs(lh, la)
-
-        if pr["pH"] >= pr["pD"] and pr["pH"] >= pr["pA"]:
-            r1x2 = 1
-        elif pr["pD"] >= pr["pH"] and pr["pD"] >= pr["pA"]:
-            r1x2 = 0
-        else:
-            r1x2 = 2
+    # λ y matriz de marcadores de todos los partidos de una vez
+    lams_h, lams_a = _calculate_weinston_lambdas(
+        atk_home, def_home, atk_away, def_away, mu_home, mu_away, home_adv
+    )
+    outcomes = aggregate_probs_batch(lams_h, lams_a)
 
-        over2 = "OVER" if pr["pO25"] >= threshold else "UNDER"
-        btts  = "YES"  if pr["pBTTS"] >= threshold else "NO"
+    # Etiquetas de todos los partidos: argmax sobre (H, D, A) -> códigos 1/0/2.
+    # argmax toma el primer máximo: en empate gana H, luego D (como antes)
+    r1x2s = _R1X2_CODES[outcomes[:, :3].argmax(axis=1)].tolist()
+    over2s = np.where(outcomes[:, 3] >= threshold, "OVER", "UNDER").tolist()
+    bttss = np.where(outcomes[:, 4] >= threshold, "YES", "NO").tolist()
 
-        if use_profiles and profiles:
-            sh, sa   = _exp_stat("shots", home_id, away_id, profiles, league_means)
-            sth, sta = _exp_stat("shots_target", home_id, away_id, profiles, league_means)
-            fh, fa   = _exp_stat("fouls", home_id, away_id, profiles, league_means)
-            ch, ca   = _exp_stat("cards", home_id, away_id, profiles, league_means)
-            coh, coa = _exp_stat("corners", home_id, away_id, profiles, league_means)
+    # Stats esperadas de todos los partidos, una columna por stat de _PROFILE_STATS
+    # Equipos sin historial (ascendidos, inicio de temporada) usan los
+    # promedios de liga; solo sin match_stats en toda la liga se estima por λ
+    use_profiles = use_profiles and league_means is not None
+    if use_profiles:
+        stats_h, stats_a = _exp_stats(
+            np.fromiter((prof_idx.get(h, -1) for _, h, _ in matches), dtype=np.int64, count=len(matches)),
+            np.fromiter((prof_idx.get(a, -1) for _, _, a in matches), dtype=np.int64, count=len(matches)),
+            profiles, league_means,
+        )
+        stats_h, stats_a = stats_h.tolist(), stats_a.tolist()
+    else:
+        stats_h = stats_a = [None] * len(matches)
+
+    # Todo sale de .tolist() (int/float de Python): el payload no necesita casts
+    payload = []
+    for (mid, home_id, away_id), lh, la, (pH, pD, pA, pO25, pBTTS), r1x2, over2, btts, st_h, st_a in zip(
+        matches, lams_h.tolist(), lams_a.tolist(), outcomes.tolist(),
+        r1x2s, over2s, bttss, stats_h, stats_a,
+    ):
+        if use_profiles:
+            sh, sth, fh, ch, coh = st_h
+            sa, sta, fa, ca, coa = st_a
         else:
             sh = round(lh * 9 + 3, 2); sa = round(la * 9 + 3, 2)
             sth = round(lh * 3.5 + 1, 2); sta = round(la * 3.5 + 1, 2)
@@ -387,21 +453,23 @@ def predict_and_upsert_weinston(
         
         wc = "HOME" if coh > coa else ("AWAY" if coa > coh else "TIE")
 
-        conn.execute(upsert, {
-            "mid": int(mid), "lg": lh, "ag": la, "r1x2": int(r1x2),
+        payload.append({
+            "mid": mid, "lg": lh, "ag": la, "r1x2": r1x2,
             "over2": over2, "btts": btts,
-            "pH": float(pr["pH"]),
-            "pD": float(pr["pD"]),
-            "pA": float(pr["pA"]),
-            "pO25": float(pr["pO25"]),
-            "pBTTS": float(pr["pBTTS"]),
-            "sh": float(sh), "sa": float(sa),
-            "sth": float(sth), "sta": float(sta),
-            "fh": float(fh), "fa": float(fa),
-            "ch": float(ch), "ca": float(ca),
-            "coh": float(coh), "coa": float(coa),
+            "pH": pH, "pD": pD, "pA": pA, "pO25": pO25, "pBTTS": pBTTS,
+            "sh": sh, "sa": sa,
+            "sth": sth, "sta": sta,
+            "fh": fh, "fa": fa,
+            "ch": ch, "ca": ca,
+            "coh": coh, "coa": coa,
             "wc": wc,
         })
-        predictions_saved += 1
+
+    # Mismo cursor/transacción que conn
+    if payload:
+        with conn.connection.cursor() as cur:
+            execute_values(cur, _UPSERT_WEINSTON, payload,
+                           template=_UPSERT_WEINSTON_TEMPLATE, page_size=UPSERT_PAGE_SIZE)
+    predictions_saved = len(payload)
     
     print(f"   ✅ {predictions_saved} predicciones guardadas en weinston_predictions")
\ No newline at end of file
@@ -4,6 +4,9 @@ Gestor de ligas para scripts de automatización.
 Proporciona selección interactiva y configuración multi-liga.
 """
 
+import os
+import sys
+from dataclasses import dataclass, field
 from sqlalchemy import text
 from typing import List, Dict, Optional, Tuple
 from src.predictions.league_context import LeagueContext
@@ -19,37 +22,62 @@ class Colors:
     BOLD = '\033[1m'
 
 
+# Separadores de los headers (se arman una vez)
+SEP_CYAN = f"{Colors.CYAN}{'=' * 70}{Colors.END}"
+SEP_YELLOW = f"{Colors.YELLOW}{'=' * 70}{Colors.END}"
+
+
+def module_argv(module: str, *args) -> List[str]:
+    """argv para `python -m module args...` con el mismo intérprete (sin shell)"""
+    return [sys.executable, "-m", module, *map(str, args)]
+
+
+def subprocess_env(env_file: str) -> Dict[str, str]:
+    """Entorno del subproceso con ENV_FILE, para que use la BD seleccionada"""
+    env = os.environ.copy()
+    env['ENV_FILE'] = env_file
+    return env
+
+
+@dataclass(slots=True)
 class LeagueConfig:
     """Configuración de una liga para procesamiento"""
     
-    def __init__(self, league_id: int, league_name: str, country: str, 
-                 season_id: int, season_year: str, 
-                 csv_code: str, dayfirst: bool = True):
-        self.league_id = league_id
-        self.league_name = league_name
-        self.country = country
-        self.season_id = season_id
-        self.season_year = season_year
-        self.csv_code = csv_code  # E0, SP1, I1, etc.
-        self.dayfirst = dayfirst
+    league_id: int
+    league_name: str
+    country: str
+    season_id: int
+    season_year: str
+    csv_code: str  # E0, SP1, I1, etc.
+    dayfirst: bool = True
+    # Info de partidos para mostrar (la completa LeagueManager)
+    total_matches: int = 0
+    upcoming_matches: int = 0
+    finished_matches: int = 0
+    # Bandera del país, resuelta una vez al construir
+    flag: str = field(init=False, repr=False)
+    
+    # País -> emoji de bandera (atributo de clase, no campo)
+    _FLAGS = {
+        "England": "🏴󠁧󠁢󠁥󠁮󠁧󠁿",
+        "Spain": "🇪🇸",
+        "Italy": "🇮🇹",
+        "Germany": "🇩🇪",
+        "France": "🇫🇷",
+        "Brazil": "🇧🇷",
+        "Argentina": "🇦🇷",
+        "Colombia": "🇨🇴",
+    }
+    
+    def __post_init__(self):
+        self.flag = self._FLAGS.get(self.country, "⚽")
     
     def __str__(self):
-        flag = self.get_flag()
-        return f"{flag} {self.league_name} ({self.season_year}) - Season ID: {self.season_id}"
+        return f"{self.flag} {self.league_name} ({self.season_year}) - Season ID: {self.season_id}"
     
     def get_flag(self) -> str:
         """Mapea país a emoji de bandera"""
-        flags = {
-            "England": "🏴󠁧󠁢󠁥󠁮󠁧󠁿",
-            "Spain": "🇪🇸",
-            "Italy": "🇮🇹",
-            "Germany": "🇩🇪",
-            "France": "🇫🇷",
-            "Brazil": "🇧🇷",
-            "Argentina": "🇦🇷",
-            "Colombia": "🇨🇴",
-        }
-        return flags.get(self.country, "⚽")
+        return self.flag
     
     def get_csv_path(self, data_dir: str = "data/raw") -> str:
         """Retorna path típico del CSV para esta liga"""
@@ -76,10 +104,19 @@ class LeagueManager:
     def __init__(self, conn):
         self.conn = conn
         self.available_leagues = self._load_available_leagues()
+        # Índice por season_id para búsquedas O(1)
+        self._by_season = {c.season_id: c for c in self.available_leagues}
     
     def _load_available_leagues(self) -> List[LeagueConfig]:
         """Carga ligas con datos activos y sus configuraciones"""
+        # Temporada más reciente de cada liga en una sola pasada sobre seasons
+        # (antes: subconsulta correlacionada por liga)
         query = text("""
+            WITH latest AS (
+                SELECT league_id, MAX(year_start) AS max_year
+                FROM seasons
+                GROUP BY league_id
+            )
             SELECT 
                 l.id as league_id,
                 l.name as league_name,
@@ -90,11 +127,9 @@ class LeagueManager:
                 COUNT(DISTINCT CASE WHEN m.home_goals IS NULL THEN m.id END) as upcoming_matches,
                 COUNT(DISTINCT CASE WHEN m.home_goals IS NOT NULL THEN m.id END) as finished_matches
             FROM leagues l
-            JOIN seasons s ON s.league_id = l.id
+            JOIN latest lt ON lt.league_id = l.id
+            JOIN seasons s ON s.league_id = l.id AND s.year_start = lt.max_year
             LEFT JOIN matches m ON m.season_id = s.id
-            WHERE s.year_start = (
-                SELECT MAX(year_start) FROM seasons WHERE league_id = l.id
-            )
             GROUP BY l.id, l.name, l.country, s.id, s.year_start, s.year_end
             HAVING COUNT(DISTINCT m.id) > 0
             ORDER BY l.name
@@ -131,9 +166,9 @@ class LeagueManager:
     
     def display_available_leagues(self):
         """Muestra ligas disponibles con formato colorido"""
-        print(f"\n{Colors.CYAN}{'='*70}{Colors.END}")
+        print(f"\n{SEP_CYAN}")
         print(f"{Colors.BOLD}  LIGAS DISPONIBLES{Colors.END}")
-        print(f"{Colors.CYAN}{'='*70}{Colors.END}\n")
+        print(f"{SEP_CYAN}\n")
         
         for idx, config in enumerate(self.available_leagues, 1):
             print(f"  {Colors.BOLD}{idx}.{Colors.END} {config}")
@@ -188,16 +223,13 @@ class LeagueManager:
 
     def get_league_by_season_id(self, season_id: int) -> Optional[LeagueConfig]:
         """Obtiene configuración de liga por season_id"""
-        for config in self.available_leagues:
-            if config.season_id == season_id:
-                return config
-        return None
+        return self._by_season.get(season_id)
     
     def confirm_multi_league_operation(self, selected: List[LeagueConfig], operation: str) -> bool:
         """Confirma operación multi-liga con el usuario"""
-        print(f"\n{Colors.YELLOW}{'='*70}{Colors.END}")
+        print(f"\n{SEP_YELLOW}")
         print(f"{Colors.BOLD}  CONFIRMACIÓN: {operation.upper()}{Colors.END}")
-        print(f"{Colors.YELLOW}{'='*70}{Colors.END}\n")
+        print(f"{SEP_YELLOW}\n")
         
         print(f"  Se procesarán {Colors.BOLD}{len(selected)}{Colors.END} liga(s):\n")
         for config in selected:
@@ -217,9 +249,12 @@ def print_league_header(config: LeagueConfig, step_num: int = None, total_steps:
     else:
         progress = ""
     
-    print(f"\n{Colors.CYAN}{'='*70}{Colors.END}")
-    print(f"{Colors.BOLD}  {config.get_flag()} {config.league_name} ({config.season_year}){progress}{Colors.END}")
-    print(f"{Colors.CYAN}{'='*70}{Colors.END}\n")
+    # Una sola escritura por cabecera (se imprime una por liga)
+    print(
+        f"\n{SEP_CYAN}\n"
+        f"{Colors.BOLD}  {config.flag} {config.league_name} ({config.season_year}){progress}{Colors.END}\n"
+        f"{SEP_CYAN}\n"
+    )
 
 
 # Ejemplo de uso
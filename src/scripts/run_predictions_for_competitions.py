@@ -24,6 +24,7 @@ CURRENT_YEAR = date.today().year
 
 def main() -> None:
     with engine.begin() as conn:
+        pending = []  # (comp, season_id, match_ids)
         for comp in COMPETITIONS:
             row = conn.execute(
                 text("""
@@ -48,10 +49,14 @@ def main() -> None:
             if not match_rows:
                 print(f"ℹ️  {comp['name']}: sin partidos pendientes")
                 continue
-            match_ids = [r.id for r in match_rows]
+            pending.append((comp, season_id, [r.id for r in match_rows]))
 
+        # Contextos de todas las temporadas en una sola consulta
+        contexts = LeagueContext.from_seasons(conn, [season_id for _, season_id, _ in pending])
+
+        for comp, season_id, match_ids in pending:
             print(f"\n🎯 {comp['name']} (season_id={season_id}): {len(match_ids)} partido(s) pendiente(s)")
-            league_ctx = LeagueContext.from_season(conn, season_id)
+            league_ctx = contexts[season_id]
             predict_and_upsert_poisson(conn, season_id, match_ids, league_ctx=league_ctx)
             predict_and_upsert_weinston(conn, season_id, match_ids, league_ctx=league_ctx)
             print(f"   ✅ predicciones generadas")
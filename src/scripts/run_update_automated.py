@@ -14,7 +14,10 @@ Uso:
 import sys
 import os
 import argparse
-from datetime import datetime
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from typing import List
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
@@ -22,18 +25,24 @@ from dotenv import load_dotenv
 # Importar funciones del script original
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
 
-from src.scripts.league_manager import LeagueManager, LeagueConfig, Colors
+from src.scripts.league_manager import (
+    LeagueManager, LeagueConfig, Colors, SEP_CYAN, module_argv, subprocess_env
+)
 from src.predictions.league_context import LeagueContext
+from src.predictions.materialized_views import refresh_prediction_inputs
 from src.predictions.upcoming_poisson import predict_and_upsert_poisson
 from src.predictions.upcoming_weinston import predict_and_upsert_weinston
+from src.predictions.betting_lines import generate_betting_lines, validate_betting_lines
+from src.ingest.load_unified import load_csv
+import shlex
 import subprocess
 import requests
 
 
 def print_step(msg: str):
-    print(f"\n{Colors.CYAN}{'='*70}{Colors.END}")
+    print(f"\n{SEP_CYAN}")
     print(f"{Colors.BOLD}{msg}{Colors.END}")
-    print(f"{Colors.CYAN}{'='*70}{Colors.END}")
+    print(SEP_CYAN)
 
 
 def print_success(msg: str):
@@ -52,6 +61,48 @@ def print_info(msg: str):
     print(f"{Colors.BLUE}ℹ️  {msg}{Colors.END}")
 
 
+# Con varias ligas en paralelo, cada hilo acumula su salida en _league_output.buffer
+# y run_league la escribe entera bajo _print_lock (sin intercalar ligas)
+_league_output = threading.local()
+
+
+class _LeagueBufferedStream:
+    """sys.stdout / sys.stderr: en un hilo con buffer activo, escribe en el buffer de su liga"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, s: str) -> int:
+        buffer = getattr(_league_output, "buffer", None)
+        if buffer is None:
+            return self._stream.write(s)
+        buffer.append(s)
+        return len(s)
+
+    def flush(self):
+        if getattr(_league_output, "buffer", None) is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _run_module(env_file: str, module: str, *args) -> bool:
+    """Ejecuta `python -m module args` contra la BD de env_file; True si terminó bien"""
+    argv = module_argv(module, *args)
+    print(f"\n{Colors.CYAN}🔄 Ejecutando: {shlex.join(argv)}{Colors.END}")
+    if getattr(_league_output, "buffer", None) is None:
+        return subprocess.run(argv, env=subprocess_env(env_file)).returncode == 0
+
+    # El subprocess escribe directo al fd heredado: se captura para el buffer de la liga
+    proc = subprocess.run(
+        argv, env=subprocess_env(env_file),
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace",
+    )
+    print(proc.stdout, end="")
+    return proc.returncode == 0
+
+
 def setup_database(env_file: str):
     """Configura la conexión a la base de datos"""
     print_step("🔧 CONFIGURANDO BASE DE DATOS")
@@ -105,10 +156,10 @@ def setup_database(env_file: str):
     try:
         engine = create_engine(database_url)
 
-        # Probar conexión
+        # Probar conexión: abrirla ya valida host y credenciales, sin consulta extra
         print_info("Probando conexión...")
-        with engine.connect() as conn:
-            result = conn.execute(text("SELECT version()")).scalar()
+        with engine.connect():
+            pass
 
         print_success("✅ Conexión exitosa")
         print(f"\n{Colors.BOLD}Detalles de conexión:{Colors.END}")
@@ -163,6 +214,17 @@ def get_leagues(engine, leagues_param: str) -> List[LeagueConfig]:
             return selected_leagues
 
 
+_Q_PENDING_MATCHES = text("""
+    SELECT id, date, home_team_id, away_team_id
+    FROM matches
+    WHERE season_id = :sid
+      AND date BETWEEN :dfrom AND :dto
+      AND home_goals IS NULL
+      AND away_goals IS NULL
+    ORDER BY date
+""")
+
+
 def mode_predict_auto(engine, league_config: LeagueConfig, date_from: str, date_to: str) -> bool:
     """Modo: Generar predicciones (versión automatizada)"""
     print_step(f"🎯 GENERAR PREDICCIONES - {league_config.league_name}")
@@ -170,18 +232,8 @@ def mode_predict_auto(engine, league_config: LeagueConfig, date_from: str, date_
     season_id = league_config.season_id
 
     # Verificar partidos sin resultados
-    query = text("""
-        SELECT id, date, home_team_id, away_team_id
-        FROM matches
-        WHERE season_id = :sid
-          AND date BETWEEN :dfrom AND :dto
-          AND home_goals IS NULL
-          AND away_goals IS NULL
-        ORDER BY date
-    """)
-
     with engine.begin() as conn:
-        rows = conn.execute(query, {"sid": season_id, "dfrom": date_from, "dto": date_to}).fetchall()
+        rows = conn.execute(_Q_PENDING_MATCHES, {"sid": season_id, "dfrom": date_from, "dto": date_to}).fetchall()
         count = len(rows)
 
     if count == 0:
@@ -212,7 +264,6 @@ def mode_predict_auto(engine, league_config: LeagueConfig, date_from: str, date_
 
     except Exception as e:
         print_error(f"Error al generar predicciones: {e}")
-        import traceback
         traceback.print_exc()
         return False
 
@@ -221,16 +272,9 @@ def mode_retrain_auto(engine, league_config: LeagueConfig, env_file: str) -> boo
     """Modo: Re-entrenar modelo Weinston (versión automatizada)"""
     print_step(f"🔄 RE-ENTRENAR WEINSTON - {league_config.league_name}")
 
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-
-    cmd = f"python -m src.predictions.cli fit --season-id {league_config.season_id}"
-
-    print(f"\n{Colors.CYAN}🔄 Ejecutando: {cmd}{Colors.END}")
-
-    result = subprocess.run(cmd, shell=True, env=env)
-
-    if result.returncode == 0:
+    if _run_module(env_file, "src.predictions.cli", "fit", "--season-id", league_config.season_id):
+        # El fit corrió en otro proceso: el contexto cacheado aquí quedó viejo
+        LeagueContext.invalidate(league_config.season_id)
         print_success(f"Weinston re-entrenado para {league_config.league_name}")
         return True
     else:
@@ -238,22 +282,29 @@ def mode_retrain_auto(engine, league_config: LeagueConfig, env_file: str) -> boo
         return False
 
 
-def generate_betting_lines_auto(engine, league_config: LeagueConfig, date_from: str, date_to: str, env_file: str) -> bool:
+def generate_betting_lines_auto(engine, league_config: LeagueConfig, date_from: str, date_to: str, env_file: str,
+                                isolate: bool = False) -> bool:
     """Genera líneas de apuesta (versión automatizada)"""
     print_info(f"Generando betting lines para {league_config.league_name}...")
 
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-
-    cmd = (
-        f"python -m src.predictions.cli betting-lines "
-        f"--season-id {league_config.season_id} "
-        f"--from {date_from} --to {date_to}"
-    )
-
-    result = subprocess.run(cmd, shell=True, env=env)
+    if isolate:
+        argv = module_argv(
+            "src.predictions.cli", "betting-lines",
+            "--season-id", league_config.season_id,
+            "--from", date_from, "--to", date_to,
+        )
+        ok = subprocess.run(argv, env=subprocess_env(env_file)).returncode == 0
+    else:
+        # Mismo proceso y mismo engine (ya apunta a la BD de env_file)
+        try:
+            with engine.begin() as conn:
+                generate_betting_lines(conn, league_config.season_id, date_from, date_to)
+            ok = True
+        except Exception as e:
+            print_error(f"Error al generar betting lines: {e}")
+            ok = False
 
-    if result.returncode == 0:
+    if ok:
         print_success(f"Betting lines generadas para {league_config.league_name}")
         return True
     return False
@@ -305,7 +356,7 @@ def generate_best_bets_auto(league_config: LeagueConfig, date_from: str, date_to
         return False
 
 
-def mode_load_results_auto(engine, league_config: LeagueConfig, env_file: str) -> bool:
+def mode_load_results_auto(engine, league_config: LeagueConfig, env_file: str, isolate: bool = False) -> bool:
     """Modo: Cargar resultados desde CSV (versión automatizada)"""
     print_step(f"📥 CARGAR RESULTADOS - {league_config.league_name}")
 
@@ -318,25 +369,38 @@ def mode_load_results_auto(engine, league_config: LeagueConfig, env_file: str) -
 
     print_info(f"Cargando desde: {csv_path}")
 
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
+    if isolate:
+        args = [
+            csv_path,
+            "--league", league_config.league_name,
+            "--div", league_config.csv_code,
+            "--season-id", league_config.season_id,
+        ]
 
-    cmd = (
-        f"python -m src.ingest.load_unified {csv_path} "
-        f"--league \"{league_config.league_name}\" "
-        f"--div {league_config.csv_code} "
-        f"--season-id {league_config.season_id} "
-    )
-
-    if league_config.dayfirst:
-        cmd += "--dayfirst"
+        if league_config.dayfirst:
+            args.append("--dayfirst")
 
-    print(f"\n{Colors.CYAN}🔄 Ejecutando: {cmd}{Colors.END}")
-
-    result = subprocess.run(cmd, shell=True, env=env)
+        ok = _run_module(env_file, "src.ingest.load_unified", *args)
+    else:
+        # Mismo proceso y mismo engine (ya apunta a la BD de env_file)
+        try:
+            with engine.begin() as conn:
+                load_csv(
+                    conn, csv_path,
+                    league=league_config.league_name,
+                    div=league_config.csv_code,
+                    season_id=league_config.season_id,
+                    dayfirst=league_config.dayfirst,
+                )
+            ok = True
+        except Exception as e:
+            print_error(f"Error al cargar resultados: {e}")
+            ok = False
 
-    if result.returncode == 0:
+    if ok:
         print_success(f"Resultados cargados para {league_config.league_name}")
+        # Resultados ya confirmados: las vistas de fortalezas los incorporan
+        refresh_prediction_inputs(engine)
         return True
     else:
         print_error("Error al cargar resultados")
@@ -356,23 +420,16 @@ def mode_load_fixtures_auto(league_config: LeagueConfig, env_file: str) -> bool:
 
     print_info(f"Cargando fixtures desde: {fixtures_path}")
 
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-
-    cmd = (
-        f"python -m src.fixtures.cli bulk {fixtures_path} "
-        f"--season-id {league_config.season_id} "
-        f"--league \"{league_config.league_name}\""
-    )
+    args = [
+        "bulk", fixtures_path,
+        "--season-id", league_config.season_id,
+        "--league", league_config.league_name,
+    ]
 
     if league_config.dayfirst:
-        cmd += " --dayfirst"
+        args.append("--dayfirst")
 
-    print(f"\n{Colors.CYAN}🔄 Ejecutando: {cmd}{Colors.END}")
-
-    result = subprocess.run(cmd, shell=True, env=env)
-
-    if result.returncode == 0:
+    if _run_module(env_file, "src.fixtures.cli", *args):
         print_success(f"Fixtures cargados para {league_config.league_name}")
         return True
     else:
@@ -384,20 +441,11 @@ def mode_evaluate_auto(engine, league_config: LeagueConfig, date_from: str, date
     """Modo: Evaluar predicciones (versión automatizada)"""
     print_step(f"📊 EVALUAR PREDICCIONES - {league_config.league_name}")
 
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-
-    cmd = (
-        f"python -m src.predictions.cli evaluate "
-        f"--season-id {league_config.season_id} "
-        f"--from {date_from} --to {date_to}"
-    )
-
-    print(f"\n{Colors.CYAN}🔄 Ejecutando: {cmd}{Colors.END}")
-
-    result = subprocess.run(cmd, shell=True, env=env)
-
-    if result.returncode == 0:
+    if _run_module(
+        env_file, "src.predictions.cli", "evaluate",
+        "--season-id", league_config.season_id,
+        "--from", date_from, "--to", date_to,
+    ):
         print_success(f"Evaluación completada para {league_config.league_name}")
         return True
     else:
@@ -405,22 +453,29 @@ def mode_evaluate_auto(engine, league_config: LeagueConfig, date_from: str, date
         return False
 
 
-def validate_betting_lines_auto(engine, league_config: LeagueConfig, date_from: str, date_to: str, env_file: str) -> bool:
+def validate_betting_lines_auto(engine, league_config: LeagueConfig, date_from: str, date_to: str, env_file: str,
+                                isolate: bool = False) -> bool:
     """Valida líneas de apuesta (versión automatizada)"""
     print_info(f"Validando betting lines para {league_config.league_name}...")
 
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-
-    cmd = (
-        f"python -m src.predictions.cli betting-lines-validate "
-        f"--season-id {league_config.season_id} "
-        f"--from {date_from} --to {date_to}"
-    )
-
-    result = subprocess.run(cmd, shell=True, env=env)
+    if isolate:
+        argv = module_argv(
+            "src.predictions.cli", "betting-lines-validate",
+            "--season-id", league_config.season_id,
+            "--from", date_from, "--to", date_to,
+        )
+        ok = subprocess.run(argv, env=subprocess_env(env_file)).returncode == 0
+    else:
+        # Mismo proceso y mismo engine (ya apunta a la BD de env_file)
+        try:
+            with engine.begin() as conn:
+                validate_betting_lines(conn, league_config.season_id, date_from, date_to)
+            ok = True
+        except Exception as e:
+            print_error(f"Error al validar betting lines: {e}")
+            ok = False
 
-    if result.returncode == 0:
+    if ok:
         print_success(f"Betting lines validadas para {league_config.league_name}")
         return True
     return False
@@ -462,6 +517,80 @@ def validate_best_bets_auto(league_config: LeagueConfig, env_file: str) -> bool:
         return False
 
 
+# Modos cuyo trabajo por liga solo toca filas de su season_id y se pueden
+# correr en paralelo. complete/finish no: cargan CSVs y las betting lines
+# resetean la secuencia de betting_lines_predictions (setval sobre MAX(id)).
+PARALLEL_MODES = ('predict', 'retrain')
+
+# Serializa la salida de cada liga cuando hay varios workers
+_print_lock = threading.Lock()
+
+
+def run_league(engine, args, idx: int, total: int, league_config: LeagueConfig, buffered: bool = False) -> bool:
+    """
+    Ejecuta el modo de args para una liga. Retorna True si terminó sin problemas.
+
+    Con buffered (varios workers; requiere _LeagueBufferedStream en sys.stdout /
+    sys.stderr) la salida de la liga se acumula y se escribe de una vez al terminar.
+    """
+    if not buffered:
+        return _run_league(engine, args, idx, total, league_config)
+
+    _league_output.buffer = []
+    try:
+        return _run_league(engine, args, idx, total, league_config)
+    finally:
+        output, _league_output.buffer = "".join(_league_output.buffer), None
+        with _print_lock:
+            sys.stdout.write(output)
+            sys.stdout.flush()
+
+
+def _run_league(engine, args, idx: int, total: int, league_config: LeagueConfig) -> bool:
+    print(f"\n{Colors.BOLD}{Colors.CYAN}[{idx}/{total}] {league_config.league_name}{Colors.END}")
+
+    success = False
+
+    try:
+        if args.mode == 'complete':
+            # Flujo: LOAD FIXTURES → RETRAIN → PREDICT → BETTING LINES → BEST BETS
+            if mode_load_fixtures_auto(league_config, args.env_file):
+                if mode_retrain_auto(engine, league_config, args.env_file):
+                    if mode_predict_auto(engine, league_config, args.date_from, args.date_to):
+                        if generate_betting_lines_auto(engine, league_config, args.date_from, args.date_to, args.env_file,
+                                                       isolate=args.isolate):
+                            generate_best_bets_auto(league_config, args.date_from, args.date_to, args.env_file)
+                            success = True
+
+        elif args.mode == 'finish':
+            # Flujo: LOAD RESULTS → EVALUATE → VALIDATE BETTING → VALIDATE BEST BETS
+            if mode_load_results_auto(engine, league_config, args.env_file, isolate=args.isolate):
+                if mode_evaluate_auto(engine, league_config, args.date_from, args.date_to, args.env_file):
+                    if validate_betting_lines_auto(engine, league_config, args.date_from, args.date_to, args.env_file,
+                                                   isolate=args.isolate):
+                        validate_best_bets_auto(league_config, args.env_file)
+                        success = True
+
+        elif args.mode == 'predict':
+            success = mode_predict_auto(engine, league_config, args.date_from, args.date_to)
+
+        elif args.mode == 'retrain':
+            success = mode_retrain_auto(engine, league_config, args.env_file)
+
+        elif args.mode == 'best-bets':
+            success = generate_best_bets_auto(league_config, args.date_from, args.date_to, args.env_file)
+
+    except Exception as e:
+        print_error(f"Error en {league_config.league_name}: {e}")
+        return False
+
+    if success:
+        print_success(f"✓ {league_config.league_name} completada")
+    else:
+        print_warning(f"⚠️  {league_config.league_name} con advertencias")
+    return success
+
+
 def main():
     parser = argparse.ArgumentParser(description='Actualización automatizada de predicciones')
     parser.add_argument('--mode', required=True,
@@ -473,6 +602,10 @@ def main():
                        help='Ligas a procesar (all o códigos separados por coma: E0,SP1,D1,I1)')
     parser.add_argument('--env-file', default='.env.production',
                        help='Archivo de configuración (.env o .env.production)')
+    parser.add_argument('--isolate', action='store_true',
+                       help='Betting lines y carga de resultados como subprocess en vez de en el mismo proceso (depuración)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help=f"Ligas en paralelo (solo modos {', '.join(PARALLEL_MODES)}; default 1)")
 
     args = parser.parse_args()
 
@@ -483,8 +616,8 @@ def main():
             sys.exit(1)
 
         try:
-            datetime.strptime(args.date_from, "%Y-%m-%d")
-            datetime.strptime(args.date_to, "%Y-%m-%d")
+            date.fromisoformat(args.date_from)
+            date.fromisoformat(args.date_to)
         except ValueError:
             print_error("Formato de fecha inválido (usar YYYY-MM-DD)")
             sys.exit(1)
@@ -503,58 +636,39 @@ def main():
     print(f"  • Fechas: {args.date_from} → {args.date_to}" if args.date_from else "  • Fechas: N/A")
     print(f"{Colors.YELLOW}{'─'*70}{Colors.END}\n")
 
-    # Ejecutar operaciones
-    success_count = 0
-    failed_leagues = []
-
-    for idx, league_config in enumerate(leagues, 1):
-        print(f"\n{Colors.BOLD}{Colors.CYAN}[{idx}/{len(leagues)}] {league_config.league_name}{Colors.END}")
-
-        success = False
-
-        try:
-            if args.mode == 'complete':
-                # Flujo: LOAD FIXTURES → RETRAIN → PREDICT → BETTING LINES → BEST BETS
-                if mode_load_fixtures_auto(league_config, args.env_file):
-                    if mode_retrain_auto(engine, league_config, args.env_file):
-                        if mode_predict_auto(engine, league_config, args.date_from, args.date_to):
-                            if generate_betting_lines_auto(engine, league_config, args.date_from, args.date_to, args.env_file):
-                                generate_best_bets_auto(league_config, args.date_from, args.date_to, args.env_file)
-                                success = True
-
-            elif args.mode == 'finish':
-                # Flujo: LOAD RESULTS → EVALUATE → VALIDATE BETTING → VALIDATE BEST BETS
-                if mode_load_results_auto(engine, league_config, args.env_file):
-                    if mode_evaluate_auto(engine, league_config, args.date_from, args.date_to, args.env_file):
-                        if validate_betting_lines_auto(engine, league_config, args.date_from, args.date_to, args.env_file):
-                            validate_best_bets_auto(league_config, args.env_file)
-                            success = True
-
-            elif args.mode == 'predict':
-                success = mode_predict_auto(engine, league_config, args.date_from, args.date_to)
+    # Ejecutar operaciones (en paralelo solo si el modo lo admite)
+    workers = max(1, min(args.workers, len(leagues))) if args.mode in PARALLEL_MODES else 1
+    if args.workers > 1 and args.mode not in PARALLEL_MODES:
+        print_warning(f"El modo '{args.mode}' se ejecuta secuencial (--workers ignorado)")
 
-            elif args.mode == 'retrain':
-                success = mode_retrain_auto(engine, league_config, args.env_file)
+    # Fortalezas recientes al día antes de predecir (una vez para todas las ligas;
+    # las vistas fijan CURRENT_DATE al refrescarse)
+    if args.mode in ('complete', 'predict'):
+        print_info("Refrescando vistas de fortalezas...")
+        refresh_prediction_inputs(engine)
 
-            elif args.mode == 'best-bets':
-                success = generate_best_bets_auto(league_config, args.date_from, args.date_to, args.env_file)
+    buffered = workers > 1
+    stdout, stderr = sys.stdout, sys.stderr
+    if buffered:
+        sys.stdout = _LeagueBufferedStream(stdout)
+        sys.stderr = _LeagueBufferedStream(stderr)
 
-            if success:
-                print_success(f"✓ {league_config.league_name} completada")
-                success_count += 1
-            else:
-                print_warning(f"⚠️  {league_config.league_name} con advertencias")
-                failed_leagues.append(league_config.league_name)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                lambda item: run_league(engine, args, item[0], len(leagues), item[1], buffered=buffered),
+                enumerate(leagues, 1),
+            ))
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
 
-        except Exception as e:
-            print_error(f"Error en {league_config.league_name}: {e}")
-            failed_leagues.append(league_config.league_name)
-            continue
+    success_count = sum(results)
+    failed_leagues = [lc.league_name for lc, ok in zip(leagues, results) if not ok]
 
     # Resumen final
     print(f"\n{Colors.BOLD}{Colors.CYAN}{'='*70}{Colors.END}")
     print(f"{Colors.BOLD}  RESUMEN{Colors.END}")
-    print(f"{Colors.CYAN}{'='*70}{Colors.END}\n")
+    print(f"{SEP_CYAN}\n")
 
     print(f"  Ligas procesadas: {success_count}/{len(leagues)}")
 
@@ -6,14 +6,24 @@ Valida el estado del sistema antes de ejecutar comandos.
 CAMBIOS:
 - Selector de base de datos al inicio (localhost o producción)
 - Resto del código sin cambios (usa subprocess como el original)
+- Betting lines en el mismo proceso, con el engine de la BD seleccionada
+  (`--isolate` vuelve a lanzarlas como subprocess, para depurar)
 """
 import sys
 import os
-from datetime import datetime
-from typing import Tuple, Optional, List
+import atexit
+import csv
+import traceback
+from datetime import date
+from functools import lru_cache
+from itertools import islice
+from dataclasses import dataclass
+from typing import Callable, Optional, List
 from sqlalchemy import text, create_engine
-from dotenv import load_dotenv
+from sqlalchemy.engine import Connection, Engine
+from dotenv import dotenv_values
 import requests
+import shlex
 import subprocess
 
 # League Manager
@@ -21,15 +31,21 @@ from src.scripts.league_manager import (
     LeagueManager, 
     LeagueConfig, 
     print_league_header,
-    Colors
+    Colors,
+    SEP_CYAN,
+    module_argv,
+    subprocess_env
 )
 
 # Contexto de liga
 from src.predictions.league_context import LeagueContext
+from src.predictions.materialized_views import refresh_prediction_inputs
 
 # Funciones de predicción
 from src.predictions.upcoming_poisson import predict_and_upsert_poisson
 from src.predictions.upcoming_weinston import predict_and_upsert_weinston
+from src.predictions.betting_lines import generate_betting_lines, validate_betting_lines
+from src.ingest.load_unified import load_csv
 
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -38,6 +54,40 @@ from src.predictions.upcoming_weinston import predict_and_upsert_weinston
 
 engine = None  # Se inicializa en select_database()
 
+# --isolate: betting lines y carga de resultados como subprocess (python -m ...)
+ISOLATE = "--isolate" in sys.argv[1:]
+
+# Índices que usan las verificaciones por rango de fechas (nombre -> migración)
+EXPECTED_INDEXES = {
+    "idx_matches_season_date": "migrations/add_season_date_range_index.sql",
+    "idx_matches_season_date_played": "migrations/add_stat_profile_indexes.sql",
+}
+
+# Un engine (y su pool) por URL: volver a seleccionar la misma BD lo reutiliza
+_ENGINE_CACHE: dict[str, Engine] = {}
+
+
+def _get_engine(database_url: str) -> Engine:
+    """Engine cacheado por URL; se cierra al salir del proceso."""
+    eng = _ENGINE_CACHE.get(database_url)
+    if eng is None:
+        # pre_ping: descarta conexiones que el servidor cerró (Render corta
+        # las ociosas); recycle: no reutiliza conexiones de más de 30 min
+        eng = create_engine(database_url, pool_pre_ping=True, pool_recycle=1800)
+        atexit.register(eng.dispose)
+        _ENGINE_CACHE[database_url] = eng
+    return eng
+
+
+@lru_cache(maxsize=4)
+def _load_env(env_file: str) -> dict:
+    """
+    Variables del archivo .env, parseado una sola vez por archivo.
+    No toca os.environ: los subprocesos reciben ENV_FILE y lo cargan ellos.
+    El dict es compartido (cache): solo lectura.
+    """
+    return dotenv_values(env_file)
+
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 # SELECTOR DE BASE DE DATOS
@@ -50,18 +100,18 @@ def select_database():
     """
     global engine
     
-    print(f"{Colors.BOLD}{Colors.CYAN}")
-    print("╔════════════════════════════════════════════════════════════╗")
-    print("║     55sportsBet - Actualización Inteligente MULTI-LIGA    ║")
-    print("╚════════════════════════════════════════════════════════════╝")
-    print(f"{Colors.END}")
-    
-    print(f"\n{Colors.BOLD}SELECCIÓN DE BASE DE DATOS{Colors.END}")
-    print(f"{Colors.CYAN}{'='*70}{Colors.END}\n")
-    
-    print("  1. 🏠 LOCALHOST  - Base de datos local (desarrollo)")
-    print("  2. 🌐 PRODUCCIÓN - Base de datos en Render (producción)")
-    print("  0. ❌ SALIR\n")
+    _emit([
+        f"{Colors.BOLD}{Colors.CYAN}",
+        "╔════════════════════════════════════════════════════════════╗",
+        "║     55sportsBet - Actualización Inteligente MULTI-LIGA    ║",
+        "╚════════════════════════════════════════════════════════════╝",
+        f"{Colors.END}",
+        f"\n{Colors.BOLD}SELECCIÓN DE BASE DE DATOS{Colors.END}",
+        f"{SEP_CYAN}\n",
+        "  1. 🏠 LOCALHOST  - Base de datos local (desarrollo)",
+        "  2. 🌐 PRODUCCIÓN - Base de datos en Render (producción)",
+        "  0. ❌ SALIR\n",
+    ])
     
     choice = input(f"{Colors.GREEN}Selecciona la base de datos a usar (0-2): {Colors.END}").strip()
     
@@ -83,9 +133,11 @@ def select_database():
         db_name = "PRODUCCIÓN"
         db_emoji = "🌐"
     
-    print(f"\n{Colors.CYAN}{'─'*70}{Colors.END}")
-    print(f"{db_emoji} Configurando conexión a {Colors.BOLD}{db_name}{Colors.END}...")
-    print(f"{Colors.CYAN}{'─'*70}{Colors.END}\n")
+    _emit([
+        f"\n{Colors.CYAN}{'─'*70}{Colors.END}",
+        f"{db_emoji} Configurando conexión a {Colors.BOLD}{db_name}{Colors.END}...",
+        f"{Colors.CYAN}{'─'*70}{Colors.END}\n",
+    ])
     
     # Verificar que el archivo existe
     if not os.path.exists(env_file):
@@ -96,24 +148,24 @@ def select_database():
     
     print_success(f"Archivo encontrado: {env_file}")
     
-    # IMPORTANTE: Limpiar variables de entorno previas
+    # IMPORTANTE: Limpiar variables de entorno previas (los subprocesos heredan
+    # os.environ y deben tomar la BD del ENV_FILE, no de la sesión anterior)
     env_vars_to_clear = [
         'DB_HOST', 'DB_PORT', 'DB_NAME', 'DB_USER', 
         'DB_PASSWORD', 'DB_PASS', 'DB_SCHEMA', 'DATABASE_URL'
     ]
     for var in env_vars_to_clear:
-        if var in os.environ:
-            del os.environ[var]
+        os.environ.pop(var, None)
     
-    # Cargar variables de entorno
-    load_dotenv(env_file, override=True)
+    # Leer el archivo una vez (cacheado por archivo)
+    env_vals = _load_env(env_file)
     
     # Obtener credenciales (soporta DB_PASS y DB_PASSWORD)
-    db_host = os.getenv('DB_HOST')
-    db_port = os.getenv('DB_PORT', '5432')
-    db_database = os.getenv('DB_NAME')
-    db_user = os.getenv('DB_USER')
-    db_password = os.getenv('DB_PASSWORD') or os.getenv('DB_PASS')
+    db_host = env_vals.get('DB_HOST')
+    db_port = env_vals.get('DB_PORT') or '5432'
+    db_database = env_vals.get('DB_NAME')
+    db_user = env_vals.get('DB_USER')
+    db_password = env_vals.get('DB_PASSWORD') or env_vals.get('DB_PASS')
     
     # Validar que todas las variables estén presentes
     missing_vars = []
@@ -128,15 +180,15 @@ def select_database():
     
     if missing_vars:
         print_error(f"Variables de entorno faltantes en {env_file}:")
-        for var in missing_vars:
-            print(f"   ❌ {var}")
-        print()
+        _emit([f"   ❌ {var}" for var in missing_vars] + [""])
         print_info("Tu archivo .env debe contener:")
-        print("   DB_HOST=...")
-        print("   DB_PORT=...")
-        print("   DB_NAME=...")
-        print("   DB_USER=...")
-        print("   DB_PASSWORD=...  (o DB_PASS=...)")
+        _emit([
+            "   DB_HOST=...",
+            "   DB_PORT=...",
+            "   DB_NAME=...",
+            "   DB_USER=...",
+            "   DB_PASSWORD=...  (o DB_PASS=...)",
+        ])
         sys.exit(1)
     
     # Construir URL de conexión
@@ -144,32 +196,45 @@ def select_database():
     
     # Crear engine
     try:
-        engine = create_engine(database_url)
+        engine = _get_engine(database_url)
         
-        # Probar conexión
+        # Probar conexión (abrirla ya la valida; la consulta de índices es el único round trip)
         print_info("Probando conexión...")
         with engine.connect() as conn:
-            result = conn.execute(text("SELECT version()")).scalar()
+            existing_indexes = set(conn.execute(
+                text("SELECT indexname FROM pg_indexes WHERE indexname = ANY(:names)"),
+                {"names": list(EXPECTED_INDEXES)},
+            ).scalars())
             
         print_success(f"✅ Conexión exitosa a {db_name}")
-        print(f"\n{Colors.BOLD}Detalles de conexión:{Colors.END}")
-        print(f"  • Base de datos: {db_name}")
-        print(f"  • Host: {db_host}")
-        print(f"  • Puerto: {db_port}")
-        print(f"  • Database: {db_database}")
-        print(f"  • Usuario: {db_user}")
-        print(f"  • Estado: {Colors.GREEN}Conectado ✓{Colors.END}\n")
+        for index_name, migration in EXPECTED_INDEXES.items():
+            if index_name not in existing_indexes:
+                print_warning(f"Falta el índice {index_name}: las verificaciones hacen seq scan sobre matches")
+                print_info(f"Aplicar {migration} (psql)")
+        _emit([
+            f"\n{Colors.BOLD}Detalles de conexión:{Colors.END}",
+            f"  • Base de datos: {db_name}",
+            f"  • Host: {db_host}",
+            f"  • Puerto: {db_port}",
+            f"  • Database: {db_database}",
+            f"  • Usuario: {db_user}",
+            f"  • Estado: {Colors.GREEN}Conectado ✓{Colors.END}\n",
+        ])
         
         return db_name, env_file
         
     except Exception as e:
         print_error(f"Error al conectar a {db_name}")
-        print(f"\n{Colors.RED}Detalles del error:{Colors.END}")
-        print(f"  {str(e)}\n")
+        _emit([
+            f"\n{Colors.RED}Detalles del error:{Colors.END}",
+            f"  {str(e)}\n",
+        ])
         print_info("Verifica:")
-        print("  1. Las credenciales en tu archivo .env")
-        print("  2. Que el servidor de base de datos esté accesible")
-        print("  3. Que tengas conectividad de red (si es producción)")
+        _emit([
+            "  1. Las credenciales en tu archivo .env",
+            "  2. Que el servidor de base de datos esté accesible",
+            "  3. Que tengas conectividad de red (si es producción)",
+        ])
         sys.exit(1)
 
 
@@ -178,9 +243,9 @@ def select_database():
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 def print_step(msg: str):
-    print(f"\n{Colors.CYAN}{'='*70}{Colors.END}")
+    print(f"\n{SEP_CYAN}")
     print(f"{Colors.BOLD}{msg}{Colors.END}")
-    print(f"{Colors.CYAN}{'='*70}{Colors.END}")
+    print(SEP_CYAN)
 
 def print_success(msg: str):
     print(f"{Colors.GREEN}✅ {msg}{Colors.END}")
@@ -194,130 +259,127 @@ def print_error(msg: str):
 def print_info(msg: str):
     print(f"{Colors.BLUE}ℹ️  {msg}{Colors.END}")
 
+def _emit(lines: List[str]):
+    """Imprime un bloque de varias líneas con una sola escritura a stdout"""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def _run_module(env_file: str, module: str, *args) -> bool:
+    """Ejecuta `python -m module args` contra la BD de env_file; True si terminó bien"""
+    argv = module_argv(module, *args)
+    print(f"\n{Colors.CYAN}🔄 Ejecutando: {shlex.join(argv)}{Colors.END}")
+    print_info(f"Usando configuración: {env_file}")
+    return subprocess.run(argv, env=subprocess_env(env_file)).returncode == 0
+
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-# FUNCIONES DE VERIFICACIÓN (ORIGINALES SIN CAMBIOS)
+# FUNCIONES DE VERIFICACIÓN
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-def check_matches_without_results(season_id: int, date_from: str, date_to: str) -> Tuple[int, list]:
-    """Verifica partidos sin resultados en el rango de fechas"""
-    query = text("""
-        SELECT id, date, home_team_id, away_team_id
+_Q_PREFLIGHT = text("""
+    WITH rng AS MATERIALIZED (
+        SELECT id, date,
+               home_goals IS NULL AND away_goals IS NULL AS pending,
+               home_goals IS NOT NULL AND away_goals IS NOT NULL AS finished
         FROM matches
         WHERE season_id = :sid
           AND date BETWEEN :dfrom AND :dto
-          AND home_goals IS NULL
-          AND away_goals IS NULL
-        ORDER BY date
-    """)
-    
-    with engine.begin() as conn:
-        rows = conn.execute(query, {"sid": season_id, "dfrom": date_from, "dto": date_to}).fetchall()
-        return len(rows), rows
-
-def check_matches_with_results(season_id: int, date_from: str, date_to: str) -> Tuple[int, list]:
-    """Verifica partidos CON resultados en el rango de fechas"""
-    query = text("""
-        SELECT id, date, home_team_id, away_team_id, home_goals, away_goals
-        FROM matches
-        WHERE season_id = :sid
-          AND date BETWEEN :dfrom AND :dto
-          AND home_goals IS NOT NULL
-          AND away_goals IS NOT NULL
-        ORDER BY date
-    """)
-    
-    with engine.begin() as conn:
-        rows = conn.execute(query, {"sid": season_id, "dfrom": date_from, "dto": date_to}).fetchall()
-        return len(rows), rows
-
-def check_predictions_exist(match_ids: list) -> dict:
-    """Verifica si ya existen predicciones para los partidos"""
-    if not match_ids:
-        return {"poisson": 0, "weinston": 0}
-    
-    query = text("""
-        SELECT 
-            COUNT(*) FILTER (WHERE EXISTS (
-                SELECT 1 FROM poisson_predictions WHERE match_id = m.id
-            )) as poisson_count,
-            COUNT(*) FILTER (WHERE EXISTS (
-                SELECT 1 FROM weinston_predictions WHERE match_id = m.id
-            )) as weinston_count
-        FROM matches m
-        WHERE m.id = ANY(:ids)
-    """)
-    
-    with engine.begin() as conn:
-        row = conn.execute(query, {"ids": match_ids}).fetchone()
-        return {"poisson": row.poisson_count, "weinston": row.weinston_count}
-
-def check_weinston_params(season_id: int) -> Optional[dict]:
-    """Verifica si existen parámetros de Weinston para la temporada"""
-    query = text("""
-        SELECT mu_home, mu_away, home_adv, loss, updated_at
-        FROM weinston_params
-        WHERE season_id = :sid
-    """)
-    
-    with engine.begin() as conn:
-        row = conn.execute(query, {"sid": season_id}).fetchone()
-        if row:
-            return {
-                "mu_home": float(row.mu_home),
-                "mu_away": float(row.mu_away),
-                "home_adv": float(row.home_adv),
-                "loss": float(row.loss),
-                "updated_at": row.updated_at
-            }
-        return None
-
-def check_evaluated_matches(season_id: int, date_from: str, date_to: str) -> dict:
-    """Verifica cuántos partidos ya fueron evaluados"""
-    query = text("""
+    )
+    SELECT
+        (SELECT array_agg(id ORDER BY date) FROM rng WHERE pending) AS pending_ids,
+        (SELECT COUNT(*) FROM rng WHERE finished) AS finished,
+        (SELECT COUNT(*) FROM rng r WHERE r.pending AND EXISTS (
+            SELECT 1 FROM poisson_predictions WHERE match_id = r.id
+        )) AS poisson_count,
+        (SELECT COUNT(*) FROM rng r WHERE r.pending AND EXISTS (
+            SELECT 1 FROM weinston_predictions WHERE match_id = r.id
+        )) AS weinston_count,
+        ev.poisson_evaluated,
+        ev.weinston_evaluated,
+        wp.mu_home, wp.mu_away, wp.home_adv, wp.loss, wp.updated_at
+    FROM (
         SELECT 
             COUNT(DISTINCT po.match_id) FILTER (WHERE po.model = 'poisson') as poisson_evaluated,
             COUNT(DISTINCT po.match_id) FILTER (WHERE po.model = 'weinston') as weinston_evaluated
         FROM prediction_outcomes po
-        JOIN matches m ON m.id = po.match_id
-        WHERE m.season_id = :sid
-          AND m.date BETWEEN :dfrom AND :dto
-    """)
-    
-    with engine.begin() as conn:
-        row = conn.execute(query, {"sid": season_id, "dfrom": date_from, "dto": date_to}).fetchone()
-        return {
-            "poisson": row.poisson_evaluated or 0,
-            "weinston": row.weinston_evaluated or 0
+        JOIN rng ON rng.id = po.match_id
+    ) ev
+    LEFT JOIN weinston_params wp ON wp.season_id = :sid
+""")
+
+def preflight(conn: Connection, season_id: int, date_from: str, date_to: str) -> dict:
+    """
+    Todas las verificaciones de mode_predict / mode_evaluate en una sola query
+    (un round trip por liga en vez de una query por verificación).
+    Solo lee: basta una conexión de engine.connect().
+    
+    Returns:
+        dict con:
+        - pending_ids: ids de partidos sin resultado, ordenados por fecha
+        - finished: nº de partidos con resultado
+        - predictions: {"poisson", "weinston"} predicciones de los pendientes
+        - evaluated: {"poisson", "weinston"} partidos ya evaluados
+        - weinston_params: mu_home, mu_away, home_adv, loss, updated_at
+          de weinston_params (None si no hay)
+    """
+    
+    row = conn.execute(_Q_PREFLIGHT, {"sid": season_id, "dfrom": date_from, "dto": date_to}).fetchone()
+    
+    params = None
+    if row.mu_home is not None:
+        params = {
+            "mu_home": float(row.mu_home),
+            "mu_away": float(row.mu_away),
+            "home_adv": float(row.home_adv),
+            "loss": float(row.loss),
+            "updated_at": row.updated_at
         }
+    return {
+        "pending_ids": row.pending_ids or [],
+        "finished": row.finished,
+        "predictions": {"poisson": row.poisson_count, "weinston": row.weinston_count},
+        "evaluated": {"poisson": row.poisson_evaluated or 0, "weinston": row.weinston_evaluated or 0},
+        "weinston_params": params,
+    }
 
 def check_fixtures_file(filepath: str) -> bool:
     """Verifica si el archivo de fixtures existe"""
-    import os
     if not os.path.exists(filepath):
         print_error(f"Archivo no encontrado: {filepath}")
         return False
     print_success(f"Archivo encontrado: {filepath}")
     return True
 
+def _fast_count_lines(filepath: str) -> int:
+    """Cuenta las líneas del archivo en bloques de 1 MiB, sin parsear el CSV"""
+    lines = 0
+    last = b"\n"
+    with open(filepath, 'rb') as f:
+        for buf in iter(lambda: f.read(1 << 20), b''):
+            lines += buf.count(b"\n")
+            last = buf[-1:]
+    # Última línea sin salto final
+    return lines + (last != b"\n")
+
 def preview_csv_fixtures(filepath: str, max_rows: int = 5):
     """Muestra preview del CSV de fixtures"""
-    import csv
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
             reader = csv.DictReader(f)
-            rows = list(reader)
+            head = list(islice(reader, max_rows))
+        # El total solo cuenta saltos de línea (los CSV de fixtures no traen
+        # campos multilínea); se descuenta el encabezado
+        total = max(_fast_count_lines(filepath) - 1, len(head))
             
-        print(f"\n📋 Preview del CSV ({len(rows)} filas totales):")
-        print(f"   Columnas: {', '.join(rows[0].keys()) if rows else 'N/A'}")
-        print(f"\n   Primeras {min(max_rows, len(rows))} filas:")
-        for i, row in enumerate(rows[:max_rows], 1):
+        print(f"\n📋 Preview del CSV ({total} filas totales):")
+        print(f"   Columnas: {', '.join(reader.fieldnames) if head else 'N/A'}")
+        print(f"\n   Primeras {len(head)} filas:")
+        for i, row in enumerate(head, 1):
             date = row.get('Date', 'N/A')
             home = row.get('HomeTeam', 'N/A')
             away = row.get('AwayTeam', 'N/A')
             print(f"     {i}. {date}: {home} vs {away}")
         
-        return len(rows)
+        return total
     except Exception as e:
         print_error(f"Error al leer CSV: {e}")
         return 0
@@ -362,25 +424,16 @@ def mode_load_fixtures(league_config: LeagueConfig, env_file: str):
     # 5. Ejecutar ingest usando subprocess (como el original)
     print_info(f"Cargando fixtures para {league_config.league_name}...")
     
-    # Crear entorno con ENV_FILE
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-    
-    cmd = (
-        f"python -m src.fixtures.cli bulk {filepath} "
-        f"--season-id {league_config.season_id} "
-        f"--league \"{league_config.league_name}\""
-    )
+    args = [
+        "bulk", filepath,
+        "--season-id", league_config.season_id,
+        "--league", league_config.league_name,
+    ]
     
     if league_config.dayfirst:
-        cmd += " --dayfirst"
-    
-    print(f"\n{Colors.CYAN}🔄 Ejecutando: {cmd}{Colors.END}")
-    print_info(f"Usando configuración: {env_file}")
+        args.append("--dayfirst")
     
-    result = subprocess.run(cmd, shell=True, env=env)
-    
-    if result.returncode == 0:
+    if _run_module(env_file, "src.fixtures.cli", *args):
         print_success(f"Fixtures cargados exitosamente para {league_config.league_name}")
         return True
     else:
@@ -394,8 +447,13 @@ def mode_predict(league_config: LeagueConfig, date_from: str, date_to: str):
     
     season_id = league_config.season_id
     
+    # Verificaciones previas en un solo round trip
+    with engine.connect() as conn:
+        pre = preflight(conn, season_id, date_from, date_to)
+    
     # 1. Verificar partidos sin resultados
-    count, rows = check_matches_without_results(season_id, date_from, date_to)
+    match_ids = pre["pending_ids"]
+    count = len(match_ids)
     
     if count == 0:
         print_warning(f"No hay partidos sin resultados para {league_config.league_name}")
@@ -404,7 +462,7 @@ def mode_predict(league_config: LeagueConfig, date_from: str, date_to: str):
     print_success(f"Hay {count} partidos sin resultados")
     
     # 2. Verificar parámetros de Weinston
-    params = check_weinston_params(season_id)
+    params = pre["weinston_params"]
     
     if not params:
         print_error("No existen parámetros de Weinston para esta temporada")
@@ -414,8 +472,7 @@ def mode_predict(league_config: LeagueConfig, date_from: str, date_to: str):
     print_success(f"Parámetros de Weinston encontrados (última actualización: {params['updated_at']})")
     
     # 3. Verificar predicciones existentes
-    match_ids = [row.id for row in rows]
-    existing = check_predictions_exist(match_ids)
+    existing = pre["predictions"]
     
     if existing["poisson"] > 0 or existing["weinston"] > 0:
         print_info(f"Predicciones existentes:")
@@ -427,7 +484,10 @@ def mode_predict(league_config: LeagueConfig, date_from: str, date_to: str):
         if response.lower() != 's':
             return False
     
-    # 4. Cargar contexto de liga y generar predicciones (LÓGICA ORIGINAL)
+    # 4. Fortalezas recientes al día (las vistas fijan CURRENT_DATE al refrescarse)
+    refresh_prediction_inputs(engine)
+    
+    # 5. Cargar contexto de liga y generar predicciones (LÓGICA ORIGINAL)
     try:
         with engine.begin() as conn:
             league_ctx = LeagueContext.from_season(conn, season_id)
@@ -449,7 +509,6 @@ def mode_predict(league_config: LeagueConfig, date_from: str, date_to: str):
         
     except Exception as e:
         print_error(f"Error al generar predicciones: {e}")
-        import traceback
         traceback.print_exc()
         return False
 
@@ -483,31 +542,40 @@ def mode_load_results(league_config: LeagueConfig, env_file: str):
     if response.lower() != 's':
         return False
     
-    # 5. Ejecutar carga usando subprocess (COMO EL ORIGINAL)
-    import subprocess
-    import os
-    
-    # Crear entorno con ENV_FILE
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-    
-    cmd = (
-        f"python -m src.ingest.load_unified {filepath} "
-        f"--league \"{league_config.league_name}\" "
-        f"--div {league_config.csv_code} "
-        f"--season-id {league_config.season_id} "
-    )
-    
-    if league_config.dayfirst:
-        cmd += "--dayfirst"
-    
-    print(f"\n{Colors.CYAN}🔄 Ejecutando: {cmd}{Colors.END}")
-    print_info(f"Usando configuración: {env_file}")
-    
-    result = subprocess.run(cmd, shell=True, env=env)
-    
-    if result.returncode == 0:
+    # 5. Ejecutar carga
+    if ISOLATE:
+        args = [
+            filepath,
+            "--league", league_config.league_name,
+            "--div", league_config.csv_code,
+            "--season-id", league_config.season_id,
+        ]
+        
+        if league_config.dayfirst:
+            args.append("--dayfirst")
+        
+        ok = _run_module(env_file, "src.ingest.load_unified", *args)
+    else:
+        # Mismo proceso y mismo engine (ya apunta a la BD seleccionada)
+        print_info(f"Usando configuración: {env_file}")
+        try:
+            with engine.begin() as conn:
+                load_csv(
+                    conn, filepath,
+                    league=league_config.league_name,
+                    div=league_config.csv_code,
+                    season_id=league_config.season_id,
+                    dayfirst=league_config.dayfirst,
+                )
+            ok = True
+        except Exception as e:
+            print_error(f"Error al cargar resultados: {e}")
+            ok = False
+    
+    if ok:
         print_success(f"Resultados cargados para {league_config.league_name}")
+        # Resultados ya confirmados: las vistas de fortalezas los incorporan
+        refresh_prediction_inputs(engine)
         return True
     else:
         print_error("Error al cargar resultados")
@@ -520,8 +588,12 @@ def mode_evaluate(league_config: LeagueConfig, date_from: str, date_to: str, env
     
     season_id = league_config.season_id
     
+    # Verificaciones previas en un solo round trip
+    with engine.connect() as conn:
+        pre = preflight(conn, season_id, date_from, date_to)
+    
     # 1. Verificar partidos con resultados
-    count, matches = check_matches_with_results(season_id, date_from, date_to)
+    count = pre["finished"]
     
     if count == 0:
         print_warning(f"No hay partidos con resultados para {league_config.league_name}")
@@ -530,7 +602,7 @@ def mode_evaluate(league_config: LeagueConfig, date_from: str, date_to: str, env
     print_success(f"Hay {count} partidos con resultados")
     
     # 2. Verificar evaluaciones previas
-    evaluated = check_evaluated_matches(season_id, date_from, date_to)
+    evaluated = pre["evaluated"]
     
     if evaluated["poisson"] > 0 or evaluated["weinston"] > 0:
         print_info(f"Predicciones ya evaluadas:")
@@ -544,26 +616,12 @@ def mode_evaluate(league_config: LeagueConfig, date_from: str, date_to: str, env
         return False
     
     # 4. Ejecutar evaluación usando subprocess (COMO EL ORIGINAL)
-    # IMPORTANTE: Establecer ENV_FILE para que el subprocess use la BD correcta
-    import subprocess
-    
-    # Crear entorno con la variable ENV_FILE
-    import os
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-    
-    cmd = (
-        f"python -m src.predictions.cli evaluate "
-        f"--season-id {season_id} "
-        f"--from {date_from} --to {date_to}"
-    )
-    
-    print(f"\n{Colors.CYAN}🔄 Ejecutando: {cmd}{Colors.END}")
-    print_info(f"Usando configuración: {env_file}")
-    
-    result = subprocess.run(cmd, shell=True, env=env)
-    
-    if result.returncode == 0:
+    # IMPORTANTE: ENV_FILE (subprocess_env) para que el subprocess use la BD correcta
+    if _run_module(
+        env_file, "src.predictions.cli", "evaluate",
+        "--season-id", season_id,
+        "--from", date_from, "--to", date_to,
+    ):
         print_success(f"Evaluación completada para {league_config.league_name}")
         return True
     else:
@@ -571,6 +629,14 @@ def mode_evaluate(league_config: LeagueConfig, date_from: str, date_to: str, env
         return False
 
 
+_Q_FINISHED_COUNT = text("""
+    SELECT COUNT(*) as total
+    FROM matches
+    WHERE season_id = :sid
+      AND home_goals IS NOT NULL
+      AND away_goals IS NOT NULL
+""")
+
 def mode_retrain(league_config: LeagueConfig, env_file: str):
     """Modo: Re-entrenar modelo Weinston para una liga"""
     print_step(f"🔄 MODO: RE-ENTRENAR WEINSTON - {league_config.league_name}")
@@ -578,16 +644,8 @@ def mode_retrain(league_config: LeagueConfig, env_file: str):
     season_id = league_config.season_id
     
     # 1. Verificar partidos terminados
-    query = text("""
-        SELECT COUNT(*) as total
-        FROM matches
-        WHERE season_id = :sid
-          AND home_goals IS NOT NULL
-          AND away_goals IS NOT NULL
-    """)
-    
-    with engine.begin() as conn:
-        row = conn.execute(query, {"sid": season_id}).fetchone()
+    with engine.connect() as conn:
+        row = conn.execute(_Q_FINISHED_COUNT, {"sid": season_id}).fetchone()
         total_matches = row.total
     
     if total_matches < 10:
@@ -605,21 +663,9 @@ def mode_retrain(league_config: LeagueConfig, env_file: str):
         return False
     
     # 3. Ejecutar entrenamiento usando subprocess (COMO EL ORIGINAL)
-    import subprocess
-    import os
-    
-    # Crear entorno con ENV_FILE
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-    
-    cmd = f"python -m src.predictions.cli fit --season-id {season_id}"
-    
-    print(f"\n{Colors.CYAN}🔄 Ejecutando: {cmd}{Colors.END}")
-    print_info(f"Usando configuración: {env_file}")
-    
-    result = subprocess.run(cmd, shell=True, env=env)
-    
-    if result.returncode == 0:
+    if _run_module(env_file, "src.predictions.cli", "fit", "--season-id", season_id):
+        # El fit corrió en otro proceso: el contexto cacheado aquí quedó viejo
+        LeagueContext.invalidate(league_config.season_id)
         print_success(f"Weinston re-entrenado para {league_config.league_name}")
         return True
     else:
@@ -631,23 +677,26 @@ def generate_betting_lines_predictions(league_config: LeagueConfig, date_from: s
     """Genera líneas de apuesta para los partidos"""
     print_info(f"Generando betting lines para {league_config.league_name}...")
     
-    import subprocess
-    import os
-    
-    # Crear entorno con ENV_FILE
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-    
-    cmd = (
-        f"python -m src.predictions.cli betting-lines "
-        f"--season-id {league_config.season_id} "
-        f"--from {date_from} --to {date_to}"
-    )
-    
     print_info(f"Usando configuración: {env_file}")
-    result = subprocess.run(cmd, shell=True, env=env)
     
-    if result.returncode == 0:
+    if ISOLATE:
+        argv = module_argv(
+            "src.predictions.cli", "betting-lines",
+            "--season-id", league_config.season_id,
+            "--from", date_from, "--to", date_to,
+        )
+        ok = subprocess.run(argv, env=subprocess_env(env_file)).returncode == 0
+    else:
+        # Mismo proceso y mismo engine (ya apunta a la BD seleccionada)
+        try:
+            with engine.begin() as conn:
+                generate_betting_lines(conn, league_config.season_id, date_from, date_to)
+            ok = True
+        except Exception as e:
+            print_error(f"Error al generar betting lines: {e}")
+            ok = False
+    
+    if ok:
         print_success(f"Betting lines generadas para {league_config.league_name}")
         return True
     return False
@@ -657,23 +706,26 @@ def validate_betting_lines_predictions(league_config: LeagueConfig, date_from: s
     """Valida líneas de apuesta contra resultados reales"""
     print_info(f"Validando betting lines para {league_config.league_name}...")
     
-    import subprocess
-    import os
-    
-    # Crear entorno con ENV_FILE
-    env = os.environ.copy()
-    env['ENV_FILE'] = env_file
-    
-    cmd = (
-        f"python -m src.predictions.cli betting-lines-validate "
-        f"--season-id {league_config.season_id} "
-        f"--from {date_from} --to {date_to}"
-    )
-    
     print_info(f"Usando configuración: {env_file}")
-    result = subprocess.run(cmd, shell=True, env=env)
     
-    if result.returncode == 0:
+    if ISOLATE:
+        argv = module_argv(
+            "src.predictions.cli", "betting-lines-validate",
+            "--season-id", league_config.season_id,
+            "--from", date_from, "--to", date_to,
+        )
+        ok = subprocess.run(argv, env=subprocess_env(env_file)).returncode == 0
+    else:
+        # Mismo proceso y mismo engine (ya apunta a la BD seleccionada)
+        try:
+            with engine.begin() as conn:
+                validate_betting_lines(conn, league_config.season_id, date_from, date_to)
+            ok = True
+        except Exception as e:
+            print_error(f"Error al validar betting lines: {e}")
+            ok = False
+    
+    if ok:
         print_success(f"Betting lines validadas para {league_config.league_name}")
         return True
     return False
@@ -688,13 +740,13 @@ def generate_best_bets(league_config: LeagueConfig, date_from: str, date_to: str
     try:
         
         # ✅ SWITCHEO SIMPLE: Por nombre exacto del archivo
+        # El archivo manda sobre el entorno del proceso
+        api_url = _load_env(env_file).get('API_URL') or os.getenv('API_URL')
         if env_file == ".env":  # LOCALHOST
-            api_url = os.getenv('API_URL', 'http://localhost:8000')  # Con default
-        else:  # PRODUCCIÓN (.env.production)
-            api_url = os.getenv('API_URL')  # Sin default, DEBE estar definida
-            if not api_url:
-                print_error(f"API_URL no encontrada en {env_file}")
-                return False
+            api_url = api_url or 'http://localhost:8000'  # Con default
+        elif not api_url:  # PRODUCCIÓN (.env.production): sin default, DEBE estar definida
+            print_error(f"API_URL no encontrada en {env_file}")
+            return False
 
         
         # ✅ PASO 4: Mostrar configuración (debug)
@@ -770,7 +822,6 @@ def generate_best_bets(league_config: LeagueConfig, date_from: str, date_to: str
         return False
     except Exception as e:
         print_error(f"Error generando best bets: {e}")
-        import traceback
         traceback.print_exc()
         return False
 
@@ -789,13 +840,13 @@ def validate_best_bets(league_config: LeagueConfig, env_file: str):
     try:
 
         # ✅ SWITCHEO SIMPLE: Por nombre exacto del archivo
+        # El archivo manda sobre el entorno del proceso
+        api_url = _load_env(env_file).get('API_URL') or os.getenv('API_URL')
         if env_file == ".env":  # LOCALHOST
-            api_url = os.getenv('API_URL', 'http://localhost:8000')  # Con default
-        else:  # PRODUCCIÓN (.env.production)
-            api_url = os.getenv('API_URL')  # Sin default, DEBE estar definida
-            if not api_url:
-                print_error(f"API_URL no encontrada en {env_file}")
-                return False
+            api_url = api_url or 'http://localhost:8000'  # Con default
+        elif not api_url:  # PRODUCCIÓN (.env.production): sin default, DEBE estar definida
+            print_error(f"API_URL no encontrada en {env_file}")
+            return False
         
         # Llamar al endpoint de validación
         endpoint = f"{api_url}/api/best-bets/validate"
@@ -836,6 +887,61 @@ def validate_best_bets(league_config: LeagueConfig, env_file: str):
 # FUNCIÓN PRINCIPAL
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
+def flow_complete(league_config: LeagueConfig, date_from: str, date_to: str, env_file: str) -> bool:
+    """Flujo COMPLETE: nueva jornada"""
+    print_info("Flujo: FIXTURES → RETRAIN → PREDICT → BETTING LINES → BEST BETS")
+    
+    if mode_load_fixtures(league_config, env_file):
+        if mode_retrain(league_config, env_file):
+            if mode_predict(league_config, date_from, date_to):
+                if generate_betting_lines_predictions(league_config, date_from, date_to, env_file):
+                    generate_best_bets(league_config, date_from, date_to, env_file, top_n=4)
+                    return True
+    return False
+
+
+def flow_finish(league_config: LeagueConfig, date_from: str, date_to: str, env_file: str) -> bool:
+    """Flujo FINISH: post-partidos"""
+    print_info("Flujo: RESULTS → EVALUATE → VALIDATE BETTING → VALIDATE BEST BETS")
+    
+    if mode_load_results(league_config, env_file):
+        if mode_evaluate(league_config, date_from, date_to, env_file):
+            if validate_betting_lines_predictions(league_config, date_from, date_to, env_file):
+                validate_best_bets(league_config, env_file)
+                return True
+    return False
+
+
+@dataclass(frozen=True, slots=True)
+class ModeSpec:
+    """Opción del menú: todas se ejecutan como run(league_config, date_from, date_to, env_file)"""
+    label: str
+    name: str
+    needs_dates: bool
+    run: Callable[[LeagueConfig, Optional[str], Optional[str], str], bool]
+
+
+MODES = {
+    "1": ModeSpec("📥 FIXTURES - Cargar nuevos partidos desde CSV", "CARGAR FIXTURES", False,
+                  lambda lc, df, dt, ef: mode_load_fixtures(lc, ef)),
+    "2": ModeSpec("🎯 PREDICT  - Generar predicciones para partidos sin resultados", "GENERAR PREDICCIONES", True,
+                  lambda lc, df, dt, ef: mode_predict(lc, df, dt)),
+    "3": ModeSpec("📥 RESULTS  - Cargar resultados de partidos terminados", "CARGAR RESULTADOS", False,
+                  lambda lc, df, dt, ef: mode_load_results(lc, ef)),
+    "4": ModeSpec("📊 EVALUATE - Evaluar predicciones vs resultados reales", "EVALUAR PREDICCIONES", True,
+                  mode_evaluate),
+    "5": ModeSpec("🔄 RETRAIN  - Re-entrenar modelo Weinston", "RE-ENTRENAR WEINSTON", False,
+                  lambda lc, df, dt, ef: mode_retrain(lc, ef)),
+    "6": ModeSpec("🚀 COMPLETE - Flujo completo nueva jornada", "FLUJO COMPLETO PRE-PARTIDOS", True,
+                  flow_complete),
+    "7": ModeSpec("📊 FINISH   - Flujo completo post-partidos", "FLUJO COMPLETO POST-PARTIDOS", True,
+                  flow_finish),
+    # Sin rango de fechas: el endpoint analiza todos los partidos pendientes
+    "8": ModeSpec("🎯 BEST BETS - Generar mejores apuestas", "GENERAR MEJORES APUESTAS", False,
+                  lambda lc, df, dt, ef: generate_best_bets(lc, df, dt, ef, top_n=4)),
+}
+
+
 def main():
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     # PASO 1: Seleccionar Base de Datos (NUEVO)
@@ -847,7 +953,7 @@ def main():
     # PASO 2: Seleccionar Liga(s) (ORIGINAL)
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     
-    with engine.begin() as conn:
+    with engine.connect() as conn:
         manager = LeagueManager(conn)
         selected_leagues = manager.select_leagues("Selecciona liga(s) a procesar")
         
@@ -859,59 +965,50 @@ def main():
     # RESTO DEL CÓDIGO ORIGINAL SIN CAMBIOS
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     
-    print("\n📋 Selecciona el modo de operación:\n")
-    print("  1. 📥 FIXTURES - Cargar nuevos partidos desde CSV")
-    print("  2. 🎯 PREDICT  - Generar predicciones para partidos sin resultados")
-    print("  3. 📥 RESULTS  - Cargar resultados de partidos terminados")
-    print("  4. 📊 EVALUATE - Evaluar predicciones vs resultados reales")
-    print("  5. 🔄 RETRAIN  - Re-entrenar modelo Weinston")
-    print("  6. 🚀 COMPLETE - Flujo completo nueva jornada")
-    print("  7. 📊 FINISH   - Flujo completo post-partidos")
-    print("  8. 🎯 BEST BETS - Generar mejores apuestas")
-    print("  0. ❌ SALIR\n")
+    _emit(
+        ["\n📋 Selecciona el modo de operación:\n"]
+        + [f"  {key}. {spec.label}" for key, spec in MODES.items()]
+        + ["  0. ❌ SALIR\n"]
+    )
     
-    choice = input(f"{Colors.GREEN}Selecciona una opción (0-7): {Colors.END}")
+    choice = input(f"{Colors.GREEN}Selecciona una opción (0-{len(MODES)}): {Colors.END}")
     
     if choice == "0":
         print_info("Saliendo...")
         return
     
+    spec = MODES.get(choice)
+    if spec is None:
+        print_error("Opción inválida")
+        return
+    
     # Solicitar fechas
     date_from = None
     date_to = None
     
-    if choice in ["2", "4", "6", "7"]:
+    if spec.needs_dates:
         print(f"\n{Colors.BOLD}Rango de fechas:{Colors.END}")
         date_from = input("  Desde (YYYY-MM-DD): ").strip()
         date_to = input("  Hasta (YYYY-MM-DD): ").strip()
         
         try:
-            datetime.strptime(date_from, "%Y-%m-%d")
-            datetime.strptime(date_to, "%Y-%m-%d")
+            date.fromisoformat(date_from)
+            date.fromisoformat(date_to)
         except ValueError:
             print_error("Formato de fecha inválido")
             return
     
     # Confirmar operación
-    mode_names = {
-        "1": "CARGAR FIXTURES",
-        "2": "GENERAR PREDICCIONES",
-        "3": "CARGAR RESULTADOS",
-        "4": "EVALUAR PREDICCIONES",
-        "5": "RE-ENTRENAR WEINSTON",
-        "6": "FLUJO COMPLETO PRE-PARTIDOS",
-        "7": "FLUJO COMPLETO POST-PARTIDOS",
-        "8": "GENERAR MEJORES APUESTAS"
-    }
+    operation_name = spec.name
     
-    operation_name = mode_names.get(choice, "OPERACIÓN")
-    
-    print(f"\n{Colors.YELLOW}{'─'*70}{Colors.END}")
-    print(f"{Colors.BOLD}Confirmar operación:{Colors.END}")
-    print(f"  • Base de datos: {db_name}")
-    print(f"  • Operación: {operation_name}")
-    print(f"  • Ligas: {', '.join([lc.league_name for lc in selected_leagues])}")
-    print(f"{Colors.YELLOW}{'─'*70}{Colors.END}\n")
+    _emit([
+        f"\n{Colors.YELLOW}{'─'*70}{Colors.END}",
+        f"{Colors.BOLD}Confirmar operación:{Colors.END}",
+        f"  • Base de datos: {db_name}",
+        f"  • Operación: {operation_name}",
+        f"  • Ligas: {', '.join([lc.league_name for lc in selected_leagues])}",
+        f"{Colors.YELLOW}{'─'*70}{Colors.END}\n",
+    ])
     
     response = input(f"{Colors.GREEN}¿Continuar? (s/n): {Colors.END}")
     
@@ -927,62 +1024,8 @@ def main():
         for idx, league_config in enumerate(selected_leagues, 1):
             print_league_header(league_config, idx, len(selected_leagues))
             
-            success = False
-            
             try:
-                if choice == "1":
-                    success = mode_load_fixtures(league_config, env_file)
-                
-                elif choice == "2":
-                    success = mode_predict(league_config, date_from, date_to)
-                
-                elif choice == "3":
-                    success = mode_load_results(league_config, env_file)
-                
-                elif choice == "4":
-                    success = mode_evaluate(league_config, date_from, date_to, env_file)
-                
-                elif choice == "5":
-                    success = mode_retrain(league_config, env_file)
-                
-                elif choice == "6":
-                    # Flujo COMPLETE
-                    print_info("Flujo: FIXTURES → RETRAIN → PREDICT → BETTING LINES → BEST BETS")
-                    
-                    if mode_load_fixtures(league_config, env_file):
-                        if mode_retrain(league_config, env_file):
-                            if mode_predict(league_config, date_from, date_to):
-                                if generate_betting_lines_predictions(league_config, date_from, date_to, env_file):
-                                    generate_best_bets(league_config, date_from, date_to, env_file, top_n=4)
-                                    success = True
-                
-                elif choice == "7":
-                    # Flujo FINISH
-                    print_info("Flujo: RESULTS → EVALUATE → VALIDATE BETTING → VALIDATE BEST BETS")
-                    
-                    if mode_load_results(league_config, env_file):
-                        if mode_evaluate(league_config, date_from, date_to, env_file):
-                            if validate_betting_lines_predictions(league_config, date_from, date_to, env_file):
-                                validate_best_bets(league_config, env_file)
-                                success = True
-
-                elif choice == "8":
-                    # Solo best bets
-                    print_info("Generando Best Bets para todas las ligas...")
-                    
-                    # Generar para cada liga seleccionada
-                    for league_config in selected_leagues:
-                        print(f"\n{Colors.BOLD}{league_config.league_name}{Colors.END}")
-                        if generate_best_bets(league_config, date_from, date_to, env_file, top_n=4):
-                            print_success(f"✓ {league_config.league_name}")
-                            success = True
-                        else:
-                            print_warning(f"⚠️  {league_config.league_name}")
-                            success = False
-                
-                else:
-                    print_error("Opción inválida")
-                    return
+                success = spec.run(league_config, date_from, date_to, env_file)
                 
                 if success:
                     print_success(f"✓ {league_config.league_name} completada exitosamente")
@@ -997,19 +1040,19 @@ def main():
                 continue
         
         # Resumen final
-        print(f"\n{Colors.BOLD}{Colors.CYAN}{'='*70}{Colors.END}")
-        print(f"{Colors.BOLD}  RESUMEN DE OPERACIÓN{Colors.END}")
-        print(f"{Colors.CYAN}{'='*70}{Colors.END}\n")
-        
-        print(f"  Base de datos: {Colors.BOLD}{db_name}{Colors.END}")
-        print(f"  Ligas procesadas: {success_count}/{len(selected_leagues)}")
+        _emit([
+            f"\n{Colors.BOLD}{Colors.CYAN}{'='*70}{Colors.END}",
+            f"{Colors.BOLD}  RESUMEN DE OPERACIÓN{Colors.END}",
+            f"{SEP_CYAN}\n",
+            f"  Base de datos: {Colors.BOLD}{db_name}{Colors.END}",
+            f"  Ligas procesadas: {success_count}/{len(selected_leagues)}",
+        ])
         
         if success_count == len(selected_leagues):
             print_success("✅ Todas las ligas se procesaron exitosamente")
         elif success_count > 0:
             print_warning(f"⚠️  {len(failed_leagues)} liga(s) tuvieron problemas:")
-            for league_name in failed_leagues:
-                print(f"     • {league_name}")
+            _emit([f"     • {league_name}" for league_name in failed_leagues])
         else:
             print_error("❌ No se pudo procesar ninguna liga")
         
@@ -1019,7 +1062,6 @@ def main():
         print(f"\n\n{Colors.YELLOW}Operación cancelada por el usuario{Colors.END}")
     except Exception as e:
         print_error(f"Error inesperado: {e}")
-        import traceback
         traceback.print_exc()
 
 
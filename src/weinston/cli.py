@@ -1,9 +1,12 @@
+import numpy as np
 import typer
+from psycopg2.extras import execute_values
 from sqlalchemy import text
 from src.db import SessionLocal
-from scipy.stats import poisson
+from src.poisson.compute import score_probs_batch
 from decimal import Decimal
 from src.models import Match
+from src.predictions.league_context import LeagueContext
 
 app = typer.Typer(help="Weinston → weinston_predictions")
 
@@ -16,40 +19,7 @@ def _f(x):
 
 def probs(lh: float, la: float, maxg: int = 10):
     """Devuelve: ph, pd, pa, over, under, yes_btts, no_btts"""
-    ph = pd = pa = 0.0
-    over = under = 0.0
-    yy = nn = 0.0
-
-    lh = float(lh)
-    la = float(la)
-
-    for hg in range(0, maxg + 1):
-        phg = poisson.pmf(hg, lh)
-        for ag in range(0, maxg + 1):
-            pag = poisson.pmf(ag, la)
-            p = float(phg * pag)
-
-            # 1X2
-            if hg > ag:
-                ph += p
-            elif hg == ag:
-                pd += p
-            else:
-                pa += p
-
-            # Over/Under 2.5
-            if hg + ag > 2:
-                over += p
-            else:
-                under += p
-
-            # BTTS
-            if hg > 0 and ag > 0:
-                yy += p
-            else:
-                nn += p
-
-    return ph, pd, pa, over, under, yy, nn
+    return tuple(score_probs_batch([float(lh)], [float(la)], maxg)[0].tolist())
 
 def _team_baselines(s, season_id: int):
     Q = """
@@ -104,8 +74,53 @@ def fit(season_id: int):
            values (:sid,:mh,:ma,:ha,:loss)
         """), {"sid":season_id,"mh":fr.mu_home,"ma":fr.mu_away,"ha":fr.home_adv,"loss":fr.loss})
         s.commit()
+        LeagueContext.invalidate(season_id)
         typer.echo(f"OK fit season={season_id} loss={fr.loss:.2f}")
 
+# UPSERT de backfill con psycopg2.extras.execute_values: un INSERT
+# multi-VALUES por página en vez de una sentencia por partido
+_UPSERT_WEINSTON_PREDICTION = """
+    insert into weinston_predictions (
+        match_id, local_goals, away_goals, error, result_1x2, over_2, both_score,
+        shots_home, shots_away, shots_target_home, shots_target_away,
+        fouls_home, fouls_away, cards_home, cards_away,
+        corners_home, corners_away, win_corners
+    )
+    values %s
+    on conflict (match_id) do update set
+        local_goals=excluded.local_goals,
+        away_goals=excluded.away_goals,
+        error=excluded.error,
+        result_1x2=excluded.result_1x2,
+        over_2=excluded.over_2,
+        both_score=excluded.both_score,
+        shots_home=excluded.shots_home,
+        shots_away=excluded.shots_away,
+        shots_target_home=excluded.shots_target_home,
+        shots_target_away=excluded.shots_target_away,
+        fouls_home=excluded.fouls_home,
+        fouls_away=excluded.fouls_away,
+        cards_home=excluded.cards_home,
+        cards_away=excluded.cards_away,
+        corners_home=excluded.corners_home,
+        corners_away=excluded.corners_away,
+        win_corners=excluded.win_corners
+"""
+
+_UPSERT_WEINSTON_PREDICTION_TEMPLATE = """(
+    %(mid)s, %(lh)s, %(la)s, %(err)s, %(r1x2)s, %(ov2)s, %(btts)s,
+    %(sh)s, %(sa)s, %(soth)s, %(sota)s,
+    %(fh)s, %(fa)s, %(ch)s, %(ca)s,
+    %(coh)s, %(coa)s, %(wco)s
+)"""
+
+# Filas por INSERT multi-VALUES
+UPSERT_PAGE_SIZE = 500
+
+# Etiquetas 1X2 en orden (2, X, 1): argmax devuelve el primer máximo, así un
+# empate de probabilidades da la misma etiqueta que el if/else original
+_R1X2_LABELS = np.array(["2", "X", "1"])
+
 @app.command()
 def backfill(season_id: int, only_missing: bool = typer.Option(True, "--only-missing/--no-only-missing")):
     """ 
@@ -214,25 +229,25 @@ def backfill(season_id: int, only_missing: bool = typer.Option(True, "--only-mis
         if only_missing:
             q = q.filter(text("not exists (select 1 from weinston_predictions wp where wp.match_id = matches.id)"))
 
-        rows = q.all()
-        n = 0
+        # si falta algún rating, salta el partido
+        rows = [r for r in q.all() if r[1] in R and r[2] in R]
+        payload = []
 
-        for mid, ht, at, hg, ag in rows:
-            # si falta algún rating, salta el partido
-            if ht not in R or at not in R:
-                continue
+        # 5) intensidades λ (local/visita)
+        lams = [
+            (mh * R[ht]["atk_home"] * R[at]["def_away"] * ha, ma * R[at]["atk_away"] * R[ht]["def_home"])
+            for _, ht, at, _, _ in rows
+        ]
 
-            # 5) intensidades λ (local/visita)
-            lam_h = mh * R[ht]["atk_home"] * R[at]["def_away"] * ha
-            lam_a = ma * R[at]["atk_away"] * R[ht]["def_home"]
+        # 6) probabilidades con Poisson, todos los partidos en un solo cálculo
+        P = score_probs_batch([lh for lh, _ in lams], [la for _, la in lams]) if rows else np.empty((0, 7))
 
-            # 6) probabilidades con Poisson
-            ph, pd, pa, ov, un, yy, nn = probs(float(lam_h), float(lam_a))
+        # 7) etiquetas cualitativas, vectorizadas sobre todos los partidos
+        r1x2s = _R1X2_LABELS[P[:, 2::-1].argmax(axis=1)].tolist()
+        ov2s = np.where(P[:, 3] >= 0.5, "Mas de 2,5", "Menos de 2,5").tolist()
+        bttss = np.where(P[:, 5] >= 0.5, "Ambos Marcan", "No marcan ambos").tolist()
 
-            # 7) etiquetas cualitativas
-            r1x2 = "1" if (ph > pd and ph > pa) else ("X" if pd > pa else "2")
-            ov2 = "Mas de 2,5" if ov >= 0.5 else "Menos de 2,5"
-            btts = "Ambos Marcan" if yy >= 0.5 else "No marcan ambos"
+        for (mid, ht, at, hg, ag), (lam_h, lam_a), r1x2, ov2, btts in zip(rows, lams, r1x2s, ov2s, bttss):
 
             # 8) error (si hay marcador real)
             err = (
@@ -260,56 +275,26 @@ def backfill(season_id: int, only_missing: bool = typer.Option(True, "--only-mis
                 else ("away" if (coa or 0) > (coh or 0) else "tie")
             )
 
-            # 10) UPSERT en weinston_predictions
-            s.execute(
-                text(
-                    """
-                    insert into weinston_predictions (
-                        match_id, local_goals, away_goals, error, result_1x2, over_2, both_score,
-                        shots_home, shots_away, shots_target_home, shots_target_away,
-                        fouls_home, fouls_away, cards_home, cards_away,
-                        corners_home, corners_away, win_corners
-                    )
-                    values (
-                        :mid, :lh, :la, :err, :r1x2, :ov2, :btts,
-                        :sh, :sa, :soth, :sota,
-                        :fh, :fa, :ch, :ca,
-                        :coh, :coa, :wco
-                    )
-                    on conflict (match_id) do update set
-                        local_goals=excluded.local_goals,
-                        away_goals=excluded.away_goals,
-                        error=excluded.error,
-                        result_1x2=excluded.result_1x2,
-                        over_2=excluded.over_2,
-                        both_score=excluded.both_score,
-                        shots_home=excluded.shots_home,
-                        shots_away=excluded.shots_away,
-                        shots_target_home=excluded.shots_target_home,
-                        shots_target_away=excluded.shots_target_away,
-                        fouls_home=excluded.fouls_home,
-                        fouls_away=excluded.fouls_away,
-                        cards_home=excluded.cards_home,
-                        cards_away=excluded.cards_away,
-                        corners_home=excluded.corners_home,
-                        corners_away=excluded.corners_away,
-                        win_corners=excluded.win_corners
-                    """
-                ),
-                {
-                    "mid": mid,
-                    "lh": float(lam_h),
-                    "la": float(lam_a),
-                    "err": err,
-                    "r1x2": r1x2,
-                    "ov2": ov2,
-                    "btts": btts,
-                    "sh": sh, "sa": sa, "soth": soth, "sota": sota,
-                    "fh": fh, "fa": fa, "ch": ch, "ca": ca,
-                    "coh": coh, "coa": coa, "wco": wco,
-                },
-            )
-            n += 1
+            # 10) fila para el UPSERT en weinston_predictions
+            payload.append({
+                "mid": mid,
+                "lh": float(lam_h),
+                "la": float(lam_a),
+                "err": err,
+                "r1x2": r1x2,
+                "ov2": ov2,
+                "btts": btts,
+                "sh": sh, "sa": sa, "soth": soth, "sota": sota,
+                "fh": fh, "fa": fa, "ch": ch, "ca": ca,
+                "coh": coh, "coa": coa, "wco": wco,
+            })
+
+        # 11) UPSERT de todos los partidos en una sola ejecución
+        if payload:
+            with s.connection().connection.cursor() as cur:
+                execute_values(cur, _UPSERT_WEINSTON_PREDICTION, payload,
+                               template=_UPSERT_WEINSTON_PREDICTION_TEMPLATE, page_size=UPSERT_PAGE_SIZE)
+        n = len(payload)
 
         s.commit()
         typer.echo(f"OK Weinston ⇒ weinston_predictions: {n} filas")
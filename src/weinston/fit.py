@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from src.models import Match, Team
 from sqlalchemy import text
 from src.db import SessionLocal
+from src.predictions.league_context import LeagueContext
 
 @dataclass
 class FitResult:
@@ -191,5 +192,7 @@ def save_league_params(season_id: int, mu_home: float, mu_away: float, home_adv:
             "home_adv": float(home_adv),
             "loss": float(loss)
         })
+    # Los contextos cacheados de esta temporada traen los parámetros anteriores
+    LeagueContext.invalidate(int(season_id))
     
     print(f"✅ Parámetros guardados: μ_home={mu_home:.3f}, μ_away={mu_away:.3f}, HFA={home_adv:.3f}, loss={loss:.2f}")
\ No newline at end of file
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from src.predictions import evaluate as ev
+
+
+class _Cursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_upsert_sends_one_execute_values_batch(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ev, "execute_values", lambda cur, sql, rows, **k: calls.append((sql, rows, k)))
+    conn = SimpleNamespace(connection=SimpleNamespace(cursor=_Cursor))
+
+    out = pd.DataFrame({
+        "mid": np.array([1, 2]), "model": "weinston",
+        "p1x2": ["1", None], "h1x2": np.array([True, None], dtype=object),
+        "pover": ["OVER", "UNDER"], "hover": np.array([False, True]),
+        "pbtts": ["YES", "NO"], "hbtts": np.array([np.bool_(True), None], dtype=object),
+        "ae_h": [0.5, np.nan], "ae_a": [1.0, 0.0], "rmse": [0.8, np.nan],
+    })
+    assert ev._upsert(conn, out) == 2
+
+    ((sql, rows, kwargs),) = calls
+    assert sql is ev._UPSERT_OUTCOMES
+    assert kwargs == {"template": ev._UPSERT_OUTCOMES_TEMPLATE, "page_size": ev.UPSERT_PAGE_SIZE}
+    assert rows[1]["p1x2"] is None and rows[1]["ae_h"] is None and rows[1]["h1x2"] is None
+    # Solo tipos nativos: psycopg2 no adapta numpy.bool_ / numpy.int64
+    assert all(not isinstance(v, np.generic) for row in rows for v in row.values())
+
+
+def test_upsert_empty_skips_db():
+    assert ev._upsert(None, pd.DataFrame()) == 0
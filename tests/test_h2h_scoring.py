@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from src.predictions import h2h_scoring_system as h2h
+
+
+def _row(**overrides):
+    base = dict(
+        total_goals=2.8, over_goals=True,
+        total_shots=24.0, line_shots=22.5, over_shots=True,
+        total_shots_target=7.0, line_shots_ot=8.5, over_shots_ot=False,
+        total_fouls=21.0, line_fouls=20.5, over_fouls=True,
+        total_cards=3.5, line_cards=4.5, over_cards=False,
+        total_corners=10.0, line_corners=9.5, over_corners=True,
+        both_score="YES",
+    )
+    base.update(overrides)
+    return SimpleNamespace(**base)
+
+
+def test_build_predictions_labels():
+    preds = h2h._build_predictions(_row())
+    assert preds["goles"]["prediction"] == "OVER_2_5"
+    assert preds["tiros"]["prediction"] == "OVER_22.5"
+    assert preds["tiros_al_arco"]["prediction"] == "UNDER_8.5"
+    assert preds["btts"]["prediction"] == "YES"
+
+
+def test_null_stat_or_line_is_not_labelled_under():
+    # Estadística de Weinston NULL y línea de liga NULL: over_* llega NULL
+    preds = h2h._build_predictions(_row(
+        total_shots=None, over_shots=None,
+        line_corners=None, over_corners=None,
+    ))
+    assert "tiros" not in preds
+    assert "corners" not in preds
+    assert preds["faltas"]["prediction"] == "OVER_20.5"
+
+    counts = SimpleNamespace(**{col: 3 for _, *cols in h2h._SCORED_STATS for col in cols})
+    scoring = h2h._calculate_scoring_by_stat(preds, counts)
+    assert "tiros" not in scoring and "corners" not in scoring
+    assert "faltas" in scoring
@@ -0,0 +1,22 @@
+from src.predictions import league_context as lc
+
+
+class _RacingCache(dict):
+    """Simula otro worker que borra la clave justo antes que nosotros."""
+
+    def __delitem__(self, key):
+        dict.pop(self, key, None)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        dict.pop(self, key, None)
+        return dict.pop(self, key, *default)
+
+
+def test_invalidate_tolerates_concurrent_invalidation(monkeypatch):
+    cache = _RacingCache({("db", 5): (0.0, None), ("db2", 5): (0.0, None), ("db", 6): (0.0, None)})
+    monkeypatch.setattr(lc, "_CONTEXT_CACHE", cache)
+
+    lc.LeagueContext.invalidate(5)
+
+    assert list(cache) == [("db", 6)]
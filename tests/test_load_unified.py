@@ -0,0 +1,80 @@
+import io
+
+import pandas as pd
+
+from src.ingest.load_unified import MATCH_COLS, STATS_COLS, _build_stage
+
+
+def _frame(**cols):
+    df = pd.DataFrame({"Date": pd.to_datetime(["01/08/2024", "02/08/2024", "03/08/2024"], dayfirst=True), **cols})
+    # Índice no contiguo, como tras filtrar por Div / filas vacías en load_csv
+    df.index = [3, 7, 9]
+    return df
+
+
+def test_build_stage_columns_and_types():
+    df = _frame(
+        FTHG=[2.0, None, 1.0], FTAG=["1", "x", None], FTR=[" H ", None, "D"],
+        HS=[10, 12, None], AS=[8, None, None], HY=[1, None, 2], HR=[1, None, None],
+        Referee=["M Oliver", " ", None],
+    )
+    stage = _build_stage(df, [1, 2, 3], [4, 5, 6], season_id=2024)
+
+    assert list(stage.columns) == ["rn", *MATCH_COLS, *STATS_COLS]
+    assert stage["rn"].tolist() == [0, 1, 2]
+    assert stage["home_team_id"].tolist() == [1, 2, 3]
+    assert stage["season_id"].tolist() == [2024] * 3
+    assert stage["date"].astype(str).tolist() == ["2024-08-01", "2024-08-02", "2024-08-03"]
+
+    assert stage["home_goals"].tolist() == [2, pd.NA, 1]
+    assert stage["away_goals"].tolist() == [1, pd.NA, pd.NA]
+    assert stage["fulltime_result"].isna().tolist() == [False, True, False]
+    assert stage["fulltime_result"].dropna().tolist() == ["H", "D"]
+    assert stage["referee"].tolist() == ["M Oliver", "Sin arbitro", "Sin arbitro"]
+
+    # Un total se informa si viene alguno de sus sumandos
+    assert stage["total_goals"].tolist() == [3, pd.NA, 1]
+    assert stage["total_shots"].tolist() == [18, 12, pd.NA]
+    assert stage["total_cardshome"].tolist() == [2, pd.NA, 2]
+    assert stage["total_cards"].tolist() == [2, pd.NA, 2]
+    # Columnas ausentes del CSV quedan NULL
+    assert stage["home_corners"].isna().all() and stage["total_corners"].isna().all()
+
+
+def test_build_stage_copy_format():
+    # COPY recibe enteros sin ".0" y vacío para NULL
+    df = _frame(FTHG=[2.0, None, 0.0], FTAG=[1.0, 3.0, None])
+    stage = _build_stage(df, [1, 2, 3], [4, 5, 6], season_id=None)
+    buf = io.StringIO()
+    stage.to_csv(buf, index=False, header=False)
+    first, second, third = buf.getvalue().splitlines()
+
+    assert first.startswith("0,,2024-08-01,1,4,2,1,")
+    assert second.startswith("1,,2024-08-02,2,5,,3,")
+    assert third.startswith("2,,2024-08-03,3,6,0,,")
+    assert ".0," not in buf.getvalue()
+    assert "Sin arbitro" in first
+
+
+def test_build_stage_merges_repeated_match():
+    # Mismo (fecha, local, visitante) dos veces: por columna gana el último
+    # valor informado, como el upsert fila a fila que solo pisaba no nulos
+    df = _frame(
+        FTHG=[None, 1, 2], FTAG=[None, 0, 1], FTR=[None, "H", "H"],
+        HS=[None, 9, 11], AS=[6, 7, None], HC=[4, 3, None],
+    )
+    df["Date"] = pd.to_datetime(["01/08/2024", "02/08/2024", "01/08/2024"], dayfirst=True)
+    stage = _build_stage(df, [1, 2, 1], [4, 5, 4], season_id=2024)
+
+    assert list(stage.columns) == ["rn", *MATCH_COLS, *STATS_COLS]
+    assert len(stage) == 2
+    # Orden de primera aparición en el CSV
+    assert stage["rn"].tolist() == [0, 1]
+    assert stage["home_team_id"].tolist() == [1, 2]
+
+    first = stage.iloc[0]
+    assert (first["home_goals"], first["away_goals"], first["fulltime_result"]) == (2, 1, "H")
+    assert first["home_shots"] == 11
+    # Ausentes en la última fila: se conserva el valor anterior
+    assert first["away_shots"] == 6 and first["home_corners"] == 4
+    assert first["total_shots"] == 11 and first["total_corners"] == 4
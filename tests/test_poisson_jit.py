@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from scipy.stats import poisson
+
+from src.predictions import _poisson_jit as pj
+
+LH = np.array([0.0, 0.3, 1.4, 1.4, 2.75, 6.0, 0.0])
+LA = np.array([0.0, 1.1, 1.1, 1.1, 0.9, 4.5, 2.0])
+
+
+def _reference(lh, la):
+    """Misma matriz truncada (cola en el último bucket) desde scipy.stats.poisson."""
+    k = np.arange(pj._N)
+    rows = []
+    for h, a in zip(lh, la):
+        p_h, p_a = poisson.pmf(k, h), poisson.pmf(k, a)
+        p_h[-1] += poisson.sf(pj.MAX_GOALS, h)
+        p_a[-1] += poisson.sf(pj.MAX_GOALS, a)
+        m = np.outer(p_h, p_a)
+        rows.append([
+            m[pj._HOME_WIN].sum(), np.trace(m), m[pj._AWAY_WIN].sum(),
+            m[pj._OVER25].sum(), m[1:, 1:].sum(),
+        ])
+    return np.array(rows)
+
+
+def test_np_batch_matches_scipy():
+    out = pj._aggregate_probs_np_batch(LH, LA)
+    np.testing.assert_allclose(out, _reference(LH, LA), rtol=0, atol=1e-15)
+    np.testing.assert_allclose(out[:, :3].sum(axis=1), 1.0, rtol=0, atol=1e-15)
+
+
+@pytest.mark.skipif(not pj.HAVE_NUMBA, reason="numba no instalado")
+def test_loop_batch_matches_np_batch():
+    out = pj._aggregate_probs_loop_batch(LH, LA)
+    np.testing.assert_allclose(out, pj._aggregate_probs_np_batch(LH, LA), rtol=0, atol=1e-15)
+
+
+@pytest.mark.parametrize("have_numba", [
+    pytest.param(True, marks=pytest.mark.skipif(not pj.HAVE_NUMBA, reason="numba no instalado")),
+    False,
+])
+def test_aggregate_probs_batch_both_paths(monkeypatch, have_numba):
+    monkeypatch.setattr(pj, "HAVE_NUMBA", have_numba)
+    out = pj.aggregate_probs_batch(LH, LA)
+    assert out.shape == (len(LH), 5)
+    np.testing.assert_allclose(out, _reference(LH, LA), rtol=0, atol=1e-15)
+
+    # Pares repetidos (filas 2 y 3) se calculan una vez y vuelven a su posición
+    np.testing.assert_array_equal(out[2], out[3])
+    for i, (h, a) in enumerate(zip(LH, LA)):
+        np.testing.assert_allclose(out[i], pj.aggregate_probs(h, a), rtol=0, atol=1e-15)
+
+
+def test_zero_lambdas():
+    # λ = 0 en ambos: siempre 0-0
+    out = pj.aggregate_probs_batch(np.array([0.0]), np.array([0.0]))[0]
+    np.testing.assert_allclose(out, [0.0, 1.0, 0.0, 0.0, 0.0], atol=1e-15)
+    np.testing.assert_allclose(pj._aggregate_probs_np(0.0, 0.0), out, atol=1e-15)
@@ -0,0 +1,61 @@
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from src.scripts import run_update_automated as rua
+
+
+def test_parallel_leagues_do_not_interleave(monkeypatch):
+    both_started = threading.Barrier(2)
+
+    def fake_predict(engine, league_config, date_from, date_to):
+        print(f"{league_config.league_name} paso 1")
+        both_started.wait(timeout=5)  # las dos ligas escriben a la vez
+        print(f"{league_config.league_name} paso 2", file=sys.stderr)
+        print(f"{league_config.league_name} paso 3")
+        return True
+
+    monkeypatch.setattr(rua, "mode_predict_auto", fake_predict)
+    out = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", rua._LeagueBufferedStream(out))
+    monkeypatch.setattr(sys, "stderr", rua._LeagueBufferedStream(out))
+
+    args = SimpleNamespace(mode="predict", date_from="2025-01-01", date_to="2025-01-07")
+    leagues = [SimpleNamespace(league_name=name) for name in ("AAA", "BBB")]
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        results = list(ex.map(
+            lambda item: rua.run_league(None, args, item[0], 2, item[1], buffered=True),
+            enumerate(leagues, 1),
+        ))
+
+    assert results == [True, True]
+    lines = [l for l in out.getvalue().splitlines() if "paso" in l]
+    # Cada liga sale en un bloque contiguo, en orden
+    assert sorted([lines[:3], lines[3:]]) == [
+        ["AAA paso 1", "AAA paso 2", "AAA paso 3"],
+        ["BBB paso 1", "BBB paso 2", "BBB paso 3"],
+    ]
+
+
+def test_run_module_captures_subprocess_output_when_buffered(monkeypatch):
+    calls = []
+
+    def fake_run(argv, **kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(returncode=0, stdout="salida del fit\n")
+
+    monkeypatch.setattr(rua.subprocess, "run", fake_run)
+    monkeypatch.setattr(rua, "subprocess_env", lambda env_file: {})
+    monkeypatch.setattr(sys, "stdout", rua._LeagueBufferedStream(io.StringIO()))
+
+    rua._league_output.buffer = []
+    try:
+        assert rua._run_module(".env", "src.predictions.cli", "fit")
+        captured = "".join(rua._league_output.buffer)
+    finally:
+        rua._league_output.buffer = None
+
+    assert calls[0]["stdout"] is rua.subprocess.PIPE
+    assert "salida del fit" in captured
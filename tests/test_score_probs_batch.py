@@ -0,0 +1,39 @@
+import numpy as np
+from scipy.stats import poisson
+
+from src.poisson.compute import (
+    both_teams_score, outcome_probs, over_under_25, poisson_pmf_matrix, score_probs_batch,
+)
+
+
+def test_pmf_matrix_matches_scipy():
+    lmbs = [0.0, 0.4, 1.4, 3.2]
+    expected = np.array([poisson.pmf(np.arange(11), lmb) for lmb in lmbs])
+    np.testing.assert_allclose(poisson_pmf_matrix(lmbs, 10), expected, rtol=0, atol=1e-15)
+
+
+def test_score_probs_batch_matches_scipy():
+    lh, la = np.array([1.4, 0.0, 2.1, 1.4]), np.array([1.1, 0.7, 0.0, 1.1])
+    out = score_probs_batch(lh, la)
+    assert out.shape == (4, 7)
+
+    hg, ag = np.indices((11, 11))
+    for i in range(len(lh)):
+        m = np.outer(poisson.pmf(np.arange(11), lh[i]), poisson.pmf(np.arange(11), la[i]))
+        over, btts = m[hg + ag > 2].sum(), m[(hg > 0) & (ag > 0)].sum()
+        expected = [m[hg > ag].sum(), np.trace(m), m[hg < ag].sum(),
+                    over, m.sum() - over, btts, m.sum() - btts]
+        np.testing.assert_allclose(out[i], expected, rtol=0, atol=1e-15)
+
+    np.testing.assert_array_equal(out[0], out[3])
+
+
+def test_single_match_helpers_use_batch():
+    row = score_probs_batch([1.4], [1.1])[0]
+    assert outcome_probs(1.4, 1.1) == tuple(row[0:3])
+    assert over_under_25(1.4, 1.1) == tuple(row[3:5])
+    assert both_teams_score(1.4, 1.1) == tuple(row[5:7])
+
+
+def test_zero_lambdas():
+    np.testing.assert_allclose(score_probs_batch([0.0], [0.0])[0], [0, 1, 0, 0, 1, 0, 1], atol=1e-15)
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.predictions import upcoming_core as uc
+
+
+class _FakeConn:
+    """Responde la query de frescura de la vista y registra la de fortalezas."""
+
+    def __init__(self, fresh):
+        self.fresh = fresh
+        self.queries = []
+
+    def execute(self, stmt, params=None):
+        self.queries.append(stmt)
+        if stmt is uc._Q_MV_STRENGTHS_FRESH:
+            return SimpleNamespace(scalar=lambda: self.fresh)
+        row = SimpleNamespace(match_id=1, home_team_id=10, away_team_id=20,
+                              attack_home=1.2, defense_home=0.9, attack_away=1.0, defense_away=1.1)
+        return SimpleNamespace(fetchall=lambda: [row])
+
+
+LEAGUE_CTX = SimpleNamespace(league_id=1, league_name="Test",
+                             avg_home_goals=1.5, avg_away_goals=1.2, hfa=1.1)
+
+
+@pytest.mark.parametrize("fresh, expected", [
+    (True, uc._Q_FIXTURE_STRENGTHS_MV),
+    (False, uc._Q_FIXTURE_STRENGTHS_LIVE),
+])
+def test_fixture_strengths_fall_back_to_live_when_view_is_stale(fresh, expected):
+    conn = _FakeConn(fresh)
+    mids, ah, *_ = uc.load_fixture_strengths(conn, LEAGUE_CTX, [1])
+    assert conn.queries == [uc._Q_MV_STRENGTHS_FRESH, expected]
+    np.testing.assert_array_equal(mids, [1])
+    np.testing.assert_allclose(ah, [1.2])
+
+
+def test_custom_window_skips_view_check():
+    conn = _FakeConn(True)
+    uc.load_fixture_strengths(conn, LEAGUE_CTX, [1], n_recent=10)
+    assert conn.queries == [uc._Q_FIXTURE_STRENGTHS_LIVE]
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.predictions import upcoming_weinston as uw
+
+
+class _FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def mappings(self):
+        return iter(self._rows)
+
+
+class _FakeConn:
+    """Devuelve las filas dadas para la query de perfiles."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, stmt, params=None):
+        return _FakeResult(self.rows)
+
+
+LEAGUE_CTX = SimpleNamespace(league_id=1, league_name="Test", season_year="2024/25")
+
+# Fila de la query cuando ninguno de los equipos pedidos tiene historial
+MEANS_ONLY = {
+    "lg_n": 120, "lg_shots": 13.0, "lg_shots_target": 4.5, "lg_fouls": 10.5,
+    "lg_cards": 2.25, "lg_corners": 5.5,
+    "team_id": None, "location": None,
+    **{k: None for pair in uw._PROFILE_KEYS for k in pair},
+}
+
+
+def test_profiles_without_fixture_history_keep_league_means():
+    idx, profiles, league_means = uw._load_team_stat_profiles(
+        _FakeConn([MEANS_ONLY]), season_id=1, league_ctx=LEAGUE_CTX, team_ids=[10, 20]
+    )
+    assert idx == {}
+    np.testing.assert_allclose(league_means, [13.0, 4.5, 10.5, 2.25, 5.5])
+
+    # Equipos sin perfil (-1): 0.6 * media + 0.4 * media = media de liga
+    home, away = uw._exp_stats(np.array([-1]), np.array([-1]), profiles, league_means)
+    np.testing.assert_allclose(home[0], league_means)
+    np.testing.assert_allclose(away[0], league_means)
+
+
+def test_profiles_league_without_match_stats():
+    row = dict(MEANS_ONLY, lg_n=0, lg_shots=None, lg_shots_target=None,
+               lg_fouls=None, lg_cards=None, lg_corners=None)
+    idx, _, league_means = uw._load_team_stat_profiles(
+        _FakeConn([row]), season_id=1, league_ctx=LEAGUE_CTX, team_ids=[10, 20]
+    )
+    assert idx == {}
+    assert league_means is None
+
+
+def test_predict_fixture_without_history_uses_league_means(monkeypatch):
+    # Un partido entre dos equipos sin match_stats (p. ej. ascendidos)
+    monkeypatch.setattr(uw, "_load_fixture_ratings", lambda *a, **k: (
+        [(99, 10, 20)], np.array([1.0]), np.array([1.0]), np.array([1.0]), np.array([1.0])
+    ))
+    monkeypatch.setattr(uw, "_load_league_params", lambda *a, **k: (1.5, 1.2, 1.1))
+    saved = []
+    monkeypatch.setattr(uw, "execute_values", lambda cur, sql, rows, **k: saved.extend(rows))
+
+    conn = _FakeConn([MEANS_ONLY])
+
+    class _Cursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    conn.connection = SimpleNamespace(cursor=_Cursor)
+
+    uw.predict_and_upsert_weinston(conn, season_id=1, match_ids=[99], league_ctx=LEAGUE_CTX)
+
+    (row,) = saved
+    assert row["sh"] == pytest.approx(13.0) and row["sa"] == pytest.approx(13.0)
+    assert row["coh"] == pytest.approx(5.5) and row["coa"] == pytest.approx(5.5)
+    assert row["wc"] == "TIE"